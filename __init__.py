@@ -48,10 +48,14 @@ from .mod3.ui import ImportMod3
 from .tex.ui import IMPORT_PT_TexSettingPanel_1
 from .tex.ui import IMPORT_PT_TexSettingPanel_2
 from .tex.ui import ImportTex
+from .tex.ui import UpgradeTextures
+from .tex.cache_codecs import CACHE_CODEC_ITEMS
 
 from .lmt.ui import IMPORT_PT_LmtSettingPanel_1
 from .lmt.ui import ImportLmt
 
+from .common.mesh_registry import clear_mesh_registry
+
 class ColoredFormatter(logging.Formatter):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -102,6 +106,33 @@ class CustomAddonPreferences(bpy.types.AddonPreferences):
                  ('ERROR','ERROR','','',3)],
         default = 'INFO'
     )
+
+    asset_cache_size: bpy.props.IntProperty(
+        name="Asset cache size (MB)",
+        description="Memory used to keep parsed models and materials around during a map import",
+        default=1024,
+        min=0,
+    )
+
+    cache_dir: bpy.props.StringProperty(
+        name="Cache directory",
+        description="Where the index of the game files and the texture cache are stored (a folder of Blender's user data if empty). Several Blender installs can share it",
+        subtype='DIR_PATH',
+    )
+
+    texture_cache_size: bpy.props.IntProperty(
+        name="Texture cache size (MB)",
+        description="Disk space used by the texture cache, least recently used textures are deleted past it",
+        default=4096,
+        min=0,
+    )
+
+    texture_cache_codec: bpy.props.EnumProperty(
+        name="Texture cache format",
+        description="File format of the textures saved in the texture cache (float textures always use OpenEXR)",
+        items = CACHE_CODEC_ITEMS,
+        default = 'TGA'
+    )
     
     def draw(self, context):
         layout = self.layout
@@ -109,6 +140,10 @@ class CustomAddonPreferences(bpy.types.AddonPreferences):
         layout.prop(self, "game_path")
         
         layout.prop(self, "logging_level")
+        layout.prop(self, "asset_cache_size")
+        layout.prop(self, "cache_dir")
+        layout.prop(self, "texture_cache_size")
+        layout.prop(self, "texture_cache_codec")
 
 
 class WORLD_import_menu(bpy.types.Menu):
@@ -124,6 +159,8 @@ class WORLD_import_menu(bpy.types.Menu):
         self.layout.operator(ImportMod3.bl_idname, text="Model files (.mod3)", icon="MESH_DATA")
         self.layout.operator(ImportTex.bl_idname, text="Texture files (.tex)", icon="TEXTURE_DATA")
         self.layout.operator(ImportLmt.bl_idname, text="Animation files (.lmt)", icon="ANIM_DATA")
+        self.layout.separator()
+        self.layout.operator(UpgradeTextures.bl_idname, text="Upgrade textures to full resolution", icon="IMAGE_DATA")
 
 
 def WORLD_menu_func_import(self, context):
@@ -138,6 +175,7 @@ def register():
     bpy.utils.register_class(ImportMod3)
     bpy.utils.register_class(ImportTex)
     bpy.utils.register_class(ImportLmt)
+    bpy.utils.register_class(UpgradeTextures)
     bpy.utils.register_class(CustomAddonPreferences)
     bpy.utils.register_class(IMPORT_PT_BkiprSettingPanel_1)
     bpy.utils.register_class(IMPORT_PT_BkiprSettingPanel_2)
@@ -156,6 +194,7 @@ def register():
     bpy.utils.register_class(IMPORT_PT_LmtSettingPanel_1)
     bpy.utils.register_class(WORLD_import_menu)
     bpy.types.TOPBAR_MT_file_import.append(WORLD_menu_func_import)
+    bpy.app.handlers.load_post.append(clear_mesh_registry)
     pass
 
 def unregister():
@@ -167,6 +206,7 @@ def unregister():
     bpy.utils.unregister_class(ImportMod3)
     bpy.utils.unregister_class(ImportTex)
     bpy.utils.unregister_class(ImportLmt)
+    bpy.utils.unregister_class(UpgradeTextures)
     bpy.utils.unregister_class(CustomAddonPreferences)
     bpy.utils.unregister_class(IMPORT_PT_BkiprSettingPanel_1)
     bpy.utils.unregister_class(IMPORT_PT_BkiprSettingPanel_2)
@@ -185,5 +225,7 @@ def unregister():
     bpy.utils.unregister_class(IMPORT_PT_LmtSettingPanel_1)
     bpy.utils.unregister_class(WORLD_import_menu)
     bpy.types.TOPBAR_MT_file_import.remove(WORLD_menu_func_import)
+    if clear_mesh_registry in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(clear_mesh_registry)
     pass
 
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+import numpy as np
+
+import logging
+logger = logging.getLogger("mhworld_import")
+
+def estimate_size(value):
+    # Rough byte size of a parsed asset, numpy buffers dominate everything else
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, memoryview, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 64 + sum(estimate_size(item) for item in value)
+    if hasattr(value, "__slots__"):
+        return 64 + sum(estimate_size(getattr(value, slot, None)) for slot in value.__slots__)
+    return 32
+
+class AssetCache():
+    # Created by an import operator and handed down to the loaders, it holds
+    # what can be reused from one asset to the next during that import:
+    # parsed mod3 ("mod3"), parsed mrl3 ("mrl3") and the objects created for
+    # a model path ("instances"). Least recently used entries are dropped
+    # once max_bytes is exceeded.
+    def __init__(self, max_bytes=1024*1024*1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, kind, key):
+        entry = self.entries.get((kind, key))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end((kind, key))
+        self.hits += 1
+        return entry[0]
+
+    def contains(self, kind, key):
+        # Does not count as a hit or a miss, nor refresh the entry
+        return (kind, key) in self.entries
+
+    def put(self, kind, key, value, size=None):
+        if size is None:
+            size = estimate_size(value)
+        self.remove(kind, key)
+        if size > self.max_bytes:
+            return
+        self.entries[(kind, key)] = (value, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def remove(self, kind, key):
+        entry = self.entries.pop((kind, key), None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def stats(self):
+        return {
+            "entries":len(self.entries),
+            "bytes":self.total_bytes,
+            "max_bytes":self.max_bytes,
+            "hits":self.hits,
+            "misses":self.misses,
+            "evictions":self.evictions,
+        }
+
+    def log_stats(self):
+        logger.info("Asset cache: " + str(len(self.entries)) + " entries, " + str(self.total_bytes//(1024*1024)) + "/" + str(self.max_bytes//(1024*1024)) + " MB, " + str(self.hits) + " hits, " + str(self.misses) + " misses, " + str(self.evictions) + " evictions")
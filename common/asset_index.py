@@ -0,0 +1,183 @@
+import bpy
+
+import os
+import json
+import hashlib
+import logging
+logger = logging.getLogger("mhworld_import")
+
+ASSET_INDEX_VERSION = 2
+
+# Only the files the loaders look for are indexed
+INDEXED_EXTENSIONS = (".mod3", ".mrl3", ".tex", ".ipr", ".bkipr", ".sdl", ".sobj", ".sobjl", ".lmt")
+
+def get_default_cache_dir():
+    # In the user's Blender data, not in the shared temporary directory where
+    # anyone could plant files for the addon to read
+    try:
+        return bpy.utils.user_resource('DATAFILES', path="mhworld_tool_suite")
+    except Exception as e:
+        logger.debug("Could not get Blender's user data directory (exception=" + str(e) + ")")
+        return os.path.join(os.path.expanduser("~"), ".mhworld_tool_suite")
+
+class AssetIndex():
+    # Every indexed file under game_path, scanned once and saved as JSON in
+    # the cache directory. files maps the lowercase relative path (with
+    # forward slashes) to the relative path, basenames maps a lowercase file
+    # name to the keys of files with that name. The saved index is thrown away
+    # as soon as the mtime of one of the scanned directories changes, which
+    # happens whenever a file is added, removed or renamed in it.
+    # Paths outside of game_path are looked up on the file system directly.
+    def __init__(self, game_path, cache_dir=None):
+        self.game_path = os.path.normpath(game_path) if game_path else ""
+        if not cache_dir:
+            cache_dir = get_default_cache_dir()
+        self.cache_dir = cache_dir
+        self.directories = {}
+        self.files = None
+        self.basenames = {}
+
+    def get_index_filepath(self):
+        path_hash = hashlib.blake2b(self.game_path.encode("utf-8"), digest_size=8).hexdigest()
+        return os.path.join(self.cache_dir, "asset_index_" + path_hash + ".json")
+
+    def is_valid(self):
+        for directory, mtime in self.directories.items():
+            try:
+                if os.stat(os.path.join(self.game_path, directory)).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def load(self):
+        # Uses the saved index if it is still valid, scans the game otherwise
+        if not os.path.isdir(self.game_path):
+            self.directories = {}
+            self.files = None
+            self.basenames = {}
+            return
+        if self.files is not None and self.is_valid():
+            return
+        index_filepath = self.get_index_filepath()
+        if os.path.isfile(index_filepath):
+            try:
+                with open(index_filepath, "r") as index_file:
+                    index_data = json.load(index_file)
+                if index_data.get("version") == ASSET_INDEX_VERSION and index_data.get("game_path") == self.game_path:
+                    self.directories = index_data["directories"]
+                    self.files = index_data["files"]
+                    if self.is_valid():
+                        self.build_basenames()
+                        return
+            except Exception as e:
+                logger.warning("Could not read the asset index, rebuilding it (path=" + index_filepath + ", exception=" + str(e) + ")")
+        self.scan()
+        self.save()
+
+    def scan(self):
+        logger.info("Indexing game files (" + self.game_path + ")...")
+        self.directories = {}
+        self.files = {}
+        pending = [""]
+        while len(pending):
+            directory = pending.pop()
+            absolute_directory = os.path.join(self.game_path, directory)
+            try:
+                self.directories[directory] = os.stat(absolute_directory).st_mtime_ns
+                entries = list(os.scandir(absolute_directory))
+            except OSError as e:
+                logger.warning("Could not index directory (path=" + absolute_directory + ", exception=" + str(e) + ")")
+                continue
+            for entry in entries:
+                relative_path = directory + "/" + entry.name if directory else entry.name
+                if entry.is_dir():
+                    pending.append(relative_path)
+                elif entry.name.lower().endswith(INDEXED_EXTENSIONS):
+                    self.files[relative_path.lower()] = relative_path
+        self.build_basenames()
+        logger.info("Indexed " + str(len(self.files)) + " files in " + str(len(self.directories)) + " directories")
+
+    def save(self):
+        index_filepath = self.get_index_filepath()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_filepath = index_filepath + ".tmp"
+            with open(temp_filepath, "w") as index_file:
+                json.dump({
+                    "version":ASSET_INDEX_VERSION,
+                    "game_path":self.game_path,
+                    "directories":self.directories,
+                    "files":self.files,
+                }, index_file)
+            os.replace(temp_filepath, index_filepath)
+        except OSError as e:
+            logger.warning("Could not save the asset index (path=" + index_filepath + ", exception=" + str(e) + ")")
+
+    def build_basenames(self):
+        self.basenames = {}
+        for key in self.files.keys():
+            self.basenames.setdefault(key.rsplit("/", 1)[-1], []).append(key)
+
+    def get_key(self, path):
+        # Lowercase path relative to game_path, None if it is not indexed
+        if self.files is None:
+            return None
+        path = path.replace("\\", "/")
+        if os.path.isabs(path):
+            try:
+                path = os.path.relpath(path, self.game_path)
+            except ValueError:
+                return None
+            path = path.replace("\\", "/")
+            if path.startswith(".."):
+                return None
+        path = os.path.normpath(path).replace("\\", "/")
+        if not path.lower().endswith(INDEXED_EXTENSIONS):
+            return None
+        return path.lower()
+
+    def exists(self, path):
+        # path is either relative to game_path or absolute
+        key = self.get_key(path)
+        if key is None:
+            return os.path.isfile(os.path.join(self.game_path, path))
+        return key in self.files
+
+    def resolve(self, path):
+        # Absolute path of the file with its real case, None if it does not exist
+        key = self.get_key(path)
+        if key is None:
+            path = os.path.join(self.game_path, path)
+            return path if os.path.isfile(path) else None
+        if key not in self.files:
+            return None
+        return os.path.join(self.game_path, self.files[key])
+
+    def find(self, directory, file_name):
+        # Absolute paths of the files named file_name anywhere under directory
+        directory_key = self.get_key(os.path.join(directory, file_name))
+        if directory_key is None:
+            return []
+        directory_key = directory_key.rsplit("/", 1)[0] + "/" if "/" in directory_key else ""
+        keys = [key for key in self.basenames.get(file_name.lower(), []) if key.startswith(directory_key)]
+        return [os.path.join(self.game_path, self.files[key]) for key in sorted(keys)]
+
+# One index per game path, shared by every import of the session
+asset_indexes = {}
+
+def get_asset_index(game_path, cache_dir=None):
+    # Operators call it with the preferences cache directory before loading,
+    # which revalidates the index. Loaders only need the game path.
+    index_key = os.path.normpath(game_path) if game_path else ""
+    asset_index = asset_indexes.get(index_key)
+    if asset_index is None:
+        asset_index = AssetIndex(game_path, cache_dir)
+        asset_indexes[index_key] = asset_index
+        asset_index.load()
+    elif cache_dir is not None:
+        if cache_dir and cache_dir != asset_index.cache_dir:
+            asset_index.cache_dir = cache_dir
+            asset_index.save()
+        asset_index.load()
+    return asset_index
@@ -0,0 +1,81 @@
+import numpy as np
+
+from .transforms import convert_instance_transforms
+
+TRANSFORM_KEYS = ("position", "rotation", "scale")
+
+class InstanceBatch():
+    # Placements of a map, transforms are kept as arrays in game space:
+    # positions (N,3), rotations (N,4, x y z w) and scales (N,3). paths and
+    # zones have one entry per placement, overloads holds the other keys of a
+    # placement (name, material_suffix, textures_swap, as_empty...) or None.
+    __slots__ = ("positions", "rotations", "scales", "paths", "zones", "overloads")
+
+    def __init__(self, positions, rotations, scales, paths, zones, overloads=None):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 4)
+        self.scales = np.asarray(scales, dtype=np.float64).reshape(-1, 3)
+        self.paths = list(paths)
+        self.zones = list(zones)
+        if overloads is None:
+            overloads = [None] * len(self.paths)
+        self.overloads = list(overloads)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def instance(self, i):
+        # Placement as the dict the asset loaders expect, without its transform
+        obj_instance = {"path":self.paths[i], "zone":self.zones[i]}
+        if self.overloads[i] is not None:
+            obj_instance.update(self.overloads[i])
+        return obj_instance
+
+    def select(self, indices):
+        return InstanceBatch(
+            self.positions[indices],
+            self.rotations[indices],
+            self.scales[indices],
+            [self.paths[i] for i in indices],
+            [self.zones[i] for i in indices],
+            [self.overloads[i] for i in indices],
+        )
+
+    def convert_transforms(self):
+        # Blender space positions, w x y z rotations and scales, in one pass
+        return convert_instance_transforms(self.positions, self.rotations, self.scales)
+
+    def to_instances(self):
+        obj_instances = []
+        for i, (position, rotation, scale) in enumerate(zip(self.positions.tolist(), self.rotations.tolist(), self.scales.tolist())):
+            obj_instance = self.instance(i)
+            obj_instance["position"] = position
+            obj_instance["rotation"] = rotation
+            obj_instance["scale"] = scale
+            obj_instances.append(obj_instance)
+        return obj_instances
+
+def instances_to_batch(obj_instances):
+    overloads = []
+    for obj_instance in obj_instances:
+        overload = {key:value for key, value in obj_instance.items() if key not in TRANSFORM_KEYS and key != "path" and key != "zone"}
+        overloads.append(overload if len(overload) else None)
+    return InstanceBatch(
+        [obj_instance["position"] for obj_instance in obj_instances],
+        [obj_instance["rotation"] for obj_instance in obj_instances],
+        [obj_instance["scale"] for obj_instance in obj_instances],
+        [obj_instance["path"] for obj_instance in obj_instances],
+        [obj_instance["zone"] for obj_instance in obj_instances],
+        overloads,
+    )
+
+def concatenate_batches(batches):
+    batches = [batch for batch in batches if batch is not None]
+    return InstanceBatch(
+        np.concatenate([batch.positions for batch in batches] + [np.zeros((0, 3))]),
+        np.concatenate([batch.rotations for batch in batches] + [np.zeros((0, 4))]),
+        np.concatenate([batch.scales for batch in batches] + [np.zeros((0, 3))]),
+        [path for batch in batches for path in batch.paths],
+        [zone for batch in batches for zone in batch.zones],
+        [overload for batch in batches for overload in batch.overloads],
+    )
@@ -0,0 +1,307 @@
+import bpy
+
+import numpy as np
+import os
+import logging
+
+from .object_loader import load_object_asset, load_object_instances
+from .mesh_registry import get_mesh_registry
+from .asset_cache import AssetCache
+from .transforms import quaternion_to_euler
+from .instance_batch import InstanceBatch, instances_to_batch
+from .load_plan import get_asset_key, plan_assets, log_plan, count_preload_files, preload_assets, ImportProgress
+
+logger = logging.getLogger("mhworld_import")
+
+ASSET_LIBRARY_NAME = "MHW_Asset_Library"
+INSTANCING_NODE_GROUP_NAME = "MHW_Instance_On_Points"
+
+INSTANCING_MODE_ITEMS = [
+    ('OBJECTS','Objects','One collection and set of objects per placement','',0),
+    ('COLLECTION','Collection instances','Each asset is loaded once, placements are empties instancing its collection','',1),
+    ('GEONODES','Geometry nodes','One point cloud per asset, instanced with geometry nodes (fastest for big maps)','',2),
+]
+
+def find_layer_collection(layer_collection, name):
+    if layer_collection.name == name:
+        return layer_collection
+    for child in layer_collection.children:
+        found = find_layer_collection(child, name)
+        if found is not None:
+            return found
+    return None
+
+def get_asset_library():
+    # Collection holding one untransformed copy of every instanced asset. It
+    # is excluded from the view layer, only the instances are visible.
+    if ASSET_LIBRARY_NAME in bpy.data.collections:
+        library = bpy.data.collections[ASSET_LIBRARY_NAME]
+    else:
+        library = bpy.data.collections.new(ASSET_LIBRARY_NAME)
+    master_collection = bpy.context.scene.collection
+    if library.name not in master_collection.children:
+        master_collection.children.link(library)
+    layer_collection = find_layer_collection(bpy.context.view_layer.layer_collection, library.name)
+    if layer_collection is not None:
+        layer_collection.exclude = True
+    return library
+
+def get_asset_collections(library):
+    # asset_key -> collection of the assets already in the library, built once
+    # per import and kept up to date by get_asset_collection
+    asset_collections = {}
+    for child in library.children:
+        if "asset_key" in child:
+            asset_collections[child["asset_key"]] = child
+    return asset_collections
+
+def get_asset_collection(library, asset_collections, obj_instance, game_path, LOD, asset_cache, mesh_registry, load_materials=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0):
+    asset_key = get_asset_key(obj_instance, LOD)
+    asset_collection = asset_collections.get(asset_key)
+    if asset_collection is not None:
+        return asset_collection
+    asset_collection = bpy.data.collections.new(os.path.basename(obj_instance["path"]))
+    library.children.link(asset_collection)
+    try:
+        load_object_asset(obj_instance, asset_collection, game_path, LOD, asset_cache, mesh_registry, load_materials, use_png_cache, overwrite_png_cache, max_texture_size)
+    except Exception:
+        # Not left behind as an empty asset, the next placement tries again
+        for obj in list(asset_collection.objects):
+            bpy.data.objects.remove(obj)
+        bpy.data.collections.remove(asset_collection)
+        raise
+    # Only tagged once loaded
+    asset_collection["asset_key"] = asset_key
+    asset_collections[asset_key] = asset_collection
+    return asset_collection
+
+def new_placeholder_empty(obj_name):
+    # Stands for a placement whose object could not be resolved
+    empty = bpy.data.objects.new(obj_name + "_empty", None)
+    empty.empty_display_size = 100
+    return empty
+
+def new_group_socket(node_group, name, in_out, socket_type):
+    # Node group interface API changed in 4.0
+    if hasattr(node_group, "interface"):
+        return node_group.interface.new_socket(name=name, in_out=in_out, socket_type=socket_type)
+    if in_out == "INPUT":
+        return node_group.inputs.new(socket_type, name)
+    return node_group.outputs.new(socket_type, name)
+
+def get_group_input_identifier(node_group, name):
+    if hasattr(node_group, "interface"):
+        for item in node_group.interface.items_tree:
+            if item.item_type == "SOCKET" and item.in_out == "INPUT" and item.name == name:
+                return item.identifier
+        return None
+    return node_group.inputs[name].identifier
+
+def get_instancing_node_group():
+    # Instances the "Collection" input on every point of the mesh, using its
+    # "rotation" (XYZ euler) and "scale" point attributes
+    if INSTANCING_NODE_GROUP_NAME in bpy.data.node_groups:
+        return bpy.data.node_groups[INSTANCING_NODE_GROUP_NAME]
+    node_group = bpy.data.node_groups.new(INSTANCING_NODE_GROUP_NAME, "GeometryNodeTree")
+    if hasattr(node_group, "is_modifier"):
+        node_group.is_modifier = True
+    new_group_socket(node_group, "Geometry", "INPUT", "NodeSocketGeometry")
+    new_group_socket(node_group, "Collection", "INPUT", "NodeSocketCollection")
+    new_group_socket(node_group, "Geometry", "OUTPUT", "NodeSocketGeometry")
+
+    nodes = node_group.nodes
+    links = node_group.links
+    group_input = nodes.new("NodeGroupInput")
+    group_input.location = (-600, 0)
+    group_output = nodes.new("NodeGroupOutput")
+    group_output.location = (300, 0)
+
+    collection_info = nodes.new("GeometryNodeCollectionInfo")
+    collection_info.location = (-300, -100)
+    collection_info.transform_space = "ORIGINAL"
+    links.new(group_input.outputs["Collection"], collection_info.inputs["Collection"])
+
+    attribute_nodes = {}
+    for attribute_i, attribute_name in enumerate(["rotation", "scale"]):
+        attribute_node = nodes.new("GeometryNodeInputNamedAttribute")
+        attribute_node.location = (-300, -300 - 150*attribute_i)
+        attribute_node.data_type = "FLOAT_VECTOR"
+        attribute_node.inputs["Name"].default_value = attribute_name
+        attribute_nodes[attribute_name] = attribute_node
+
+    instance_on_points = nodes.new("GeometryNodeInstanceOnPoints")
+    links.new(group_input.outputs["Geometry"], instance_on_points.inputs["Points"])
+    links.new(collection_info.outputs[0], instance_on_points.inputs["Instance"])
+    for attribute_name, socket_name in [("rotation", "Rotation"), ("scale", "Scale")]:
+        # Older versions have one output per data type, the unused ones are disabled
+        attribute_output = next(output for output in attribute_nodes[attribute_name].outputs if output.enabled)
+        links.new(attribute_output, instance_on_points.inputs[socket_name])
+    links.new(instance_on_points.outputs["Instances"], group_output.inputs["Geometry"])
+    return node_group
+
+def create_instance_points(name, collection, asset_collection, positions, rotations, scales):
+    # One vertex per placement, the transform lives in the point attributes
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set("co", positions.astype(np.float32).ravel())
+    rotation_attribute = mesh.attributes.new("rotation", "FLOAT_VECTOR", "POINT")
+    rotation_attribute.data.foreach_set("vector", quaternion_to_euler(rotations).astype(np.float32).ravel())
+    scale_attribute = mesh.attributes.new("scale", "FLOAT_VECTOR", "POINT")
+    scale_attribute.data.foreach_set("vector", scales.astype(np.float32).ravel())
+    mesh.update()
+
+    obj = bpy.data.objects.new(name, mesh)
+    collection.objects.link(obj)
+    node_group = get_instancing_node_group()
+    modifier = obj.modifiers.new("Instances", "NODES")
+    modifier.node_group = node_group
+    modifier[get_group_input_identifier(node_group, "Collection")] = asset_collection
+    return obj
+
+def load_instances_geonodes(obj_batch, scene_collection, game_path, LOD, asset_cache=None, mesh_registry=None, zone_collection_dict=None, load_materials=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0, progress=None):
+    # Every asset is loaded once in the asset library, each (zone, asset) pair
+    # becomes a single point cloud object instancing it
+    if zone_collection_dict is None:
+        zone_collection_dict = {}
+    if mesh_registry is None:
+        mesh_registry = get_mesh_registry()
+    if asset_cache is None:
+        asset_cache = AssetCache()
+    if not isinstance(obj_batch, InstanceBatch):
+        obj_batch = instances_to_batch(obj_batch)
+    library = get_asset_library()
+    asset_collections = get_asset_collections(library)
+    positions, rotations, scales = obj_batch.convert_transforms()
+
+    grouped_instances = {}
+    for obj_instance_i in range(len(obj_batch)):
+        obj_instance = obj_batch.instance(obj_instance_i)
+        grouped_instances.setdefault((obj_instance["zone"], get_asset_key(obj_instance, LOD)), []).append(obj_instance_i)
+
+    returned_objects = []
+    for group_i, ((zone, _), indices) in enumerate(grouped_instances.items()):
+        path = obj_batch.paths[indices[0]]
+        if group_i%100 == 0:
+            print("Loading asset " + str(group_i) + " of " + str(len(grouped_instances)))
+        try:
+            if zone in zone_collection_dict.keys():
+                parent_collection = zone_collection_dict[zone]
+            else:
+                parent_collection = scene_collection
+            obj_instance = obj_batch.instance(indices[0])
+            if "as_empty" in obj_instance.keys() and obj_instance["as_empty"]:
+                # Placeholders for unresolved objects, one visible empty per
+                # placement like the other modes
+                for obj_instance_i in indices:
+                    empty = new_placeholder_empty(os.path.basename(path))
+                    parent_collection.objects.link(empty)
+                    empty.location = positions[obj_instance_i].tolist()
+                    empty.rotation_mode = "QUATERNION"
+                    empty.rotation_quaternion = rotations[obj_instance_i].tolist()
+                    empty.scale = scales[obj_instance_i].tolist()
+                    returned_objects.append(empty)
+            else:
+                asset_collection = get_asset_collection(library, asset_collections, obj_instance, game_path, LOD, asset_cache, mesh_registry, load_materials, use_png_cache, overwrite_png_cache, max_texture_size)
+                obj = create_instance_points(os.path.basename(path) + "_instances", parent_collection, asset_collection, positions[indices], rotations[indices], scales[indices])
+                returned_objects.append(obj)
+        except Exception as e:
+            logger.error("Could not load object, exception during loading (path = "+ str(path) + ", exception=" + str(e) + ")")
+        if progress is not None:
+            progress.step(len(indices))
+    print("Object import done.")
+    return returned_objects
+
+def load_instances_collections(obj_batch, scene_collection, game_path, LOD, asset_cache=None, mesh_registry=None, zone_collection_dict=None, load_materials=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0, progress=None):
+    # Every asset is loaded once in the asset library, each placement is an
+    # empty instancing the asset collection
+    if zone_collection_dict is None:
+        zone_collection_dict = {}
+    if mesh_registry is None:
+        mesh_registry = get_mesh_registry()
+    if asset_cache is None:
+        asset_cache = AssetCache()
+    if not isinstance(obj_batch, InstanceBatch):
+        obj_batch = instances_to_batch(obj_batch)
+    library = get_asset_library()
+    asset_collections = get_asset_collections(library)
+    positions, rotations, scales = obj_batch.convert_transforms()
+    positions = positions.tolist()
+    rotations = rotations.tolist()
+    scales = scales.tolist()
+
+    returned_objects = []
+    for obj_instance_i in range(len(obj_batch)):
+        if obj_instance_i%100 == 0:
+            print("Loading object " + str(obj_instance_i) + " of " + str(len(obj_batch)))
+        try:
+            obj_instance = obj_batch.instance(obj_instance_i)
+            obj_name = os.path.basename(obj_instance["path"])
+            if obj_instance["zone"] in zone_collection_dict.keys():
+                parent_collection = zone_collection_dict[obj_instance["zone"]]
+            else:
+                parent_collection = scene_collection
+
+            if "as_empty" in obj_instance.keys() and obj_instance["as_empty"]:
+                empty = new_placeholder_empty(obj_name)
+            else:
+                asset_collection = get_asset_collection(library, asset_collections, obj_instance, game_path, LOD, asset_cache, mesh_registry, load_materials, use_png_cache, overwrite_png_cache, max_texture_size)
+                empty = bpy.data.objects.new(obj_name, None)
+                empty.instance_type = "COLLECTION"
+                empty.instance_collection = asset_collection
+            parent_collection.objects.link(empty)
+            empty.location = positions[obj_instance_i]
+            empty.rotation_mode = "QUATERNION"
+            empty.rotation_quaternion = rotations[obj_instance_i]
+            empty.scale = scales[obj_instance_i]
+            returned_objects.append(empty)
+        except Exception as e:
+            path = obj_batch.paths[obj_instance_i]
+            logger.error("Could not load object, exception during loading (path = "+ str(path) + ", exception=" + str(e) + ")")
+        if progress is not None:
+            progress.step()
+    print("Object import done.")
+    return returned_objects
+
+def load_instances(obj_batch, scene_collection, game_path, LOD, asset_cache=None, mesh_registry=None, zone_collection_dict=None, load_materials=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0, instancing_mode="OBJECTS"):
+    # obj_batch is an InstanceBatch, or a list of placement dicts.
+    # Unique assets are planned from the whole batch, parsed in parallel and
+    # built once, the placements are only created afterwards.
+    if not isinstance(obj_batch, InstanceBatch):
+        obj_batch = instances_to_batch(obj_batch)
+    if zone_collection_dict is None:
+        zone_collection_dict = {}
+    if mesh_registry is None:
+        mesh_registry = get_mesh_registry()
+    if asset_cache is None:
+        asset_cache = AssetCache()
+
+    plans = plan_assets(obj_batch, game_path, LOD, load_materials)
+    log_plan(plans, len(obj_batch))
+    progress = ImportProgress(count_preload_files(plans) + len(plans) + len(obj_batch))
+    try:
+        preload_assets(plans, LOD, asset_cache, progress=progress)
+
+        if instancing_mode in ("COLLECTION", "GEONODES"):
+            library = get_asset_library()
+            asset_collections = get_asset_collections(library)
+            for plan in plans:
+                if not ("as_empty" in plan.instance.keys() and plan.instance["as_empty"]):
+                    try:
+                        get_asset_collection(library, asset_collections, plan.instance, game_path, LOD, asset_cache, mesh_registry, load_materials, use_png_cache, overwrite_png_cache, max_texture_size)
+                    except Exception as e:
+                        logger.error("Could not load asset, exception during loading (path = "+ str(plan.instance["path"]) + ", exception=" + str(e) + ")")
+                progress.step()
+        else:
+            # Objects are built on the first placement of each asset and
+            # copied for the others, placements keep their order
+            progress.step(len(plans))
+
+        if instancing_mode == "GEONODES":
+            load_function = load_instances_geonodes
+        elif instancing_mode == "COLLECTION":
+            load_function = load_instances_collections
+        else:
+            load_function = load_object_instances
+        return load_function(obj_batch, scene_collection, game_path, LOD, asset_cache, mesh_registry, zone_collection_dict=zone_collection_dict, load_materials=load_materials, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, max_texture_size=max_texture_size, progress=progress)
+    finally:
+        progress.end()
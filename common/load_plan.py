@@ -0,0 +1,167 @@
+import bpy
+
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from ..mod3.mod3_parser import Mod3Parser
+from ..mrl3.mrl3_parser import Mrl3Parser, load_mrl3_dicts
+from .object_loader import resolve_object_paths
+from .asset_index import get_asset_index
+from .asset_cache import estimate_size
+
+logger = logging.getLogger("mhworld_import")
+
+def get_asset_key(obj_instance, LOD):
+    # Placements sharing a model but not its material overloads are different assets
+    return "|".join([
+        obj_instance["path"],
+        "LOD" + str(LOD),
+        obj_instance.get("material_suffix", ""),
+        str(obj_instance.get("textures_swap", "")),
+    ])
+
+class AssetPlan():
+    # One unique asset of an import: the placement it is loaded from, its
+    # files and the indices of every placement using it
+    __slots__ = ("key", "instance", "mod3_filepath", "mrl3_filepath", "texture_paths", "indices")
+
+    def __init__(self, key, instance, mod3_filepath, mrl3_filepath):
+        self.key = key
+        self.instance = instance
+        self.mod3_filepath = mod3_filepath
+        self.mrl3_filepath = mrl3_filepath
+        self.texture_paths = []
+        self.indices = []
+
+class ImportProgress():
+    # Thin wrapper around the window manager progress indicator, it does
+    # nothing when there is no window (background mode)
+    def __init__(self, total):
+        self.window_manager = bpy.context.window_manager
+        self.value = 0
+        if self.window_manager is not None:
+            self.window_manager.progress_begin(0, max(total, 1))
+
+    def step(self, count=1):
+        self.value += count
+        if self.window_manager is not None:
+            self.window_manager.progress_update(self.value)
+
+    def end(self):
+        if self.window_manager is not None:
+            self.window_manager.progress_end()
+
+def plan_assets(obj_batch, game_path, LOD, load_materials=True):
+    # Unique assets of a batch in order of first placement, with the textures
+    # their materials reference (read from the mrl3 headers only)
+    asset_index = get_asset_index(game_path)
+    plans = {}
+    for obj_instance_i in range(len(obj_batch)):
+        obj_instance = obj_batch.instance(obj_instance_i)
+        key = get_asset_key(obj_instance, LOD)
+        if key not in plans:
+            if "as_empty" in obj_instance.keys() and obj_instance["as_empty"]:
+                mod3_filepath, mrl3_filepath = None, None
+            else:
+                mod3_filepath, mrl3_filepath = resolve_object_paths(game_path, obj_instance["path"])
+                if not asset_index.exists(mod3_filepath):
+                    mod3_filepath = None
+                if not load_materials or not asset_index.exists(mrl3_filepath):
+                    mrl3_filepath = None
+            plans[key] = AssetPlan(key, obj_instance, mod3_filepath, mrl3_filepath)
+        plans[key].indices.append(obj_instance_i)
+
+    texture_headers = {}
+    for plan in plans.values():
+        if plan.mrl3_filepath is None:
+            continue
+        if plan.mrl3_filepath not in texture_headers:
+            try:
+                texture_headers[plan.mrl3_filepath] = Mrl3Parser(path=plan.mrl3_filepath).read_header()["texture_paths"]
+            except Exception as e:
+                logger.warning("Could not read material header (path=" + plan.mrl3_filepath + ", exception=" + str(e) + ")")
+                texture_headers[plan.mrl3_filepath] = []
+        textures_swap = plan.instance.get("textures_swap", {})
+        for texture_path in texture_headers[plan.mrl3_filepath]:
+            texture_name = texture_path.split("\\")[-1]
+            if texture_name in textures_swap.keys():
+                texture_path = texture_path.replace(texture_name, textures_swap[texture_name])
+            plan.texture_paths.append(texture_path.replace("\\", "/"))
+    return list(plans.values())
+
+def log_plan(plans, instance_count):
+    mod3_filepaths = set(plan.mod3_filepath for plan in plans if plan.mod3_filepath is not None)
+    mrl3_filepaths = set(plan.mrl3_filepath for plan in plans if plan.mrl3_filepath is not None)
+    texture_paths = set(texture_path for plan in plans for texture_path in plan.texture_paths)
+    logger.info("Import plan: " + str(instance_count) + " placements, " + str(len(plans)) + " unique assets, " + str(len(mod3_filepaths)) + " mod3, " + str(len(mrl3_filepaths)) + " mrl3, " + str(len(texture_paths)) + " textures")
+
+def count_preload_files(plans):
+    return len(set(plan.mod3_filepath for plan in plans if plan.mod3_filepath is not None)) + len(set(plan.mrl3_filepath for plan in plans if plan.mrl3_filepath is not None))
+
+def parse_mod3(filepath, LOD):
+    return Mod3Parser(path=filepath).read(lod=LOD)
+
+def parse_mrl3(filepath):
+    return Mrl3Parser(path=filepath).read()
+
+def preload_assets(plans, LOD, asset_cache, max_workers=None, progress=None):
+    # Parses the unique mod3 and mrl3 in worker threads and fills the asset
+    # cache with the results, so that building the Blender data afterwards
+    # doesn't wait on those files. Files are parsed in plan order and the
+    # preload stops once the results would no longer fit in the cache: past
+    # that point it would evict assets it parsed before they get built, the
+    # remaining files are parsed by the loaders when they need them. The
+    # cache itself is only touched from this thread.
+    if max_workers is None:
+        max_workers = min(8, os.cpu_count() or 1)
+    # Loaded once up front instead of racing in the workers
+    load_mrl3_dicts()
+    jobs = {}
+    for plan in plans:
+        if plan.mod3_filepath is not None and not asset_cache.contains("mod3", (plan.mod3_filepath, LOD)):
+            jobs[("mod3", (plan.mod3_filepath, LOD))] = (parse_mod3, (plan.mod3_filepath, LOD))
+        if plan.mrl3_filepath is not None and not asset_cache.contains("mrl3", plan.mrl3_filepath):
+            jobs[("mrl3", plan.mrl3_filepath)] = (parse_mrl3, (plan.mrl3_filepath,))
+    if progress is not None:
+        progress.step(count_preload_files(plans) - len(jobs))
+    if len(jobs) == 0:
+        return
+    jobs = list(jobs.items())
+    budget = asset_cache.max_bytes - asset_cache.total_bytes
+    preloaded_bytes = 0
+    preloaded_count = 0
+    next_job_i = 0
+    is_full = False
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        while True:
+            # Only a few jobs ahead of the workers, so that little is parsed
+            # for nothing once the cache is full
+            while not is_full and next_job_i < len(jobs) and len(futures) < max_workers*2:
+                cache_key, (function, arguments) = jobs[next_job_i]
+                futures[executor.submit(function, *arguments)] = cache_key
+                next_job_i += 1
+            if len(futures) == 0:
+                break
+            done, _ = wait(futures.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = futures.pop(future)
+                try:
+                    value = future.result()
+                    size = estimate_size(value)
+                    if preloaded_bytes + size > budget:
+                        is_full = True
+                    else:
+                        asset_cache.put(kind, key, value, size)
+                        preloaded_bytes += size
+                        preloaded_count += 1
+                except Exception as e:
+                    # The loaders will hit the same error and report it for the placements concerned
+                    logger.debug("Could not preload asset (kind=" + kind + ", key=" + str(key) + ", exception=" + str(e) + ")")
+                if progress is not None:
+                    progress.step()
+    if is_full:
+        logger.info("Asset cache full, preloaded " + str(preloaded_count) + " of " + str(len(jobs)) + " files, the others are parsed on demand")
+        if progress is not None:
+            progress.step(len(jobs) - next_job_i)
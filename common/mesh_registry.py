@@ -0,0 +1,64 @@
+import bpy
+from bpy.app.handlers import persistent
+
+import logging
+logger = logging.getLogger("mhworld_import")
+
+class MeshRegistry():
+    # content hash -> mesh name for the meshes of the open .blend. The hashes
+    # live on the meshes ("content_hash" property) so they are saved with the
+    # file, the index itself is rebuilt from them once per file and then kept
+    # up to date as meshes get imported. Imported meshes are shared data: every
+    # import of the same content uses the same mesh. The vertex, edge and
+    # polygon counts are stored next to the hash ("content_counts"), a mesh
+    # whose geometry was edited since no longer matches and is not reused.
+    def __init__(self):
+        self.mesh_names = None
+
+    def clear(self):
+        self.mesh_names = None
+
+    def get_counts(self, mesh):
+        return [len(mesh.vertices), len(mesh.edges), len(mesh.polygons)]
+
+    def is_unedited(self, mesh):
+        return "content_counts" in mesh and list(mesh["content_counts"]) == self.get_counts(mesh)
+
+    def rebuild(self):
+        self.mesh_names = {}
+        for mesh in bpy.data.meshes:
+            if "content_hash" in mesh and self.is_unedited(mesh):
+                self.mesh_names[mesh["content_hash"]] = mesh.name
+        logger.debug("Mesh registry built (" + str(len(self.mesh_names)) + " meshes)")
+
+    def get(self, content_hash):
+        if self.mesh_names is None:
+            self.rebuild()
+        mesh_name = self.mesh_names.get(content_hash)
+        if mesh_name is None:
+            return None
+        mesh = bpy.data.meshes.get(mesh_name)
+        if mesh is None or mesh.get("content_hash") != content_hash or not self.is_unedited(mesh):
+            # Renamed, removed or edited since it was registered
+            self.rebuild()
+            mesh_name = self.mesh_names.get(content_hash)
+            if mesh_name is None:
+                return None
+            mesh = bpy.data.meshes.get(mesh_name)
+        return mesh
+
+    def add(self, mesh, content_hash):
+        if self.mesh_names is None:
+            self.rebuild()
+        mesh["content_hash"] = content_hash
+        mesh["content_counts"] = self.get_counts(mesh)
+        self.mesh_names[content_hash] = mesh.name
+
+mesh_registry = MeshRegistry()
+
+def get_mesh_registry():
+    return mesh_registry
+
+@persistent
+def clear_mesh_registry(dummy):
+    mesh_registry.clear()
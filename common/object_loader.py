@@ -7,14 +7,65 @@ import math
 
 from ..mod3.mod3_loader import load_mod3
 from ..mrl3.mrl3_loader import load_mrl3
+from .mesh_registry import get_mesh_registry
+from .asset_cache import AssetCache
+from .instance_batch import InstanceBatch, instances_to_batch
+from .asset_index import get_asset_index
 logger = logging.getLogger("mhworld_import")
 
-def load_object_instances(obj_instances, scene_collection, game_path, LOD, mesh_cache={}, mesh_hashes={}, zone_collection_dict={}, load_materials=True, use_png_cache=True, overwrite_png_cache=False):
+def resolve_object_paths(game_path, path):
+    # Need to fix the GM paths
+    asset_index = get_asset_index(game_path)
+    object_path = path
+    if os.path.basename(path).lower().startswith("gm"):
+        if not asset_index.exists(path + ".mod3"):
+            folder_tree_list = path.split("/")
+            object_path = "Assets/gm/" + "/".join(folder_tree_list[2:4]) + "/mod/" + folder_tree_list[-1]
+    # Real case of the files when they exist, the paths in the game files don't always match it
+    mod3_filepath = asset_index.resolve(object_path + ".mod3") or os.path.join(game_path, object_path + ".mod3")
+    mrl3_filepath = asset_index.resolve(object_path + ".mrl3") or os.path.join(game_path, object_path + ".mrl3")
+    return mod3_filepath, mrl3_filepath
+
+def load_object_asset(obj_instance, collection, game_path, LOD, asset_cache, mesh_registry, load_materials=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0):
+    # Loads the model of an instance and its materials into collection, objects are left untransformed
+    obj_name = os.path.basename(obj_instance["path"])
+    mod3_filepath, mrl3_filepath = resolve_object_paths(game_path, obj_instance["path"])
+    if not ("as_empty" in obj_instance.keys() and obj_instance["as_empty"]):
+        objs = load_mod3(mod3_filepath, collection=collection, LOD=LOD, fix_rotation=False, fix_scale=False, obj_name=obj_name, obj_overload=obj_instance, mesh_registry=mesh_registry, asset_cache=asset_cache)
+    else:
+        empty = bpy.data.objects.new(obj_name + "_empty", None )
+        collection.objects.link(empty)
+        empty.rotation_mode = "XYZ"
+        empty.empty_display_size = 100
+        objs = [empty]
+
+    if load_materials and get_asset_index(game_path).exists(mrl3_filepath):
+        try:
+            mats = load_mrl3(game_path, mrl3_filepath, use_loaded_mat=True, use_loaded_tex=True, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, max_texture_size=max_texture_size, mat_prefix=obj_name, obj_overload=obj_instance, asset_cache=asset_cache)
+        except Exception as e:
+            logger.error("Could not load material, exception during parsing (path=" + mrl3_filepath + ", exception=" + str(e) + ")")
+    return objs
+
+def load_object_instances(obj_batch, scene_collection, game_path, LOD, asset_cache=None, mesh_registry=None, zone_collection_dict=None, load_materials=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0, progress=None):
+    if zone_collection_dict is None:
+        zone_collection_dict = {}
+    if mesh_registry is None:
+        mesh_registry = get_mesh_registry()
+    if asset_cache is None:
+        asset_cache = AssetCache()
+    if not isinstance(obj_batch, InstanceBatch):
+        obj_batch = instances_to_batch(obj_batch)
+    positions, rotations, scales = obj_batch.convert_transforms()
+    positions = positions.tolist()
+    rotations = rotations.tolist()
+    scales = scales.tolist()
+
     returned_objects = []
-    for obj_instance_i, obj_instance in enumerate(obj_instances[:]):
+    for obj_instance_i in range(len(obj_batch)):
         if obj_instance_i%100 == 0:
-            print("Loading object " + str(obj_instance_i) + " of " + str(len(obj_instances)))
+            print("Loading object " + str(obj_instance_i) + " of " + str(len(obj_batch)))
         try:
+            obj_instance = obj_batch.instance(obj_instance_i)
             obj_name = os.path.basename(obj_instance["path"])
 
             if obj_instance["zone"] in zone_collection_dict.keys():
@@ -25,70 +76,21 @@ def load_object_instances(obj_instances, scene_collection, game_path, LOD, mesh_
             local_collection = bpy.data.collections.new(obj_name)
             parent_collection.children.link(local_collection)
 
-            obj_pos = Vector([obj_instance["position"][0]/100.0, -obj_instance["position"][2]/100.0, obj_instance["position"][1]/100.0])
-            obj_rot = Quaternion([obj_instance["rotation"][3], obj_instance["rotation"][0], obj_instance["rotation"][1], obj_instance["rotation"][2]])
-            obj_scl = Vector([obj_instance["scale"][0]/100.0, obj_instance["scale"][1]/100.0, obj_instance["scale"][2]/100.0])
-
-            # Need to fix the GM paths
-            object_path = None
-            if os.path.basename(obj_instance["path"]).lower().startswith("gm"):
-                if not os.path.exists(os.path.join(game_path, obj_instance["path"] + ".mod3")):
-                    folder_tree_list = obj_instance["path"].split("/")
-                    object_path = "Assets/gm/" + "/".join(folder_tree_list[2:4]) + "/mod/" + folder_tree_list[-1]
-            if object_path is None:
-                mod3_filepath = os.path.join(game_path, obj_instance["path"] + ".mod3")
-            else:
-                mod3_filepath = os.path.join(game_path, object_path + ".mod3")
+            mod3_filepath, _ = resolve_object_paths(game_path, obj_instance["path"])
 
-            if mod3_filepath in mesh_cache and not ("no_cache" in obj_instance.keys() and obj_instance["no_cache"]):
-                cached_obj_datas = mesh_cache[mod3_filepath]
+            cached_obj_datas = None
+            if not ("no_cache" in obj_instance.keys() and obj_instance["no_cache"]):
+                cached_obj_datas = asset_cache.get("instances", mod3_filepath)
+            if cached_obj_datas is not None:
+                objs = []
                 for cached_obj_data in cached_obj_datas:
-                    obj = bpy.data.objects.new(cached_obj_data["object_name"], bpy.data.meshes[mesh_hashes[cached_obj_data["mesh_hash"]]])
+                    obj = bpy.data.objects.new(cached_obj_data["object_name"], mesh_registry.get(cached_obj_data["mesh_hash"]))
                     local_collection.objects.link(obj)
-                    obj.location = obj_pos
-                    obj.rotation_mode = "QUATERNION"
-                    obj.rotation_quaternion = obj_rot
-                    obj.rotation_quaternion.rotate(Euler([math.radians(90),0,0]))
-                    obj.scale = obj_scl
-                    returned_objects.append(obj)
-
                     #obj.material_slots[0].link = 'OBJECT'
                     obj.material_slots[0].material = bpy.data.materials[cached_obj_data["material_name"]]
+                    objs.append(obj)
             else:
-                if not ("as_empty" in obj_instance.keys() and obj_instance["as_empty"]):
-                    objs = load_mod3(mod3_filepath, collection=local_collection, LOD=LOD, fix_rotation=False, fix_scale=False, obj_name=obj_name, obj_overload=obj_instance)
-                else:
-                    empty = bpy.data.objects.new(obj_name + "_empty", None )
-                    local_collection.objects.link(empty)
-                    empty.rotation_mode = "XYZ"
-                    empty.empty_display_size = 100
-                    objs = [empty]
-
-                for obj in objs:
-                    if obj.type == "MESH":
-                        mesh_hash = hash(str([x.co for x in obj.data.vertices]))
-                        if mesh_hash in mesh_hashes:
-                            to_delete_name = obj.data.name
-                            obj.data = bpy.data.meshes[mesh_hashes[mesh_hash]]
-                            bpy.data.meshes.remove(bpy.data.meshes[to_delete_name])
-                        else:
-                            mesh_hashes[mesh_hash] = obj.data.name
-                    if obj.parent is None:
-                        obj.location = obj_pos
-                        obj.rotation_mode = "QUATERNION"
-                        obj.rotation_quaternion = obj_rot
-                        obj.rotation_quaternion.rotate(Euler([math.radians(90),0,0]))
-                        obj.scale = obj_scl
-                    returned_objects.append(obj)
-                if object_path is None:
-                    mrl3_filepath = os.path.join(game_path, obj_instance["path"] + ".mrl3")
-                else:
-                    mrl3_filepath = os.path.join(game_path, object_path + ".mrl3")
-                if load_materials and os.path.exists(mrl3_filepath):
-                    try:
-                        mats = load_mrl3(game_path, mrl3_filepath, use_loaded_mat=True, use_loaded_tex=True, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, mat_prefix=obj_name, obj_overload=obj_instance)
-                    except Exception as e:
-                        logger.error("Could not load material, exception during parsing (path=" + mrl3_filepath + ", exception=" + str(e) + ")")
+                objs = load_object_asset(obj_instance, local_collection, game_path, LOD, asset_cache, mesh_registry, load_materials, use_png_cache, overwrite_png_cache, max_texture_size)
                 # Put data in cache
                 cached_data = []
                 cache_compatible = True
@@ -97,15 +99,24 @@ def load_object_instances(obj_instances, scene_collection, game_path, LOD, mesh_
                         cache_compatible = False
                         break
                     cached_obj = {}
-                    cached_obj["mesh_hash"] = hash(str([x.co for x in obj.data.vertices]))
+                    cached_obj["mesh_hash"] = obj.data["content_hash"]
                     cached_obj["object_name"] = obj.name
                     cached_obj["material_name"] = obj.material_slots[0].material.name
                     cached_data.append(cached_obj)
                 if cache_compatible:
-                    mesh_cache[mod3_filepath] = cached_data
+                    asset_cache.put("instances", mod3_filepath, cached_data)
+
+            for obj in objs:
+                if obj.parent is None:
+                    obj.location = positions[obj_instance_i]
+                    obj.rotation_mode = "QUATERNION"
+                    obj.rotation_quaternion = rotations[obj_instance_i]
+                    obj.scale = scales[obj_instance_i]
+                returned_objects.append(obj)
         except Exception as e:
-            path = obj_instance["path"] if "path" in obj_instance.keys() else "UNKNOWN"
+            path = obj_batch.paths[obj_instance_i]
             logger.error("Could not load object, exception during loading (path = "+ str(path) + ", exception=" + str(e) + ")")
+        if progress is not None:
+            progress.step()
     print("Object import done.")
     return returned_objects
-
@@ -0,0 +1,222 @@
+import struct
+import mmap
+import functools
+import numpy as np
+import logging
+logger = logging.getLogger("mhworld_import")
+
+# Compiled once, shared by every parser. unpack_from reads straight from the
+# underlying buffer so single value reads don't allocate a slice anymore.
+_STRUCTS = {}
+
+def get_struct(kind):
+    compiled = _STRUCTS.get(kind)
+    if compiled is None:
+        compiled = struct.Struct("<" + kind)
+        _STRUCTS[kind] = compiled
+    return compiled
+
+_UINT = get_struct("I")
+_INT = get_struct("i")
+_UINT64 = get_struct("Q")
+_HALF = get_struct("e")
+_FLOAT = get_struct("f")
+_SHORT = get_struct("h")
+_USHORT = get_struct("H")
+_BYTE = get_struct("b")
+_UBYTE = get_struct("B")
+
+def read_file(path, use_mmap=True):
+    # With use_mmap, the file is mapped instead of read: only the pages that
+    # are actually accessed get loaded, which matters for big textures where
+    # a single mip is decoded. The parsers close the mapping once read()
+    # returns (see closes_reader).
+    with open(path, "rb") as file_in:
+        if use_mmap:
+            try:
+                return mmap.mmap(file_in.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty files can't be mapped
+                pass
+        return file_in.read()
+
+def closes_reader(read):
+    # For the read methods of the parsers: the Reader is closed once the
+    # parsed data is returned, which must not hold views on it anymore
+    @functools.wraps(read)
+    def read_and_close(self, *args, **kwargs):
+        try:
+            return read(self, *args, **kwargs)
+        finally:
+            self.bs.close()
+    return read_and_close
+
+class Reader():
+    def __init__(self, data):
+        self.offset = 0
+        # data is kept around for the bytes-level helpers (find, ...), every
+        # read goes through the memoryview
+        self.data = data
+        self.view = memoryview(data)
+        self.partial_offset = 0
+        self.partial_data = None
+
+    def close(self):
+        # Releases the file mapping, the Reader can't be used afterwards
+        if self.view is None:
+            return
+        try:
+            self.view.release()
+            if isinstance(self.data, mmap.mmap):
+                self.data.close()
+        except BufferError:
+            # An array returned by read_array or readBytes is still alive,
+            # the mapping is left to the garbage collector
+            logger.debug("Could not close a mapped file, some parsed data still points to it")
+            return
+        self.view = None
+        self.data = None
+
+    def read(self, kind, size=None):
+        compiled = get_struct(kind)
+        result = compiled.unpack_from(self.view, self.offset)[0]
+        self.offset += compiled.size
+        return result
+
+    def unpack(self, kind):
+        compiled = get_struct(kind)
+        result = compiled.unpack_from(self.view, self.offset)
+        self.offset += compiled.size
+        return result
+
+    def read_array(self, dtype, count):
+        # Zero-copy view on the data, read-only
+        array = np.frombuffer(self.view, dtype=dtype, count=count, offset=self.offset)
+        self.offset += array.nbytes
+        return array
+
+    def seek(self, offset, start = None):
+        if start is None:
+            self.offset = offset
+        else:
+            self.offset += offset
+
+    def readUInt(self):
+        result = _UINT.unpack_from(self.view, self.offset)[0]
+        self.offset += 4
+        return result
+
+    def readInt(self):
+        result = _INT.unpack_from(self.view, self.offset)[0]
+        self.offset += 4
+        return result
+
+    def readUInt64(self):
+        result = _UINT64.unpack_from(self.view, self.offset)[0]
+        self.offset += 8
+        return result
+
+    def readHalf(self):
+        result = _HALF.unpack_from(self.view, self.offset)[0]
+        self.offset += 2
+        return result
+
+    def readFloat(self):
+        result = _FLOAT.unpack_from(self.view, self.offset)[0]
+        self.offset += 4
+        return result
+
+    def readShort(self):
+        result = _SHORT.unpack_from(self.view, self.offset)[0]
+        self.offset += 2
+        return result
+
+    def readUShort(self):
+        result = _USHORT.unpack_from(self.view, self.offset)[0]
+        self.offset += 2
+        return result
+
+    def readByte(self):
+        result = _BYTE.unpack_from(self.view, self.offset)[0]
+        self.offset += 1
+        return result
+
+    def readUByte(self):
+        result = _UBYTE.unpack_from(self.view, self.offset)[0]
+        self.offset += 1
+        return result
+
+    def readBytes(self, size):
+        # Does not move the offset, returns a view and not a copy
+        return self.view[self.offset:self.offset + size]
+
+    # this function will definitelly stop working if you look at it too hard
+    def readBytes_unpackbin(self, bits, block_size, signed=False):
+        value = 0
+        remaining_bits = bits
+        movement = min(remaining_bits, block_size)
+        while True:
+            if self.partial_offset == 0:
+                if block_size == 8:
+                    self.partial_data = self.readUByte()
+                elif block_size == 16:
+                    self.partial_data = self.readUShort()
+                elif block_size == 32:
+                    self.partial_data = self.readUInt()
+                elif block_size == 64:
+                    self.partial_data = self.readUInt64()
+            movement = min(remaining_bits, block_size-self.partial_offset)
+            value = value << movement
+            value = value | (self.partial_data & ((2**movement)-1))
+            self.partial_data = self.partial_data >> movement
+            remaining_bits -= movement
+            self.partial_offset = (self.partial_offset + movement)%block_size
+            movement = min(remaining_bits, block_size)
+
+            if remaining_bits == 0:
+                if signed == True:
+                    maxval = ((1 << bits) - 1)
+                    if value > (maxval >> 1):
+                        value -= maxval
+                    value = value / (maxval >> 1)
+                return value
+
+    def readBytes_to_int(self, size):
+        self.readUByte()
+        value = int.from_bytes(self.readBytes(size), byteorder='little')
+        self.offset += size
+        return value
+
+    def readString(self):
+        end = self.data.find(b"\x00", self.offset)
+        if end == -1:
+            end = len(self.data)
+        text = bytes(self.view[self.offset:end]).decode("latin-1")
+        self.offset = end + 1
+        return text
+
+    def readStringUTFAt(self, offset):
+        previous_offset = self.tell()
+        self.seek(offset)
+        text = self.readStringUTF()
+        self.seek(previous_offset)
+        return text
+
+    def readStringUTF(self):
+        text = ""
+        while True:
+            char = self.readUShort()
+            if char == 0:
+                break
+            else:
+                text += chr(char)
+        return text
+
+    def allign(self, size):
+        self.offset = (int((self.offset)/size)*size)+size
+
+    def tell(self):
+        return self.offset
+
+    def getSize(self):
+        return len(self.data)
@@ -0,0 +1,24 @@
+import numpy as np
+
+def make_schema(fields):
+    # Builds a packed numpy structured dtype from a list of (name, format)
+    # pairs, in file order. Fields named None are padding: they take space in
+    # the record but are not decoded.
+    names = []
+    formats = []
+    offsets = []
+    offset = 0
+    for name, field_format in fields:
+        field_dtype = np.dtype(field_format)
+        if name is not None:
+            names.append(name)
+            formats.append(field_dtype)
+            offsets.append(offset)
+        offset += field_dtype.itemsize
+    return np.dtype({"names":names, "formats":formats, "offsets":offsets, "itemsize":offset})
+
+def records_to_dicts(records):
+    # tolist() converts a whole table to python values in one go, array
+    # fields come out as lists
+    names = records.dtype.names
+    return [dict(zip(names, record)) for record in records.tolist()]
@@ -0,0 +1,62 @@
+import numpy as np
+import math
+
+# Map placements are Y-up, every instance gets this extra rotation (quaternion w, x, y, z)
+X_90_QUATERNION = np.array([math.cos(math.pi/4), math.sin(math.pi/4), 0.0, 0.0])
+
+def quaternion_multiply(a, b):
+    # Hamilton product of (N,4) w, x, y, z quaternions, a @ b
+    aw, ax, ay, az = np.moveaxis(np.asarray(a, dtype=np.float64), -1, 0)
+    bw, bx, by, bz = np.moveaxis(np.asarray(b, dtype=np.float64), -1, 0)
+    return np.stack([
+        aw*bw - ax*bx - ay*by - az*bz,
+        aw*bx + ax*bw + ay*bz - az*by,
+        aw*by - ax*bz + ay*bw + az*bx,
+        aw*bz + ax*by - ay*bx + az*bw,
+    ], axis=-1)
+
+def quaternion_to_matrix(quaternions):
+    # (N,4) w, x, y, z -> (N,3,3), quaternions are normalized first
+    q = np.asarray(quaternions, dtype=np.float64)
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    w, x, y, z = np.moveaxis(q, -1, 0)
+    return np.stack([
+        np.stack([1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)], axis=-1),
+        np.stack([2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)], axis=-1),
+        np.stack([2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)], axis=-1),
+    ], axis=-2)
+
+def quaternion_to_euler(quaternions):
+    # (N,4) w, x, y, z -> (N,3) XYZ euler angles in radians, same convention as Blender
+    matrices = quaternion_to_matrix(quaternions)
+    cy = np.hypot(matrices[:,0,0], matrices[:,1,0])
+    regular = cy > 16*np.finfo(np.float32).eps
+    eulers = np.empty((len(matrices), 3), dtype=np.float64)
+    eulers[:,0] = np.where(regular, np.arctan2(matrices[:,2,1], matrices[:,2,2]), np.arctan2(-matrices[:,1,2], matrices[:,1,1]))
+    eulers[:,1] = np.arctan2(-matrices[:,2,0], cy)
+    eulers[:,2] = np.where(regular, np.arctan2(matrices[:,1,0], matrices[:,0,0]), 0.0)
+    return eulers
+
+def convert_instance_transforms(positions, rotations, scales):
+    # Game placement (cm, Y-up, x y z w quaternions) to Blender (m, Z-up, w x y z quaternions)
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 4)
+    scales = np.asarray(scales, dtype=np.float64).reshape(-1, 3)
+    converted_positions = np.stack([positions[:,0], -positions[:,2], positions[:,1]], axis=-1) / 100.0
+    converted_rotations = quaternion_multiply(X_90_QUATERNION, rotations[:,[3, 0, 1, 2]])
+    converted_scales = scales / 100.0
+    return converted_positions, converted_rotations, converted_scales
+
+def euler_to_quaternion(eulers, degrees=False):
+    # (N,3) x y z euler angles (rotation applied in x, y, z order) -> (N,4) x y z w quaternions
+    eulers = np.asarray(eulers, dtype=np.float64).reshape(-1, 3)
+    if degrees:
+        eulers = np.radians(eulers)
+    cr, cp, cy = np.moveaxis(np.cos(eulers/2), -1, 0)
+    sr, sp, sy = np.moveaxis(np.sin(eulers/2), -1, 0)
+    return np.stack([
+        sr*cp*cy - cr*sp*sy,
+        cr*sp*cy + sr*cp*sy,
+        cr*cp*sy - sr*sp*cy,
+        cr*cp*cy + sr*sp*sy,
+    ], axis=-1)
@@ -7,24 +7,27 @@ import math
 
 from .bkipr_parser import BkiprParser
 from .ipr_parser import IprParser
-from ..common.object_loader import load_object_instances
+from ..common.instancing import load_instances
+from ..common.instance_batch import concatenate_batches
+from ..common.asset_index import get_asset_index
 
 logger = logging.getLogger("mhworld_import")
 
-def load_bkipr(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, import_material=True, use_png_cache=True, overwrite_png_cache=False):
+def load_bkipr(game_path, filepath, LOD=0, asset_cache=None, mesh_registry=None, import_material=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0, instancing_mode="OBJECTS"):
     parser = BkiprParser(path=filepath)
-    obj_instances, dependencies = parser.read()
+    _, dependencies = parser.read_batch()
     # Ugh
-    obj_instances = []
+    batches = []
+    asset_index = get_asset_index(game_path)
     for dependency in dependencies:
-        if os.path.exists(os.path.join(game_path, dependency + ".ipr")):
+        dependency_filepath = asset_index.resolve(dependency + ".ipr")
+        if dependency_filepath is not None:
             #print(os.path.join(game_path, dependency + ".ipr"))
-            parser_dep = IprParser(path=os.path.join(game_path, dependency + ".ipr"))
-            instances = parser_dep.read()
-            #print(len(instances))
-            obj_instances.extend(instances)
+            parser_dep = IprParser(path=dependency_filepath)
+            batches.append(parser_dep.read_batch())
         else:
             print("Dependency doesn't exists: ", os.path.join(game_path, dependency + ".ipr"))
+    obj_batch = concatenate_batches(batches)
 
     scn_name = os.path.basename(filepath)
     master_collection = bpy.context.scene.collection
@@ -37,9 +40,9 @@ def load_bkipr(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, import
 
     zone_names = []
     zone_collection_dict = {}
-    for obj_instance in obj_instances:
-        if obj_instance["zone"] not in zone_names:
-            zone_names.append(obj_instance["zone"])
+    for zone in obj_batch.zones:
+        if zone not in zone_names:
+            zone_names.append(zone)
     for zone_name in zone_names:
         zone_collection = bpy.data.collections.new(zone_name)
         scene_collection.children.link(zone_collection)
@@ -47,5 +50,5 @@ def load_bkipr(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, import
     #obj_instances = []
     #[obj_instances.append(x) for x in obj_instances_raw if x not in obj_instances]
 
-    return load_object_instances(obj_instances, scene_collection, game_path, LOD, mesh_cache, mesh_hashes, zone_collection_dict=zone_collection_dict, load_materials=import_material, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache)
+    return load_instances(obj_batch, scene_collection, game_path, LOD, asset_cache, mesh_registry, zone_collection_dict=zone_collection_dict, load_materials=import_material, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, max_texture_size=max_texture_size, instancing_mode=instancing_mode)
 
@@ -1,109 +1,36 @@
-import struct
 import os
 
 import logging
 logger = logging.getLogger("mhworld_import")
 
-class Reader():
-    def __init__(self, data):
-        self.offset = 0
-        self.data = data
-    
-    def read(self, kind, size):
-        result = struct.unpack(kind, self.data[self.offset:self.offset+size])[0]
-        self.offset += size
-        return result
-
-    def seek(self, offset, start = None):
-        if start is None:
-            self.offset = offset
-        else:
-            self.offset += offset
-
-    def readUInt(self):
-        return self.read("I", 4)
-    
-    def readInt(self):
-        return self.read("i", 4)
-        
-    def readUInt64(self):
-        return self.read("Q", 8)
-    
-    def readHalf(self):
-        return self.read("e", 2)
-
-    def readFloat(self):
-        return self.read("f", 4)
-
-    def readShort(self):
-        return self.read("h", 2)
-    
-    def readUShort(self):
-        return self.read("H", 2)
-
-    def readByte(self):
-        return self.read("b", 1)
-    
-    def readBytes(self, size):
-        return self.data[self.offset:self.offset + size]
-    
-    def readUByte(self):
-        return self.read("B", 1)
+from ..common.reader import Reader, read_file, closes_reader
+from ..common.schema import make_schema, records_to_dicts
+from .ipr_parser import read_instance_batch
 
-    def readString(self):
-        text = ""
-        while True:
-            char = self.readUByte()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-    
-    def readStringUTFAt(self, offset):
-        previous_offset = self.tell()
-        self.seek(offset)
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        self.seek(previous_offset)
-        return text
-
-    def readStringUTF(self):
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-
-    def allign(self, size):
-        self.offset = (int((self.offset)/size)*size)+size
-        
-    def tell(self):
-        return self.offset
-    
-    def getSize(self):
-        return len(self.data)
+BKIPR_OBJECT_INFO_SCHEMA = make_schema([
+    (None, "V32"),
+    ("object_path_offset", "<u8"),
+    ("object_offset", "<u8"),
+    (None, "V32"),
+    ("object_instance_offset", "<u8"),
+    (None, "V8"),
+    ("object_parenting_offset", "<u8"),
+    ("object_instance_count", "<u8"),
+    (None, "V16"),
+])
 
 class BkiprParser():
-    def __init__(self, path=None, data=None):
+    def __init__(self, path=None, data=None, use_mmap=True):
         self.path = path
         self.basename = None
         if data is None:
-            with open(path, "rb") as file_in:
-                data = file_in.read()
+            data = read_file(path, use_mmap=use_mmap)
             self.basename = os.path.splitext(os.path.basename(self.path))[0]
         self.bs = Reader(data)
         
     
-    def read(self):
+    def read_header(self):
+        self.bs.seek(0)
         self.magic = self.bs.readUInt()
 
         if self.magic != 1919969634:
@@ -122,62 +49,36 @@ class BkiprParser():
         object_info_offset = self.bs.readUInt64()
         object_info_counter = self.bs.readUInt64()
         
-        references_info_offset = self.bs.readUInt64()
-        references_info_counter = self.bs.readUInt64()
+        self.references_info_offset = self.bs.readUInt64()
+        self.references_info_counter = self.bs.readUInt64()
         
         self.bs.seek(object_info_offset)
-        object_infos = []
-        for object_info_i in range(object_info_counter):
-            object_info = {}
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            object_info["object_path_offset"] = self.bs.readUInt64()
-            object_info["object_offset"] = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            object_info["object_instance_offset"] = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            object_info["object_parenting_offset"] = self.bs.readUInt64()
-            object_info["object_instance_count"] = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            object_infos.append(object_info)
-        
-        object_instances = []
-        for object_info in object_infos[:]:
+        self.object_infos = records_to_dicts(self.bs.read_array(BKIPR_OBJECT_INFO_SCHEMA, object_info_counter))
+        self.object_paths = []
+        for object_info in self.object_infos:
             self.bs.seek(object_info["object_path_offset"])
-            object_path = self.bs.readString().replace("\\", "/")
-            self.bs.seek(object_info["object_instance_offset"])
-            for instance_i in range(object_info["object_instance_count"])[:]:
-                instance_data = {}
-                instance_data["path"] = object_path
-                object_instances.append(instance_data)
-                
-                if self.basename is not None:
-                    instance_data["zone"] = self.basename
-                else:
-                    instance_data["zone"] = "UNKNOWN"
-                instance_data["position"] = [self.bs.readFloat() for _ in range(3)]
-                instance_data["scale"] = [self.bs.readFloat() for _ in range(3)]
-                instance_data["rotation"] = [self.bs.readFloat() for _ in range(4)]
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
+            self.object_paths.append(self.bs.readString().replace("\\", "/"))
+
+        header = {}
+        header["object_count"] = len(self.object_infos)
+        header["object_paths"] = self.object_paths
+        header["instance_count"] = sum(object_info["object_instance_count"] for object_info in self.object_infos)
+        return header
 
+    @closes_reader
+    def read_batch(self):
+        self.read_header()
+        object_infos = self.object_infos
+        references_info_offset = self.references_info_offset
+        references_info_counter = self.references_info_counter
+
+        if self.basename is not None:
+            zone = self.basename
+        else:
+            zone = "UNKNOWN"
+        obj_batch = read_instance_batch(self.bs, object_infos, self.object_paths, zone)
+
+        dependencies = []
         if references_info_offset != 0:
             self.bs.seek(references_info_offset)
             reference_infos = []
@@ -188,7 +89,6 @@ class BkiprParser():
                 _ = self.bs.readUInt64()
                 reference_infos.append(reference_info)
             
-            dependencies = []
             for reference_info in reference_infos:
                 reference = {}
                 self.bs.seek(reference_info["reference_type_offset"])
@@ -202,7 +102,12 @@ class BkiprParser():
                     #object_instances.extend(parser.read())
                     dependencies.append(reference["reference_path"])
                 
-        return object_instances, dependencies
+        return obj_batch, dependencies
+
+    @closes_reader
+    def read(self):
+        obj_batch, dependencies = self.read_batch()
+        return obj_batch.to_instances(), dependencies
 
 if __name__ == "__main__":
     parser = BkiprParser(path="st101.bkipr")
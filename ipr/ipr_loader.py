@@ -6,13 +6,13 @@ import logging
 import math
 
 from .ipr_parser import IprParser
-from ..common.object_loader import load_object_instances
+from ..common.instancing import load_instances
 
 logger = logging.getLogger("mhworld_import")
 
-def load_ipr(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, import_material=True, use_png_cache=True, overwrite_png_cache=False):
+def load_ipr(game_path, filepath, LOD=0, asset_cache=None, mesh_registry=None, import_material=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0, instancing_mode="OBJECTS"):
     parser = IprParser(path=filepath)
-    obj_instances = parser.read()
+    obj_batch = parser.read_batch()
 
     scn_name = os.path.basename(filepath)
     master_collection = bpy.context.scene.collection
@@ -22,5 +22,5 @@ def load_ipr(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, import_m
     else:
         scene_collection = bpy.data.collections[scn_name]
 
-    return load_object_instances(obj_instances, scene_collection, game_path, LOD, mesh_cache, mesh_hashes, load_materials=import_material, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache)
+    return load_instances(obj_batch, scene_collection, game_path, LOD, asset_cache, mesh_registry, load_materials=import_material, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, max_texture_size=max_texture_size, instancing_mode=instancing_mode)
 
@@ -1,107 +1,55 @@
-import struct
 import os
+import numpy as np
 import logging
 logger = logging.getLogger("mhworld_import")
 
-class Reader():
-    def __init__(self, data):
-        self.offset = 0
-        self.data = data
-    
-    def read(self, kind, size):
-        result = struct.unpack(kind, self.data[self.offset:self.offset+size])[0]
-        self.offset += size
-        return result
+from ..common.reader import Reader, read_file, closes_reader
+from ..common.schema import make_schema, records_to_dicts
+from ..common.instance_batch import InstanceBatch
 
-    def seek(self, offset, start = None):
-        if start is None:
-            self.offset = offset
-        else:
-            self.offset += offset
+IPR_OBJECT_INFO_SCHEMA = make_schema([
+    (None, "V32"),
+    ("object_path_offset", "<u8"),
+    ("object_offset", "<u8"),
+    (None, "V32"),
+    ("object_instance_offset", "<u8"),
+    ("object_instance_count", "<u8"),
+    (None, "V32"),
+])
 
-    def readUInt(self):
-        return self.read("I", 4)
-    
-    def readInt(self):
-        return self.read("i", 4)
-        
-    def readUInt64(self):
-        return self.read("Q", 8)
-    
-    def readHalf(self):
-        return self.read("e", 2)
-
-    def readFloat(self):
-        return self.read("f", 4)
+# Shared with the bkipr files
+IPR_INSTANCE_SCHEMA = make_schema([
+    ("position", ("<f4", 3)),
+    ("scale", ("<f4", 3)),
+    ("rotation", ("<f4", 4)),
+    (None, "V104"),
+])
 
-    def readShort(self):
-        return self.read("h", 2)
-    
-    def readUShort(self):
-        return self.read("H", 2)
-
-    def readByte(self):
-        return self.read("b", 1)
-    
-    def readBytes(self, size):
-        return self.data[self.offset:self.offset + size]
-    
-    def readUByte(self):
-        return self.read("B", 1)
-
-    def readString(self):
-        text = ""
-        while True:
-            char = self.readUByte()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-    
-    def readStringUTFAt(self, offset):
-        previous_offset = self.tell()
-        self.seek(offset)
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        self.seek(previous_offset)
-        return text
-
-    def readStringUTF(self):
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-
-    def allign(self, size):
-        self.offset = (int((self.offset)/size)*size)+size
-        
-    def tell(self):
-        return self.offset
-    
-    def getSize(self):
-        return len(self.data)
+def read_instance_batch(bs, object_infos, object_paths, zone):
+    # Placement tables of every object, concatenated without going through python lists
+    instance_tables = []
+    paths = []
+    for object_info, object_path in zip(object_infos, object_paths):
+        bs.seek(object_info["object_instance_offset"])
+        instance_tables.append(bs.read_array(IPR_INSTANCE_SCHEMA, object_info["object_instance_count"]))
+        paths.extend([object_path] * object_info["object_instance_count"])
+    if len(instance_tables):
+        instances = np.concatenate(instance_tables)
+    else:
+        instances = np.zeros(0, dtype=IPR_INSTANCE_SCHEMA)
+    return InstanceBatch(instances["position"], instances["rotation"], instances["scale"], paths, [zone] * len(paths))
 
 class IprParser():
-    def __init__(self, path=None, data=None):
+    def __init__(self, path=None, data=None, use_mmap=True):
         self.path = path
         self.basename = None
         if data is None:
-            with open(path, "rb") as file_in:
-                data = file_in.read()
+            data = read_file(path, use_mmap=use_mmap)
             self.basename = os.path.basename(self.path)
         self.bs = Reader(data)
     
-    def read(self):
+    def read_header(self):
+        self.bs.seek(0)
         #print("AAA")
         self.magic = self.bs.readUInt()
         #print("BBB")
@@ -126,59 +74,30 @@ class IprParser():
         references_info_counter = self.bs.readUInt64()
         
         self.bs.seek(object_info_offset)
-        object_infos = []
-        for object_info_i in range(object_info_counter):
-            object_info = {}
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            object_info["object_path_offset"] = self.bs.readUInt64()
-            object_info["object_offset"] = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            object_info["object_instance_offset"] = self.bs.readUInt64()
-            object_info["object_instance_count"] = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            _ = self.bs.readUInt64()
-            object_infos.append(object_info)
-        
-        object_instances = []
-        for object_info in object_infos[:]:
+        self.object_infos = records_to_dicts(self.bs.read_array(IPR_OBJECT_INFO_SCHEMA, object_info_counter))
+        self.object_paths = []
+        for object_info in self.object_infos:
             self.bs.seek(object_info["object_path_offset"])
-            object_path = self.bs.readString().replace("\\", "/")
-            self.bs.seek(object_info["object_instance_offset"])
-            for instance_i in range(object_info["object_instance_count"])[:]:
-                instance_data = {}
-                instance_data["path"] = object_path
-                
-                if self.basename is not None:
-                    instance_data["zone"] = self.basename
-                else:
-                    instance_data["zone"] = "UNKNOWN"
-                instance_data["position"] = [self.bs.readFloat() for _ in range(3)]
-                instance_data["scale"] = [self.bs.readFloat() for _ in range(3)]
-                instance_data["rotation"] = [self.bs.readFloat() for _ in range(4)]
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                _ = self.bs.readUInt64()
-                object_instances.append(instance_data)
+            self.object_paths.append(self.bs.readString().replace("\\", "/"))
+
+        header = {}
+        header["object_count"] = len(self.object_infos)
+        header["object_paths"] = self.object_paths
+        header["instance_count"] = sum(object_info["object_instance_count"] for object_info in self.object_infos)
+        return header
 
-        return object_instances
+    @closes_reader
+    def read_batch(self):
+        self.read_header()
+        if self.basename is not None:
+            zone = self.basename
+        else:
+            zone = "UNKNOWN"
+        return read_instance_batch(self.bs, self.object_infos, self.object_paths, zone)
+
+    @closes_reader
+    def read(self):
+        return self.read_batch().to_instances()
 
 if __name__ == "__main__":
     parser = IprParser(path="./st101.bkipr")
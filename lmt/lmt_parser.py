@@ -1,4 +1,3 @@
-import struct
 import codecs
 import json
 import zlib
@@ -9,157 +8,45 @@ import numpy as np
 import logging
 logger = logging.getLogger("mhworld_import")
 
-class Reader():
-    def __init__(self, data):
-        self.offset = 0
-        self.data = data
-        self.partial_offset = 0
-        self.partial_data = None
-
-    def read(self, kind, size):
-        result = struct.unpack(kind, self.data[self.offset:self.offset+size])[0]
-        self.offset += size
-        return result
-
-    def seek(self, offset, start = None):
-        if start is None:
-            self.offset = offset
-        else:
-            self.offset += offset
-
-    def readUInt(self):
-        return self.read("I", 4)
-
-    def readInt(self):
-        return self.read("i", 4)
-
-    def readUInt64(self):
-        return self.read("Q", 8)
-
-    def readHalf(self):
-        return self.read("e", 2)
-
-    def readFloat(self):
-        return self.read("f", 4)
-
-    def readShort(self):
-        return self.read("h", 2)
-
-    def readUShort(self):
-        return self.read("H", 2)
-
-    def readByte(self):
-        return self.read("b", 1)
-
-    def readBytes(self, size):
-        return self.data[self.offset:self.offset + size]
-
-    # this function will definitelly stop working if you look at it too hard
-    def readBytes_unpackbin(self, bits, block_size, signed=False):
-        value = 0
-        remaining_bits = bits
-        movement = min(remaining_bits, block_size)
-        while True:
-            if self.partial_offset == 0:
-                if block_size == 8:
-                    self.partial_data = self.readUByte()
-                elif block_size == 16:
-                    self.partial_data = self.readUShort()
-                elif block_size == 32:
-                    self.partial_data = self.readUInt()
-                elif block_size == 64:
-                    self.partial_data = self.readUInt64()
-            movement = min(remaining_bits, block_size-self.partial_offset)
-            value = value << movement
-            value = value | (self.partial_data & ((2**movement)-1))
-            self.partial_data = self.partial_data >> movement
-            remaining_bits -= movement
-            self.partial_offset = (self.partial_offset + movement)%block_size
-            movement = min(remaining_bits, block_size)
-            
-            if remaining_bits == 0:
-                if signed == True:
-                    maxval = ((1 << bits) - 1)
-                    if value > (maxval >> 1):
-                        value -= maxval
-                    value = value / (maxval >> 1)
-                return value
-
-    def readBytes_to_int(self, size):
-        self.readUByte()
-        value = int.from_bytes(self.readBytes(size), byteorder='little')
-        self.offset += size
-        return value
-
-    def readUByte(self):
-        return self.read("B", 1)
-
-    def readString(self):
-        text = ""
-        while True:
-            char = self.readUByte()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-
-    def readStringUTFAt(self, offset):
-        previous_offset = self.tell()
-        self.seek(offset)
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        self.seek(previous_offset)
-        return text
-
-    def readStringUTF(self):
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-
-    def allign(self, size):
-        self.offset = (int((self.offset)/size)*size)+size
-
-    def tell(self):
-        return self.offset
-
-    def getSize(self):
-        return len(self.data)
+from ..common.reader import Reader, read_file, closes_reader
 
 class LmtParser():
-    def __init__(self, path=None, data=None):
+    def __init__(self, path=None, data=None, use_mmap=True):
         self.path = path
         self.basename = ""
         if data is None:
-            with open(path, "rb") as file_in:
-                data = file_in.read()
+            data = read_file(path, use_mmap=use_mmap)
             self.basename = os.path.splitext(os.path.basename(self.path))[0]
         self.bs = Reader(data)
 
-    def read(self):
+    def read_header(self):
+        # Only touches the animation offset table and each animation's track count
+        self.bs.seek(0)
         self.magic = self.bs.readUInt()
         self.version = self.bs.readUShort()
         if self.magic != 5524812 and self.version != 95:
             raise RuntimeError(str(self.path) + " is not a mhworld lmt file (magic = " + str(self.magic) + ", version = " + str(self.version) + ")")
-        
+
         animation_count = self.bs.readUShort()
         _ = self.bs.readUInt64()
-        
-        animations_info_offsets = []
-        for count_i in range(animation_count):
-            animations_info_offsets.append(self.bs.readUInt64())
-        #print(animation_count)
-        
+        self.animations_info_offsets = self.bs.read_array("<u8", animation_count).tolist()
+
+        track_counts = {}
+        for animations_info_offset_i, animations_info_offset in enumerate(self.animations_info_offsets):
+            if animations_info_offset == 0:
+                continue
+            self.bs.seek(animations_info_offset + 8)
+            track_counts[animations_info_offset_i] = self.bs.readUInt()
+        return {
+            "animation_count":len(track_counts),
+            "track_counts":track_counts,
+        }
+
+    @closes_reader
+    def read(self):
+        self.read_header()
+        animations_info_offsets = self.animations_info_offsets
+
         animations_infos = []
         for animations_info_offset_i, animations_info_offset in enumerate(animations_info_offsets):
             #print("animations_info_offset_i", animations_info_offset_i)
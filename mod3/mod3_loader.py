@@ -4,16 +4,144 @@ from mathutils import Vector, Matrix, Euler
 import os
 import logging
 import math
+import numpy as np
 
 from .mod3_parser import Mod3Parser
 from ..common.bone_rename import bone_rename
 
 logger = logging.getLogger("mhworld_import")
 
-def load_mod3(filepath, collection=None, LOD=0, fix_rotation=False, fix_scale=False, obj_name="", obj_overload={}, rename_bones=False, connect_bones=False):
+def get_bone_order(armature_datas):
+    # Bone indices with every parent before its children. That's the file
+    # order in practice, anything else is sorted out here.
+    bone_count = len(armature_datas)
+    parents = [bone_info.parent for bone_info in armature_datas]
+    for bone_i, parent in enumerate(parents):
+        if parent != 255 and (parent >= bone_count or parent == bone_i):
+            raise RuntimeError("Invalid parent for bone " + str(bone_i) + " (parent = " + str(parent) + ", bone count = " + str(bone_count) + ")")
+    if all(parent == 255 or parent < bone_i for bone_i, parent in enumerate(parents)):
+        return list(range(bone_count))
+    children = [[] for _ in range(bone_count)]
+    for bone_i, parent in enumerate(parents):
+        if parent != 255:
+            children[parent].append(bone_i)
+    order = [bone_i for bone_i, parent in enumerate(parents) if parent == 255]
+    for bone_i in order:
+        order.extend(children[bone_i])
+    if len(order) != bone_count:
+        raise RuntimeError("The bone hierarchy has a cycle")
+    return order
+
+def compute_bone_layout(armature_datas, connect_bones=False):
+    # Edit bone world matrices and tails, computed up front so the armature
+    # can be built in one edit mode session. Matrices use the column vector
+    # convention and are orthonormalised, like an edit bone's matrix.
+    bone_count = len(armature_datas)
+    bone_order = get_bone_order(armature_datas)
+    world_matrices = np.empty((bone_count, 4, 4), dtype=np.float64)
+    for bone_i in bone_order:
+        bone_info = armature_datas[bone_i]
+        local_matrix = bone_info.local_matrix.T.astype(np.float64)
+        if bone_info.parent != 255:
+            world_matrix = world_matrices[bone_info.parent] @ local_matrix
+        else:
+            world_matrix = local_matrix
+        world_matrix[:3,:3] /= np.linalg.norm(world_matrix[:3,:3], axis=0)
+        world_matrices[bone_i] = world_matrix
+
+    heads = world_matrices[:,:3,3]
+    y_axes = world_matrices[:,:3,1]
+    tails = heads + y_axes*100.0
+    for bone_i, bone_info in enumerate(armature_datas):
+        if bone_info.length > 0.01:
+            tails[bone_i] = heads[bone_i] + y_axes[bone_i]*100.0*bone_info.length*0.01
+
+    if connect_bones:
+        children = [[] for _ in range(bone_count)]
+        for bone_i, bone_info in enumerate(armature_datas):
+            if bone_info.parent != 255:
+                children[bone_info.parent].append(bone_i)
+        descendant_counts = [1]*bone_count
+        for bone_i in reversed(bone_order):
+            parent = armature_datas[bone_i].parent
+            if parent != 255:
+                descendant_counts[parent] += descendant_counts[bone_i]
+
+        # Parents first, leaves look at their parent's final tail
+        for bone_i in bone_order:
+            bone_info = armature_datas[bone_i]
+            head = heads[bone_i]
+            if len(children[bone_i]) == 1:
+                child = children[bone_i][0]
+                if np.linalg.norm(heads[child]-head) > 0.0001:
+                    tails[bone_i] = heads[child]
+            elif len(children[bone_i]) == 0:
+                # Top level bones are parented to the root bone, which points along +Y
+                if bone_info.parent != 255:
+                    parent_vector = tails[bone_info.parent] - heads[bone_info.parent]
+                else:
+                    parent_vector = np.array([0.0, 100.0, 0.0])
+                parent_length = np.linalg.norm(parent_vector)
+                if parent_length > 0.0:
+                    parent_vector = parent_vector / parent_length
+                tails[bone_i] = head + parent_vector*np.linalg.norm(head-tails[bone_i])
+            else:
+                best_child = None
+                best_child_score = 0
+                for child in children[bone_i]:
+                    if abs(head[0]) < 0.0001 and abs(heads[child][0]) > 0.0001:
+                        continue
+                    if np.linalg.norm(heads[child]-head) > 0.0001:
+                        if descendant_counts[child] > best_child_score:
+                            best_child = child
+                            best_child_score = descendant_counts[child]
+                if best_child is not None:
+                    tails[bone_i] = heads[best_child]
+    return world_matrices, tails
+
+def bucket_weights(weights_bones, weights_values):
+    # Turns the (N,k) bone/weight matrices into (bone, vertices, weight)
+    # buckets, so a vertex group gets one add() call per distinct weight
+    # instead of one per vertex. Influences of the same vertex on the same
+    # bone are summed first, like successive 'ADD' calls would.
+    vertex_count, influence_count = weights_bones.shape
+    vertex_indices = np.repeat(np.arange(vertex_count, dtype=np.int64), influence_count)
+    bone_indices = weights_bones.ravel().astype(np.int64)
+    weight_values = weights_values.ravel()
+    used = weight_values != 0.0
+    keys = (bone_indices[used] + 1) * vertex_count + vertex_indices[used]
+    keys, inverse = np.unique(keys, return_inverse=True)
+    summed = np.bincount(inverse.ravel(), weights=weight_values[used]).astype(np.float32)
+    key_bones = keys // vertex_count - 1
+    key_vertices = keys % vertex_count
+
+    order = np.lexsort((summed, key_bones))
+    key_bones = key_bones[order]
+    summed = summed[order]
+    key_vertices = key_vertices[order]
+    breaks = np.nonzero((np.diff(key_bones) != 0) | (np.diff(summed) != 0))[0] + 1
+    starts = [0] + breaks.tolist()
+    ends = breaks.tolist() + [len(key_bones)]
+    buckets = []
+    for start, end in zip(starts, ends):
+        if start == end:
+            continue
+        buckets.append((int(key_bones[start]), key_vertices[start:end].tolist(), float(summed[start])))
+    return buckets
+
+def load_mod3(filepath, collection=None, LOD=0, fix_rotation=False, fix_scale=False, obj_name="", obj_overload=None, rename_bones=False, connect_bones=False, mesh_registry=None, asset_cache=None):
+    if obj_overload is None:
+        obj_overload = {}
     #print(filepath)
-    parser = Mod3Parser(path=filepath)
-    armature_datas, mesh_datas = parser.read()
+    parsed = None
+    if asset_cache is not None:
+        parsed = asset_cache.get("mod3", (filepath, LOD))
+    if parsed is None:
+        parser = Mod3Parser(path=filepath)
+        parsed = parser.read(lod=LOD)
+        if asset_cache is not None:
+            asset_cache.put("mod3", (filepath, LOD), parsed)
+    armature_datas, mesh_datas = parsed
 
     file_name = os.path.basename(filepath)
     file_sname = file_name.split(".")
@@ -47,108 +175,94 @@ def load_mod3(filepath, collection=None, LOD=0, fix_rotation=False, fix_scale=Fa
         if rename_bones:
             armature_data["renamed_bones"] = True
 
+        bone_names = []
+        for bone_info in armature_datas:
+            bone_raw_name = "bone_" + str(bone_info.remap).zfill(3)
+            if rename_bones and bone_raw_name in bone_rename.keys():
+                bone_names.append(bone_rename[bone_raw_name])
+            else:
+                bone_names.append(bone_raw_name)
+                #print("MISSING BONE: ", str(bone_raw_name))
+        world_matrices, tails = compute_bone_layout(armature_datas, connect_bones)
+
+        # Single edit mode session: every bone gets its final matrix and tail
         bpy.context.view_layer.objects.active = armature_object
         bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-        remap_dict = {}
         root_bone = armature_data.edit_bones.new("bone_root")
         root_bone.head = (0.0, 0.0, 0.0)
         root_bone.tail = (0.0, 100.0, 0.0)
+        new_bones = []
         for bone_i, bone_info in enumerate(armature_datas):
-            bone_raw_name = "bone_" + str(bone_info["remap"]).zfill(3)
-            if rename_bones and bone_raw_name in bone_rename.keys():
-                bone_name = bone_rename[bone_raw_name]
-            else:
-                bone_name = bone_raw_name
-                #print("MISSING BONE: ", str(bone_raw_name))
-            new_bone = armature_data.edit_bones.new(bone_name)
-            remap_dict[bone_info["id"]] = bone_info["remap"]
-            local_matrix = Matrix(bone_info["local_matrix"])
-            local_matrix.transpose()
-            global_matrix = Matrix(bone_info["global_matrix"])
-            global_matrix.transpose()
+            new_bone = armature_data.edit_bones.new(bone_names[bone_i])
+            # The matrix setter keeps the current length, set the final tail afterwards
             new_bone.head = (0.0, 0.0, 0.0)
-            new_bone.tail = (bone_info["x"], bone_info["y"], bone_info["z"])
-            #if Vector([bone_info["x"], bone_info["y"], bone_info["z"]]).length < 0.001:
             new_bone.tail = (0.0, 100.0, 0.0)
-
-            if bone_info["parent"] != 255:
-                bone_parent_raw_name = "bone_" + str(remap_dict[bone_info["parent"]]).zfill(3)
-                if rename_bones and bone_parent_raw_name in bone_rename.keys():
-                    bone_parent_name = bone_rename[bone_parent_raw_name]
-                else:
-                    bone_parent_name = bone_parent_raw_name
-                new_bone.parent = armature_data.edit_bones[bone_parent_name]
-                new_bone.matrix = new_bone.parent.matrix @ local_matrix
-            else:
-                new_bone.parent = root_bone
-                new_bone.matrix = new_bone.matrix @ local_matrix
+            new_bone.matrix = Matrix(world_matrices[bone_i].tolist())
+            new_bone.tail = tails[bone_i].tolist()
             new_bone.inherit_scale = "NONE"
-
+            new_bones.append(new_bone)
+        for bone_i, bone_info in enumerate(armature_datas):
+            if bone_info.parent != 255:
+                new_bones[bone_i].parent = new_bones[bone_info.parent]
+            else:
+                new_bones[bone_i].parent = root_bone
         bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-        for bone in armature_data.bones:
-            if bone.parent is not None:
-                #inter_bone_rot_diff =
-                bone["baserots"] = bone.matrix.inverted().to_quaternion()
-                bone["baseposs"] = (bone.parent.matrix_local.inverted() @ bone.matrix_local).to_translation()
-        bpy.ops.object.mode_set(mode='EDIT', toggle=False)
 
+        # Rest pose relative to the parent, before the tails were moved
         for bone_i, bone_info in enumerate(armature_datas):
-            bone_raw_name = "bone_" + str(bone_info["remap"]).zfill(3)
-            if rename_bones and bone_raw_name in bone_rename.keys():
-                bone_name = bone_rename[bone_raw_name]
+            if bone_info.parent != 255:
+                parent_matrix = world_matrices[bone_info.parent]
             else:
-                bone_name = bone_raw_name
-            new_bone = armature_data.edit_bones[bone_name]
-            if bone_info["length"] > 0.01:
-                new_bone.tail = new_bone.head + (new_bone.tail-new_bone.head)*bone_info["length"]*0.01
-
-
-
+                parent_matrix = np.identity(4)
+            relative_matrix = np.linalg.inv(parent_matrix) @ world_matrices[bone_i]
+            bone = armature_data.bones[bone_names[bone_i]]
+            bone["baserots"] = Matrix(np.linalg.inv(relative_matrix[:3,:3]).tolist()).to_quaternion()
+            bone["baseposs"] = relative_matrix[:3,3].tolist()
 
-            if connect_bones:
-                if new_bone.children is not None:
-                    if len(new_bone.children) == 1 and (new_bone.children[0].head-new_bone.head).length > 0.0001:
-                        new_bone.tail = new_bone.children[0].head
-                    elif len(new_bone.children) == 0:
-                        if new_bone.parent is not None:
-                            parent_vector = new_bone.parent.tail - new_bone.parent.head
-                            new_bone.tail = new_bone.head + (parent_vector.normalized()*(new_bone.head-new_bone.tail).length)
-                    elif len(new_bone.children) > 1:
-                        def recursive_seek_children(bone):
-                            return 1+sum([recursive_seek_children(child) for child in bone.children])
-                        best_child = None
-                        best_child_score = 0
-                        for child in new_bone.children:
-                            if abs(new_bone.head.x) < 0.0001 and abs(child.head.x) > 0.0001:
-                                continue
-                            if (child.head-new_bone.head).length > 0.0001:
-                                child_amount = recursive_seek_children(child)
-                                if child_amount > best_child_score:
-                                    best_child = child
-                                    best_child_score = child_amount
-                        if best_child is not None:
-                            new_bone.tail = best_child.head
-
-
-
-
-        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
         returned_objects.append(armature_object)
 
     for mesh_data in mesh_datas:
-        if mesh_data["lod"] == LOD:
-            mesh_prefix = "LOD" + str(LOD) + "_G" + str(mesh_data["group"]) + "_I" + str(mesh_data["id"])
+        if mesh_data.lod == LOD:
+            mesh_prefix = "LOD" + str(LOD) + "_G" + str(mesh_data.group) + "_I" + str(mesh_data.id)
             if obj_name != "":
                 meshName = mesh_prefix + "_" + obj_name
             else:
                 meshName = mesh_prefix + "_" + file_name
-            mesh = bpy.data.meshes.new(meshName)  # add the new mesh
-            obj = bpy.data.objects.new(mesh.name, mesh)
+
+            # Identical meshes (same model placed under another name, ...) share
+            # a single datablock, found before anything is created
+            content_hash = mesh_data.content_hash()
+            mesh = None
+            if mesh_registry is not None:
+                mesh = mesh_registry.get(content_hash)
+            is_new_mesh = mesh is None
+            if is_new_mesh:
+                mesh = bpy.data.meshes.new(meshName)  # add the new mesh
+                mesh["content_hash"] = content_hash
+                obj = bpy.data.objects.new(mesh.name, mesh)
+            else:
+                obj = bpy.data.objects.new(meshName, mesh)
             col.objects.link(obj)
             obj.rotation_mode = "XYZ"
             if fix_scale and (armature_datas is None or len(armature_datas) == 0):
                 obj.scale *= Vector([0.01,0.01,0.01])
-            mesh.from_pydata(mesh_data["positions"], [], mesh_data["faces"])
+            faces = mesh_data.faces
+            if is_new_mesh:
+                positions = mesh_data.positions
+                mesh.vertices.add(len(positions))
+                mesh.vertices.foreach_set("co", positions.ravel())
+                mesh.loops.add(faces.size)
+                # foreach_set only takes the buffer directly for signed ints
+                mesh.loops.foreach_set("vertex_index", faces.astype(np.int32).ravel())
+                mesh.polygons.add(len(faces))
+                mesh.polygons.foreach_set("loop_start", np.arange(0, faces.size, 3, dtype=np.int32))
+                # Read-only (and computed from loop_start) in recent versions
+                if not mesh.polygons.bl_rna.properties["loop_total"].is_readonly:
+                    mesh.polygons.foreach_set("loop_total", np.full(len(faces), 3, dtype=np.int32))
+                mesh.update(calc_edges=True)
+                # Registered once built, with the counts it is checked against
+                if mesh_registry is not None:
+                    mesh_registry.add(mesh, content_hash)
 
             if armature_object is not None:
                 obj.parent = armature_object
@@ -158,7 +272,7 @@ def load_mod3(filepath, collection=None, LOD=0, fix_rotation=False, fix_scale=Fa
                 if fix_rotation:
                     obj.rotation_euler.rotate(Euler([math.radians(90),0,0]))
 
-            material_name = obj_name + mesh_data["material"]
+            material_name = obj_name + mesh_data.material
 
             if "material_suffix" in obj_overload.keys():
                 material_name += obj_overload["material_suffix"]
@@ -173,66 +287,69 @@ def load_mod3(filepath, collection=None, LOD=0, fix_rotation=False, fix_scale=Fa
                 mat = bpy.data.materials.new(name=material_name)
             else:
                 mat = bpy.data.materials[material_name]
-            mat["original_name"] = mesh_data["material"]
-            #print(mesh_data["material_name_hash"])
-            mat["name_hash"] = str(mesh_data["material_name_hash"])
-            mesh.materials.append(mat)
+            mat["original_name"] = mesh_data.material
+            #print(mesh_data.material_name_hash)
+            mat["name_hash"] = str(mesh_data.material_name_hash)
+            if len(mesh.materials) == 0:
+                mesh.materials.append(mat)
             mat_slot = obj.material_slots[0]
             mat_slot.link = 'OBJECT'
             mat_slot.material = mat
 
             bpy.context.view_layer.objects.active = obj
 
-            if hasattr(mesh, 'create_normals_split'):
-                mesh.create_normals_split()
-            mesh.polygons.foreach_set("use_smooth", [True]*len(mesh.polygons))
-            mesh.normals_split_custom_set_from_vertices(mesh_data["normals"])
-            if hasattr(mesh, 'use_auto_smooth'):
-                mesh.use_auto_smooth = True
-            if hasattr(mesh, 'free_normals_split'):
-                mesh.free_normals_split()
-
-            if "weights_names" in mesh_data.keys() and "weights_values" in mesh_data.keys():
-                used_bones = []
-                for vert_weight_name in mesh_data["weights_names"]:
-                    for weight_name_raw in vert_weight_name:
-                        if rename_bones and weight_name_raw in bone_rename.keys():
-                            weight_name = bone_rename[weight_name_raw]
-                        else:
-                            weight_name = weight_name_raw
-                        if weight_name not in used_bones:
-                            used_bones.append(weight_name)
+            if is_new_mesh:
+                if hasattr(mesh, 'create_normals_split'):
+                    mesh.create_normals_split()
+                mesh.polygons.foreach_set("use_smooth", np.ones(len(mesh.polygons), dtype=bool))
+                mesh.normals_split_custom_set_from_vertices(mesh_data.normals)
+                if hasattr(mesh, 'use_auto_smooth'):
+                    mesh.use_auto_smooth = True
+                if hasattr(mesh, 'free_normals_split'):
+                    mesh.free_normals_split()
+
+            if mesh_data.weights_bones is not None and mesh_data.weights_values is not None:
+                weights_bones = mesh_data.weights_bones
+                # Names are resolved once per bone, groups are created in order
+                # of first use. The weights live in the mesh, a shared mesh only
+                # needs the groups to exist on the object.
+                flat_bones = weights_bones.ravel()
+                _, first_uses = np.unique(flat_bones, return_index=True)
                 vertex_weight_dict = {}
-                for bone_name in used_bones:
-                    vertex_weight_dict[bone_name] = obj.vertex_groups.new(name=bone_name)
-                for vertice, weights_name, weights_value in zip(mesh.vertices, mesh_data["weights_names"], mesh_data["weights_values"]):
-                    for weight_name_raw, weight_value in zip(weights_name, weights_value):
-                        if rename_bones and weight_name_raw in bone_rename.keys():
-                            weight_name = bone_rename[weight_name_raw]
-                        else:
-                            weight_name = weight_name_raw
-                        if weight_value != 0.0:
-                            vertex_weight_dict[weight_name].add([vertice.index], weight_value, 'ADD')
-
-            if "UVs" in mesh_data.keys():
-                #print(mesh_data["UVs"][0][0])
-                #print(mesh_data["UVs"][1][0])
-                for UV_i, UV in enumerate(mesh_data["UVs"]):
+                for bone_index in flat_bones[np.sort(first_uses)].tolist():
+                    if bone_index < 0:
+                        weight_name_raw = "bone_err"
+                    else:
+                        weight_name_raw = "bone_" + str(bone_index).zfill(3)
+                    if rename_bones and weight_name_raw in bone_rename.keys():
+                        weight_name = bone_rename[weight_name_raw]
+                    else:
+                        weight_name = weight_name_raw
+                    if weight_name not in obj.vertex_groups:
+                        obj.vertex_groups.new(name=weight_name)
+                    vertex_weight_dict[bone_index] = obj.vertex_groups[weight_name]
+                if is_new_mesh:
+                    for bone_index, vertex_indices, weight_value in bucket_weights(weights_bones, mesh_data.weights_values):
+                        vertex_weight_dict[bone_index].add(vertex_indices, weight_value, 'REPLACE')
+
+            if is_new_mesh:
+                # Loops were created in face order, so per corner values are a
+                # single gather on the face indices
+                corner_vertices = faces.ravel()
+                for UV_i, UV in enumerate(mesh_data.UVs):
                     uv_layer = mesh.uv_layers.new(name='UV' + str(UV_i+1))
-                    for face in mesh.polygons:
-                        for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
-                            uv_layer.data[loop_idx].uv = UV[vert_idx]
-
-            if "colors" in mesh_data.keys():
-                color_layer = mesh.color_attributes.new(
-                    name="Attribute",
-                    type='BYTE_COLOR',
-                    domain='CORNER',
-                )
-                color_layer.name = "Attribute"
-                for face in mesh.polygons:
-                    for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
-                        color_layer.data[loop_idx].color = [x/255.0 for x in mesh_data["colors"][vert_idx]]
+                    uv_layer.data.foreach_set("uv", UV[corner_vertices].ravel())
+
+                if mesh_data.colors is not None:
+                    color_layer = mesh.color_attributes.new(
+                        name="Attribute",
+                        type='BYTE_COLOR',
+                        domain='CORNER',
+                    )
+                    color_layer.name = "Attribute"
+                    corner_colors = mesh_data.colors[corner_vertices].astype(np.float32)
+                    corner_colors /= 255.0
+                    color_layer.data.foreach_set("color", corner_colors.ravel())
 
             returned_objects.append(obj)
 
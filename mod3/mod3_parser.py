@@ -1,7 +1,7 @@
-import struct
 import codecs
 import json
 import zlib
+import hashlib
 from glob import glob
 import os
 import math
@@ -9,125 +9,246 @@ import numpy as np
 import logging
 logger = logging.getLogger("mhworld_import")
 
-class Reader():
-    def __init__(self, data):
-        self.offset = 0
-        self.data = data
-
-    def read(self, kind, size):
-        result = struct.unpack(kind, self.data[self.offset:self.offset+size])[0]
-        self.offset += size
-        return result
-
-    def seek(self, offset, start = None):
-        if start is None:
-            self.offset = offset
-        else:
-            self.offset += offset
-
-    def readUInt(self):
-        return self.read("I", 4)
-
-    def readInt(self):
-        return self.read("i", 4)
-
-    def readUInt64(self):
-        return self.read("Q", 8)
-
-    def readHalf(self):
-        return self.read("e", 2)
-
-    def readFloat(self):
-        return self.read("f", 4)
-
-    def readShort(self):
-        return self.read("h", 2)
-
-    def readUShort(self):
-        return self.read("H", 2)
-
-    def readByte(self):
-        return self.read("b", 1)
-
-    def readBytes(self, size):
-        return self.data[self.offset:self.offset + size]
-
-    def readUByte(self):
-        return self.read("B", 1)
-
-    def readString(self):
-        text = ""
-        while True:
-            char = self.readUByte()
-            if char == 0:
-                break
+from ..common.reader import Reader, read_file, closes_reader
+from ..common.schema import make_schema, records_to_dicts
+
+MOD3_HEADER_SCHEMA = make_schema([
+    ("magic", "<u4"),
+    ("version", "<u2"),
+    ("bone_count", "<u2"),
+    ("mesh_count", "<u2"),
+    ("mat_count", "<u2"),
+    ("vert_count", "<u4"),
+    ("face_count", "<u4"),
+    ("edge_count", "<u4"),
+    ("vbuffer_size", "<u8"),
+    ("group_count", "<u8"),
+    ("timestamp", "<u8"),
+    ("bone_offset", "<u8"),
+    ("group_offset", "<u8"),
+    ("matname_offset", "<u8"),
+    ("mesh_offset", "<u8"),
+    ("vert_offset", "<u8"),
+    ("face_offset", "<u8"),
+    (None, "V16"),
+])
+
+# Grabbed from the previous importer by asteriskampersand, those were hard to figure out
+MOD3_MESH_INFO_SCHEMA = make_schema([
+    ("shadow_flag", "<u2"),
+    ("vert_count", "<u2"),
+    ("visibleCondition", "<u2"),
+    ("materialIdx", "<u2"),
+    ("lod_mask", "<u4"),
+    ("weightDynamics", "<u2"),
+    ("blockSize", "u1"),
+    ("unkn3", "u1"),
+    ("vertexSub", "<u4"),
+    ("vertexOffset", "<u4"),
+    ("blocktype", "<u4"),
+    ("faceOffset", "<u4"),
+    ("faceCount", "<u4"),
+    ("vertexBase", "<u4"),
+    (None, "V1"),
+    ("boundingBoxCount", "u1"),
+    ("unknownIndex", "<u2"),
+    ("vertexSubMirror", "<u2"),
+    ("vertexIndexSub", "<u2"),
+    ("mapData_1", "<u2"),
+    ("mapData_2", "<u2"),
+    (None, "V4"),
+    ("intUnknown", "<u4"),
+    ("vertexSubTotal", "<u4"),
+    (None, "V16"),
+])
+
+MOD3_BONE_SCHEMA = make_schema([
+    ("function", "<u2"),
+    ("parent", "u1"),
+    ("child", "u1"),
+    ("float1", "<f4"),
+    ("length", "<f4"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("z", "<f4"),
+])
+
+# blocktype -> (UV channel count, weight bytes, has vertex color)
+MOD3_BLOCK_TYPES = {
+    2807493369:(1, 0, False),
+    2769308832:(2, 0, False),
+    3282830241:(3, 0, True),
+    3379104440:(4, 0, True),
+    2173240540:(1, 0, True),
+    252052287:(2, 0, True),
+    4130816028:(1, 4, False),
+    4101111365:(2, 4, False),
+    1014171488:(1, 4, True),
+    3002859651:(2, 4, True),
+    2180350055:(1, 8, False),
+    2209562174:(2, 8, False),
+    912889255:(1, 8, True),
+    3102118468:(2, 8, True),
+}
+
+# weightDynamics -> ((shift, bits) of each packed weight, whether the last
+# weight is implied as 1 - sum of the others). Every weight is stored /1023,
+# even the 8 bit ones. 1 and 5 have no weights.
+_WEIGHTS_8_BYTES = ([(0, 10), (10, 10), (20, 10), (32, 8), (40, 8), (48, 8), (56, 8)], False)
+MOD3_WEIGHT_SCHEMES = {
+    1:None,
+    5:None,
+    9:([(0, 10)], False),
+    17:([(0, 10), (10, 10)], False),
+    25:([(0, 10), (10, 10), (20, 10)], False),
+    33:([(0, 10), (10, 10), (20, 10)], True),
+    41:_WEIGHTS_8_BYTES,
+    49:_WEIGHTS_8_BYTES,
+    57:_WEIGHTS_8_BYTES,
+    65:_WEIGHTS_8_BYTES,
+}
+
+def unpack_weights(weights_raw, weight_scheme):
+    # Returns a (N,k) float32 weight matrix, one column per influence
+    fields, implied_last = MOD3_WEIGHT_SCHEMES[weight_scheme]
+    packed = weights_raw.astype(np.uint64)
+    weights = np.empty((len(packed), len(fields) + int(implied_last)), dtype=np.float32)
+    for field_i, (shift, bits) in enumerate(fields):
+        weights[:,field_i] = (packed >> np.uint64(shift)) & np.uint64((1 << bits) - 1)
+    weights /= 1023
+    if implied_last:
+        weights[:,-1] = 1.0 - weights[:,:-1].sum(axis=1)
+    return weights
+
+MOD3_DEFAULT_ATTRIBUTES = ("normals", "UVs", "weights", "colors")
+
+_VERTEX_SCHEMAS = {}
+
+def get_vertex_schema(UV_number, weights_bytes, has_color):
+    # One record per vertex, the layout is fully determined by the block type
+    key = (UV_number, weights_bytes, has_color)
+    schema = _VERTEX_SCHEMAS.get(key)
+    if schema is None:
+        fields = [
+            ("position", ("<f4", 3)),
+            ("normal", ("i1", 4)),
+            ("tangent", ("i1", 3)),
+            ("bitangent_sign", "i1"),
+            ("UV", ("<f2", (UV_number, 2))),
+        ]
+        if weights_bytes == 4:
+            fields.append(("weights", "<u4"))
+            fields.append(("bone_ids", ("u1", 4)))
+        elif weights_bytes == 8:
+            fields.append(("weights", "<u8"))
+            fields.append(("bone_ids", ("u1", 8)))
+        if has_color:
+            fields.append(("color", ("u1", 4)))
+        schema = make_schema(fields)
+        _VERTEX_SCHEMAS[key] = schema
+    return schema
+
+class Mod3Bone():
+    __slots__ = ("id", "function", "parent", "child", "float1", "length", "x", "y", "z",
+                 "local_matrix", "global_matrix", "remap")
+
+    def __init__(self):
+        self.id = None
+        self.function = None
+        self.parent = None
+        self.child = None
+        self.float1 = None
+        self.length = None
+        self.x = None
+        self.y = None
+        self.z = None
+        # (4,4) float32, file layout (translation on the last row)
+        self.local_matrix = None
+        self.global_matrix = None
+        self.remap = None
+
+class Mod3Mesh():
+    # Per vertex data is kept as contiguous numpy arrays, attributes that were
+    # not decoded (or not present in the file) are None
+    __slots__ = ("id", "lod", "group", "material", "material_name_hash",
+                 "positions", "faces", "normals", "tangents", "bitangent_sign",
+                 "UVs", "weights_values", "weights_bones", "colors")
+
+    def __init__(self):
+        self.id = None
+        self.lod = None
+        self.group = None
+        self.material = None
+        self.material_name_hash = None
+        self.positions = None # float32 (N,3)
+        self.faces = None # uint32 (M,3)
+        self.normals = None # float32 (N,3)
+        self.tangents = None # float32 (N,3)
+        self.bitangent_sign = None # int8 (N,)
+        self.UVs = [] # one float32 (N,2) per channel
+        self.weights_values = None # float32 (N,k)
+        self.weights_bones = None # int16 (N,k), -1 for unknown bones
+        self.colors = None # uint8 (N,4)
+
+    def content_hash(self):
+        # Digest of everything that ends up in the Blender mesh datablock
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(str(len(self.UVs)).encode())
+        for array in [self.positions, self.faces, self.normals, *self.UVs, self.colors, self.weights_values, self.weights_bones]:
+            if array is None:
+                hasher.update(b"\x00")
             else:
-                text += chr(char)
-        return text
-
-    def readStringUTFAt(self, offset):
-        previous_offset = self.tell()
-        self.seek(offset)
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        self.seek(previous_offset)
-        return text
-
-    def readStringUTF(self):
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-
-    def allign(self, size):
-        self.offset = (int((self.offset)/size)*size)+size
-
-    def tell(self):
-        return self.offset
-
-    def getSize(self):
-        return len(self.data)
+                hasher.update(str(array.shape).encode())
+                hasher.update(np.ascontiguousarray(array).tobytes())
+        return hasher.hexdigest()
 
 class Mod3Parser():
-    def __init__(self, path=None, data=None):
+    def __init__(self, path=None, data=None, use_mmap=True):
         self.path = path
         if data is None:
-            with open(path, "rb") as file_in:
-                data = file_in.read()
+            data = read_file(path, use_mmap=use_mmap)
         self.bs = Reader(data)
 
-    def read(self):
-        self.magic = self.bs.readUInt()
-        self.version = self.bs.readUShort()
+    def read_header(self):
+        # Only touches the header and the mesh info table
+        self.bs.seek(0)
+        header = records_to_dicts(self.bs.read_array(MOD3_HEADER_SCHEMA, 1))[0]
+        self.magic = header["magic"]
+        self.version = header["version"]
         if self.magic != 4476749 and self.version != 237:
             raise RuntimeError(str(self.path) + " is not a mhworld mod3 file (magic = " + str(self.magic) + ", version = " + str(self.version) + ")")
 
-        bone_count = self.bs.readUShort()
-        mesh_count = self.bs.readUShort()
-        mat_count = self.bs.readUShort()
-        vert_count = self.bs.readUInt()
-        face_count = self.bs.readUInt()
-        edge_count = self.bs.readUInt()
-        vbuffer_size = self.bs.readUInt64()
-        group_count = self.bs.readUInt64()
-        timestamp = self.bs.readUInt64()
-        bone_offset = self.bs.readUInt64()
-        group_offset = self.bs.readUInt64()
-        matname_offset = self.bs.readUInt64()
-        mesh_offset = self.bs.readUInt64()
-        vert_offset = self.bs.readUInt64()
-        face_offset = self.bs.readUInt64()
-        _offset = self.bs.readUInt64()
-        _offset = self.bs.readUInt64()
+        self.bs.seek(header["mesh_offset"])
+        self.mesh_infos = records_to_dicts(self.bs.read_array(MOD3_MESH_INFO_SCHEMA, header["mesh_count"]))
+        for mesh_info in self.mesh_infos:
+            lod_mask = mesh_info["lod_mask"]
+            mesh_info["lod"] = int(round(math.log2(lod_mask & -lod_mask)))
+
+        self.header = header
+        return {
+            "bone_count":header["bone_count"],
+            "mesh_count":header["mesh_count"],
+            "material_count":header["mat_count"],
+            "vertex_count":header["vert_count"],
+            "face_count":header["face_count"],
+            "lods":sorted(set(mesh_info["lod"] for mesh_info in self.mesh_infos)),
+        }
+
+    @closes_reader
+    def read(self, lod=None, attributes=None):
+        # lod: only decode the submeshes of that LOD, all of them if None
+        # attributes: per vertex data to decode besides positions and faces,
+        # defaults to MOD3_DEFAULT_ATTRIBUTES ("tangents" is opt-in)
+        if attributes is None:
+            attributes = MOD3_DEFAULT_ATTRIBUTES
+        self.read_header()
+        bone_count = self.header["bone_count"]
+        mat_count = self.header["mat_count"]
+        bone_offset = self.header["bone_offset"]
+        matname_offset = self.header["matname_offset"]
+        vert_offset = self.header["vert_offset"]
+        face_offset = self.header["face_offset"]
+        mesh_infos = self.mesh_infos
 
         materials = []
         for mat_i in range(mat_count):
@@ -139,370 +260,105 @@ class Mod3Parser():
         self.bs.seek(bone_offset)
         #print(bone_count)
 
+        bone_records = self.bs.read_array(MOD3_BONE_SCHEMA, bone_count)
+        # (N,4,4) float32, stored row by row like the file
+        local_matrices = self.bs.read_array("<f4", bone_count*16).reshape(bone_count, 4, 4)
+        global_matrices = self.bs.read_array("<f4", bone_count*16).reshape(bone_count, 4, 4)
         armature_datas = []
-        for bone_i in range(bone_count):
-            bone_info = {}
-            bone_info["id"] = bone_i
-            bone_info["function"] = self.bs.readUShort()
-            bone_info["parent"] = self.bs.readUByte()
-            bone_info["child"] = self.bs.readUByte()
-            bone_info["float1"] = self.bs.readFloat()
-            bone_info["length"] = self.bs.readFloat()
-            bone_info["x"] = self.bs.readFloat()
-            bone_info["y"] = self.bs.readFloat()
-            bone_info["z"] = self.bs.readFloat()
-            armature_datas.append(bone_info)
-        for bone_i in range(bone_count):
-            matrix = []
-            matrix.append([self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat()])
-            matrix.append([self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat()])
-            matrix.append([self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat()])
-            matrix.append([self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat()])
-            armature_datas[bone_i]["local_matrix"] = matrix
-        for bone_i in range(bone_count):
-            matrix = []
-            matrix.append([self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat()])
-            matrix.append([self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat()])
-            matrix.append([self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat()])
-            matrix.append([self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat(), self.bs.readFloat()])
-            armature_datas[bone_i]["global_matrix"] = matrix
-
+        for bone_i, bone_record in enumerate(bone_records.tolist()):
+            bone = Mod3Bone()
+            bone.id = bone_i
+            bone.function, bone.parent, bone.child, bone.float1, bone.length, bone.x, bone.y, bone.z = bone_record
+            # Copied, the parsed bones must not keep the file mapped
+            bone.local_matrix = local_matrices[bone_i].copy()
+            bone.global_matrix = global_matrices[bone_i].copy()
+            armature_datas.append(bone)
+
+        remap_table = self.bs.read_array("u1", 512)
         remap = {}
-        for bone_i in range(512):
-            remapping = self.bs.readUByte()
-            if remapping != 255:
-                remap[bone_i] = remapping
-                try:
-                    armature_datas[remapping]["remap"] = bone_i
-                except:
-                    pass
+        for bone_i in np.nonzero(remap_table != 255)[0].tolist():
+            remapping = int(remap_table[bone_i])
+            remap[bone_i] = remapping
+            if remapping < bone_count:
+                armature_datas[remapping].remap = bone_i
         remap_inv = {v:k for k,v in remap.items()}
+        # File bone id -> remapped bone index, -1 for bones missing from the remap table
+        bone_lut = np.full(256, -1, dtype=np.int16)
+        for bone_id, remapping in remap_inv.items():
+            bone_lut[bone_id] = remapping
         #print("remap = ", remap)
 
-        mesh_infos = []
-        self.bs.seek(mesh_offset)
-        for mesh_i in range(mesh_count):
-
-            mesh_info = {}
-
-            # Grabbed from the previous importer by asteriskampersand, those were hard to figure out
-            mesh_info["shadow_flag"] = self.bs.readUShort()
-
-            mesh_info["vert_count"] = self.bs.readUShort()
-            mesh_info["visibleCondition"] = self.bs.readUShort()
-            mesh_info["materialIdx"] = self.bs.readUShort()
-            tmp_lod = self.bs.readUInt()
-            mesh_info["lod"] = int(round(math.log2(tmp_lod & -tmp_lod)))
-            mesh_info["weightDynamics"] = self.bs.readUShort()
-            mesh_info["blockSize"] = self.bs.readUByte()
-            mesh_info["unkn3"] = self.bs.readUByte()
-            mesh_info["vertexSub"] = self.bs.readUInt()
-            mesh_info["vertexOffset"] = self.bs.readUInt()
-
-            mesh_info["blocktype"] = self.bs.readUInt()
-            mesh_info["faceOffset"] = self.bs.readUInt()
-            mesh_info["faceCount"] = self.bs.readUInt()
-            mesh_info["vertexBase"] = self.bs.readUInt()
-            mesh_info["NULL_0"] = self.bs.readUByte()
-            mesh_info["boundingBoxCount"] = self.bs.readUByte()
-            mesh_info["unknownIndex"] = self.bs.readUShort()
-
-            mesh_info["vertexSubMirror"] = self.bs.readUShort()
-            mesh_info["vertexIndexSub"] = self.bs.readUShort()
-            mesh_info["mapData_1"] = self.bs.readUShort()
-            mesh_info["mapData_2"] = self.bs.readUShort()
-            mesh_info["NULL_1"] = self.bs.readUInt()
-            mesh_info["intUnknown"] = self.bs.readUInt()
-            mesh_info["vertexSubTotal"] = self.bs.readUInt()
-            mesh_info["NULL_2"] = self.bs.readUInt()
-            mesh_info["NULL_2"] = self.bs.readUInt()
-            mesh_info["NULL_2"] = self.bs.readUInt()
-            mesh_info["NULL_2"] = self.bs.readUInt()
-            mesh_infos.append(mesh_info)
-
-            #print(mesh_info)
-
         mesh_datas = []
         running_offset = vert_offset
         for mesh_i, mesh_info in enumerate(mesh_infos):
 
-            mesh = {}
+            mesh = Mod3Mesh()
             vert_size = mesh_info["blockSize"]
             
             self.bs.seek(running_offset)
             running_offset += mesh_info["blockSize"]*mesh_info["vert_count"]
 
-            has_position = True
-            has_normals = True
-            has_tangents = True
-            has_bitangent = True
-            UV_number = 1
-            weights_bytes = 0
-            has_color = False
-
-            if mesh_info["blocktype"] == 2807493369:
-                UV_number = 1
-                weights_bytes = 0
-                has_color = False
-            elif mesh_info["blocktype"] == 2769308832:
-                UV_number = 2
-                weights_bytes = 0
-                has_color = False
-            elif mesh_info["blocktype"] == 3282830241:
-                UV_number = 3
-                weights_bytes = 0
-                has_color = True
-            elif mesh_info["blocktype"] == 3379104440:
-                UV_number = 4
-                weights_bytes = 0
-                has_color = True
-            elif mesh_info["blocktype"] == 2173240540:
-                UV_number = 1
-                weights_bytes = 0
-                has_color = True
-            elif mesh_info["blocktype"] == 252052287:
-                UV_number = 2
-                weights_bytes = 0
-                has_color = True
-            elif mesh_info["blocktype"] == 4130816028:
-                UV_number = 1
-                weights_bytes = 4
-                has_color = False
-            elif mesh_info["blocktype"] == 4101111365:
-                UV_number = 2
-                weights_bytes = 4
-                has_color = False
-            elif mesh_info["blocktype"] == 1014171488:
-                UV_number = 1
-                weights_bytes = 4
-                has_color = True
-            elif mesh_info["blocktype"] == 3002859651:
-                UV_number = 2
-                weights_bytes = 4
-                has_color = True
-            elif mesh_info["blocktype"] == 2180350055:
-                UV_number = 1
-                weights_bytes = 8
-                has_color = False
-            elif mesh_info["blocktype"] == 2209562174:
-                UV_number = 2
-                weights_bytes = 8
-                has_color = False
-            elif mesh_info["blocktype"] == 912889255:
-                UV_number = 1
-                weights_bytes = 8
-                has_color = True
-            elif mesh_info["blocktype"] == 3102118468:
-                UV_number = 2
-                weights_bytes = 8
-                has_color = True
-            else:
+
+            if lod is not None and mesh_info["lod"] != lod:
+                # Vertices and faces of other LODs are never touched
+                continue
+
+            UV_number, weights_bytes, has_color = MOD3_BLOCK_TYPES.get(mesh_info["blocktype"], (1, 0, False))
+            if mesh_info["blocktype"] not in MOD3_BLOCK_TYPES:
                 logger.warning("UNKNOWN BLOCK TYPE = " + str(mesh_info["blocktype"]))
-            
-            positions = []
-            normals = []
-            tangents = []
-            bitangent_sign = []
 
+            # Fields of the record view are only decoded when accessed
+            vertices = self.bs.read_array(get_vertex_schema(UV_number, weights_bytes, has_color), mesh_info["vert_count"])
+            positions = vertices["position"].astype(np.float32)
+            normals = None
+            if "normals" in attributes:
+                normals = vertices["normal"][:,:3].astype(np.float32) + 128
+                normals /= 127.5
+                normals -= 1.0
+            tangents = None
+            bitangent_sign = None
+            if "tangents" in attributes:
+                tangents = vertices["tangent"].astype(np.float32) + 128
+                tangents /= 127.5
+                tangents -= 1.0
+                bitangent_sign = vertices["bitangent_sign"].copy()
             UVs = []
-            for UV_i in range(UV_number):
-                UVs.append([])
-            weights_raw = []
-            bone_ids = []
-            colors = []
-            for vert_i in range(mesh_info["vert_count"]):
-
-                if has_position:
-                    positions.append([self.bs.readFloat() for _ in range(3)])
-                if has_normals:
-                    normals.append([self.bs.readByte() for _ in range(4)][:3])
-                if has_tangents:
-                    tangents.append([self.bs.readByte() for _ in range(3)])
-                if has_bitangent:
-                    bitangent_sign.append(self.bs.readByte())
+            if "UVs" in attributes:
                 for UV_i in range(UV_number):
-                    UVs[UV_i].append([self.bs.readHalf(), 1.0-self.bs.readHalf()])
-                if weights_bytes == 4:
-                    weights_raw.append(self.bs.readUInt())
-                    bone_ids.append([self.bs.readUByte() for _ in range(4)])
-                elif weights_bytes == 8:
-                    weights_raw.append(self.bs.readUInt64())
-                    bone_ids.append([self.bs.readUByte() for _ in range(8)])
-                if has_color:
-                    colors.append([self.bs.readUByte() for _ in range(4)])
-            if mesh_info["weightDynamics"] == 1:
-                pass
-            elif mesh_info["weightDynamics"] == 5:
-                pass
-            elif mesh_info["weightDynamics"] == 9:
-                weights = np.array([
-                    ((np.array(weights_raw, dtype=np.uint32) & 1023) / 1023),
-                ]).transpose([1,0])
-                bone_ids = np.array(bone_ids)[:,:1]
-            elif mesh_info["weightDynamics"] == 17:
-                weights = np.array([
-                    ((np.array(weights_raw, dtype=np.uint32) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint32) >> 10) & 1023) / 1023)
-                ]).transpose([1,0])
-                bone_ids = np.array(bone_ids)[:,:2]
-            elif mesh_info["weightDynamics"] == 25:
-                weights = np.array([
-                    ((np.array(weights_raw, dtype=np.uint32) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint32) >> 10) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint32) >> 20) & 1023) / 1023)
-                ]).transpose([1,0])
-                bone_ids = np.array(bone_ids)[:,:3]
-            elif mesh_info["weightDynamics"] == 33:
-                weights = np.array([
-                    ((np.array(weights_raw, dtype=np.uint32) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint32) >> 10) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint32) >> 20) & 1023) / 1023),
-                    1.0-(((np.array(weights_raw, dtype=np.uint32) & 1023) / 1023) + (((np.array(weights_raw, dtype=np.uint32) >> 10) & 1023) / 1023) + (((np.array(weights_raw, dtype=np.uint32) >> 20) & 1023) / 1023))
-                ]).transpose([1,0])
-                bone_ids = np.array(bone_ids)[:,:4]
-            elif mesh_info["weightDynamics"] == 41:
-                weights = np.array([
-                    ((np.array(weights_raw, dtype=np.uint64) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 10) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 20) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 32) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 40) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 48) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 56) & 255) / 1023),
-                    #1.0-(((np.array(weights_raw) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 10) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 20) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 32) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 40) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 48) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 56) & 255) / 1023))
-                ]).transpose([1,0])
-                bone_ids = np.array(bone_ids)[:,:8]
-            elif mesh_info["weightDynamics"] == 49:
-                weights = np.array([
-                    ((np.array(weights_raw, dtype=np.uint64) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 10) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 20) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 32) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 40) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 48) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 56) & 255) / 1023),
-                    #1.0-(((np.array(weights_raw) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 10) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 20) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 32) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 40) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 48) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 56) & 255) / 1023))
-                ]).transpose([1,0])
-                bone_ids = np.array(bone_ids)[:,:8]
-            elif mesh_info["weightDynamics"] == 57:
-                weights = np.array([
-                    ((np.array(weights_raw, dtype=np.uint64) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 10) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 20) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 32) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 40) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 48) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 56) & 255) / 1023),
-                    #1.0-(((np.array(weights_raw) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 10) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 20) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 32) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 40) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 48) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 56) & 255) / 1023))
-                ]).transpose([1,0])
-                bone_ids = np.array(bone_ids)[:,:8]
-            elif mesh_info["weightDynamics"] == 65:
-                weights = np.array([
-                    ((np.array(weights_raw, dtype=np.uint64) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 10) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 20) & 1023) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 32) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 40) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 48) & 255) / 1023),
-                    (((np.array(weights_raw, dtype=np.uint64) >> 56) & 255) / 1023),
-                    #1.0-(((np.array(weights_raw) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 10) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 20) & 1023) / 1023) + 
-                         #(((np.array(weights_raw) >> 32) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 40) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 48) & 255) / 1023) + 
-                         #(((np.array(weights_raw) >> 56) & 255) / 1023))
-                ]).transpose([1,0])
-                bone_ids = np.array(bone_ids)[:,:8]
-            else:
-                #print("")
-                #ind = 0
-                #tmp_val = weights_raw[ind]
-                #print(tmp_val, tmp_val & (2**(32)-1), tmp_val >> 32)
-                #a = ((tmp_val >> 0) & 1023)/1023
-                #b = ((tmp_val >> 10) & 1023)/1023
-                #c = ((tmp_val >> 20) & 1023)/1023
-                #d = ((tmp_val >> 30) & 3)/3
-                ##e = ((tmp_val >> 32) & 255)/255
-                ##f = ((tmp_val >> 40) & 255)/255
-                ##g = ((tmp_val >> 48) & 255)/255
-                ##h = ((tmp_val >> 56) & 255)/255
-                ##e = ((tmp_val >> 32) & 1023)/1023
-                ##f = ((tmp_val >> 40) & 1023)/1023
-                ##g = ((tmp_val >> 48) & 1023)/1023
-                ##h = ((tmp_val >> 56) & 1023)/1023
-                #e = ((tmp_val >> 32) & 255)/1023
-                #f = ((tmp_val >> 40) & 255)/1023
-                #g = ((tmp_val >> 48) & 255)/1023
-                #h = ((tmp_val >> 56) & 255)/1023
-                #print("a\t", bone_ids[ind][0], "\t", a)
-                #print("b\t", bone_ids[ind][1], "\t", b)
-                #print("c\t", bone_ids[ind][2], "\t", c)
-                #print("d\t", bone_ids[ind][3], "\t", d)
-                #print("e\t", bone_ids[ind][4], "\t", e)
-                #print("f\t", bone_ids[ind][5], "\t", f)
-                #print("g\t", bone_ids[ind][6], "\t", g)
-                #print("h\t", bone_ids[ind][7], "\t", h)
-                #print(a+b+c+d)
-                #print(e+f+g+h)
-                #print(a+b+c+d+e+f+g+h)
-                #print(bin(weights_raw[ind]))
-                #print(bone_ids[ind])
-                logger.warning("UNKNOWN WEIGHT SCHEME = " + str(mesh_info["weightDynamics"]) + " block type = " +  str(mesh_info["blocktype"]) + " weight bytes = " + str(weights_bytes))
-            weights_names = []
-            for x in bone_ids:
-                weight_list = []
-                for y in x:
-                    try:
-                        weight_list.append("bone_" + str(remap_inv[y]).zfill(3))
-                    except:
-                        weight_list.append("bone_err")
-                weights_names.append(weight_list)
-                #try:
-                    #weights_names.append(["bone_" + str(remap_inv[y]).zfill(3) for y in x])
-                #except:
-                    #weights_names.append(["bone_err" for y in x])
-            normals = np.array(normals, dtype=np.float32) + 128
-            normals /= 127.5
-            normals -= 1.0
-            faces = []
+                    UV = vertices["UV"][:,UV_i].astype(np.float32)
+                    UV[:,1] = 1.0 - UV[:,1]
+                    UVs.append(UV)
+            weights = None
+            weights_bones = None
+            if weights_bytes != 0 and "weights" in attributes:
+                weight_scheme = mesh_info["weightDynamics"]
+                if weight_scheme not in MOD3_WEIGHT_SCHEMES:
+                    logger.warning("UNKNOWN WEIGHT SCHEME = " + str(weight_scheme) + " block type = " +  str(mesh_info["blocktype"]) + " weight bytes = " + str(weights_bytes))
+                elif MOD3_WEIGHT_SCHEMES[weight_scheme] is not None:
+                    weights = unpack_weights(vertices["weights"], weight_scheme)
+                    weights_bones = bone_lut[vertices["bone_ids"][:,:weights.shape[1]]]
+            colors = None
+            if has_color and "colors" in attributes:
+                colors = np.ascontiguousarray(vertices["color"])
 
             self.bs.seek(face_offset + 2*mesh_info["faceOffset"])
-            for face_i in range(mesh_info["faceCount"]//3):
-                faces.append([self.bs.readUShort() - mesh_info["vertexSub"] for _ in range(3)])
-
-            mesh["lod"] = mesh_info["lod"]
-            mesh["id"] = mesh_i
-            mesh["positions"] = positions
-            mesh["faces"] = faces
-            mesh["normals"] = normals
-            mesh["UVs"] = UVs
-            mesh["group"] = mesh_info["visibleCondition"]
-            if len(weights_raw) > 0:
-                mesh["weights_values"] = weights
-                mesh["weights_names"] = weights_names
-            if len(colors) > 0:
-                mesh["colors"] = colors
-            mesh["material"] = materials[mesh_info["materialIdx"]]
-            mesh["material_name_hash"] = int("0b"+"1"*32, 2) - zlib.crc32(materials[mesh_info["materialIdx"]].encode())
+            faces = self.bs.read_array("<u2", (mesh_info["faceCount"]//3)*3).reshape(-1, 3).astype(np.uint32)
+            faces -= mesh_info["vertexSub"]
+
+            mesh.lod = mesh_info["lod"]
+            mesh.id = mesh_i
+            mesh.group = mesh_info["visibleCondition"]
+            mesh.positions = positions
+            mesh.faces = faces
+            mesh.normals = normals
+            mesh.tangents = tangents
+            mesh.bitangent_sign = bitangent_sign
+            mesh.UVs = UVs
+            mesh.weights_values = weights
+            mesh.weights_bones = weights_bones
+            mesh.colors = colors
+            mesh.material = materials[mesh_info["materialIdx"]]
+            mesh.material_name_hash = int("0b"+"1"*32, 2) - zlib.crc32(materials[mesh_info["materialIdx"]].encode())
             mesh_datas.append(mesh)
 
         return armature_datas, mesh_datas
@@ -11,6 +11,9 @@ logger = logging.getLogger("mhworld_import")
 from .mod3_loader import load_mod3
 from ..mrl3.mrl3_loader import load_mrl3
 from ..common.apply_geonode import apply_VM_geonode
+from ..common.asset_index import get_asset_index
+from ..tex.texture_cache import get_texture_cache
+from ..tex.tex_loader import MAX_TEXTURE_SIZE_ITEMS
 
 def SetLoggingLevel(level):
     if level == "DEBUG":
@@ -70,6 +73,7 @@ class IMPORT_PT_Mod3SettingPanel_2(Panel):
         row = layout.row()
         row.enabled = operator.use_png_cache
         row.prop(operator, 'overwrite_png_cache')
+        layout.prop(operator, 'max_texture_size')
 
 
 class ImportMod3(bpy.types.Operator, ImportHelper):
@@ -88,8 +92,14 @@ class ImportMod3(bpy.types.Operator, ImportHelper):
     connect_bones: bpy.props.BoolProperty(name="Connect bones", description="Connect the bones to their children when available. WILL break animations. ",  default=False)
     import_material: bpy.props.BoolProperty(name="Import material", description="Import the material .mrl3 file",  default=True)
     add_VM_geonode: bpy.props.BoolProperty(name="Import VM geonode", description="Import the VM textures as a geonode modifier",  default=True)
-    use_png_cache: bpy.props.BoolProperty(name="Use PNG cache", description="Save a copy of imported .tex in a .png file next to it (subsequent imports will be much faster)", default=True)
-    overwrite_png_cache: bpy.props.BoolProperty(name="Overwrite PNG cache", description="Overwrite cached .png", default=False)
+    use_png_cache: bpy.props.BoolProperty(name="Use texture cache", description="Save a copy of imported .tex in the texture cache directory set in the addon preferences (subsequent imports will be much faster)", default=True)
+    overwrite_png_cache: bpy.props.BoolProperty(name="Overwrite texture cache", description="Overwrite the cached copies of imported .tex", default=False)
+    max_texture_size: bpy.props.EnumProperty(
+        name="Max texture size",
+        description="Import textures at a reduced resolution (their mip levels are used). They can be reloaded at full resolution later",
+        items = MAX_TEXTURE_SIZE_ITEMS,
+        default = '0'
+    )
     
     def draw(self, context):
         pass
@@ -128,13 +138,16 @@ class ImportMod3(bpy.types.Operator, ImportHelper):
                         por.append(i)
                 data_to.node_groups = por
 
+        if self.import_material:
+            get_asset_index(addon_prefs.game_path, addon_prefs.cache_dir)
+        texture_cache = get_texture_cache(addon_prefs.cache_dir, addon_prefs.texture_cache_size*1024*1024, addon_prefs.texture_cache_codec)
         for filepath in filepaths:
             objs = load_mod3(filepath, collection=None, LOD=self.LOD, fix_rotation=self.fix_rotation, fix_scale=self.fix_scale, rename_bones=self.rename_bones, connect_bones=self.connect_bones)
             if self.import_material:
                 mrl3_filepath = ".".join(filepath.split(".")[:-1]) + ".mrl3"
 
                 try:
-                    load_mrl3(addon_prefs.game_path, mrl3_filepath, use_loaded_mat=False, use_loaded_tex=True, use_png_cache=self.use_png_cache, overwrite_png_cache=self.overwrite_png_cache)
+                    load_mrl3(addon_prefs.game_path, mrl3_filepath, use_loaded_mat=False, use_loaded_tex=True, use_png_cache=self.use_png_cache, overwrite_png_cache=self.overwrite_png_cache, max_texture_size=int(self.max_texture_size))
                     if self.add_VM_geonode:
                         for obj in objs:
                             apply_VM_geonode(obj)
@@ -143,6 +156,7 @@ class ImportMod3(bpy.types.Operator, ImportHelper):
                     self.report({"WARNING"}, "Unable to load material of path " + str(mrl3_filepath) + ", reason = " + str(e))
                     traceback.print_exc()
                     continue
+        texture_cache.flush()
         return {"FINISHED"}
 
 
@@ -7,6 +7,7 @@ import logging
 
 from .mrl3_parser import Mrl3Parser
 from ..tex.tex_loader import load_tex
+from ..common.asset_index import get_asset_index
 
 logger = logging.getLogger("mhworld_import")
 
@@ -17,18 +18,19 @@ def string_reformat(s):
         s = s[2:]
     return s.split("__")[0]
 
-def create_img_node(game_path, nodes, filepath, position, use_loaded_tex=False, use_png_cache=False, overwrite_png_cache=False):
+def create_img_node(game_path, nodes, filepath, position, use_loaded_tex=False, use_png_cache=False, overwrite_png_cache=False, max_texture_size=0):
     node_img = nodes.new(type='ShaderNodeTexImage')
     node_img.location = Vector(position)
     
     filepath = filepath.replace("\\", "/")
-    new_filepath = os.path.join(game_path, filepath + ".tex")
-    if not os.path.isfile(new_filepath):
+    new_filepath = get_asset_index(game_path).resolve(filepath + ".tex")
+    if new_filepath is None:
+        new_filepath = os.path.join(game_path, filepath + ".tex")
         logger.warning("Could not load texture, file does not exists (path=" + new_filepath + ")")
         return node_img
 
     try:
-        img = load_tex(new_filepath, use_loaded=use_loaded_tex, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache)
+        img = load_tex(new_filepath, use_loaded=use_loaded_tex, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, max_texture_size=max_texture_size)
     except Exception as e:
         if "Texture data format not supported" not in str(e):
             logger.warning("Could not load texture, exception during parsing (path=" + new_filepath + ", exception=" + str(e) + ")")
@@ -39,9 +41,19 @@ def create_img_node(game_path, nodes, filepath, position, use_loaded_tex=False,
 
     return node_img
 
-def load_mrl3(game_path, filepath, mod3_mat_hashes={}, use_loaded_mat=False, use_loaded_tex=False, use_png_cache=False, overwrite_png_cache=False, mat_prefix="", beautify=True, obj_overload={}):
-    parser = Mrl3Parser(path=filepath)
-    mat_dict = parser.read()
+def load_mrl3(game_path, filepath, mod3_mat_hashes=None, use_loaded_mat=False, use_loaded_tex=False, use_png_cache=False, overwrite_png_cache=False, max_texture_size=0, mat_prefix="", beautify=True, obj_overload=None, asset_cache=None):
+    if mod3_mat_hashes is None:
+        mod3_mat_hashes = {}
+    if obj_overload is None:
+        obj_overload = {}
+    mat_dict = None
+    if asset_cache is not None:
+        mat_dict = asset_cache.get("mrl3", filepath)
+    if mat_dict is None:
+        parser = Mrl3Parser(path=filepath)
+        mat_dict = parser.read()
+        if asset_cache is not None:
+            asset_cache.put("mrl3", filepath, mat_dict)
     returned_mats = []
     
     existing_mat_hashes = {}
@@ -159,7 +171,7 @@ def load_mrl3(game_path, filepath, mod3_mat_hashes={}, use_loaded_mat=False, use
 
                     node_position = (texture_frame_x, texture_frame_y)
                     texture_frame_y -= 300.0
-                    node_img = create_img_node(game_path, nodes, texture_path, node_position, use_loaded_tex=use_loaded_tex, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache)
+                    node_img = create_img_node(game_path, nodes, texture_path, node_position, use_loaded_tex=use_loaded_tex, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, max_texture_size=max_texture_size)
                     node_img.parent = texture_frame
 
                     image_node_name = string_reformat(texture_type)
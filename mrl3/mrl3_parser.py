@@ -1,135 +1,66 @@
-import struct
 import os
 from glob import glob
 import json
 import logging
 logger = logging.getLogger("mhworld_import")
 
-class Reader():
-    def __init__(self, data):
-        self.offset = 0
-        self.data = data
+from ..common.reader import Reader, read_file, closes_reader
 
-    def read(self, kind, size):
-        result = struct.unpack(kind, self.data[self.offset:self.offset+size])[0]
-        self.offset += size
-        return result
+# The dictionaries are only needed to decode the materials themselves, and are
+# loaded once for the whole session
+mrl3_dicts = None
 
-    def seek(self, offset, start = None):
-        if start is None:
-            self.offset = offset
-        else:
-            self.offset += offset
-
-    def readUInt(self):
-        return self.read("I", 4)
-
-    def readInt(self):
-        return self.read("i", 4)
-
-    def readUInt64(self):
-        return self.read("Q", 8)
-
-    def readHalf(self):
-        return self.read("e", 2)
-
-    def readFloat(self):
-        return self.read("f", 4)
-
-    def readShort(self):
-        return self.read("h", 2)
-
-    def readUShort(self):
-        return self.read("H", 2)
-
-    def readByte(self):
-        return self.read("b", 1)
-
-    def readBytes(self, size):
-        return self.data[self.offset:self.offset + size]
-
-    def readUByte(self):
-        return self.read("B", 1)
-
-    def readString(self):
-        text = ""
-        while True:
-            char = self.readUByte()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-
-    def readStringUTFAt(self, offset):
-        previous_offset = self.tell()
-        self.seek(offset)
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        self.seek(previous_offset)
-        return text
-
-    def readStringUTF(self):
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-
-    def allign(self, size):
-        self.offset = (int((self.offset)/size)*size)+size
-
-    def tell(self):
-        return self.offset
-
-    def getSize(self):
-        return len(self.data)
+def load_mrl3_dicts():
+    global mrl3_dicts
+    if mrl3_dicts is None:
+        local_path = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(local_path, "texture_dict.json"), "r") as json_in:
+            texture_dict = json.load(json_in)
+        with open(os.path.join(local_path, "property_dict.json"), "r") as json_in:
+            property_dict = json.load(json_in)
+        with open(os.path.join(local_path, "shader_dict.json"), "r") as json_in:
+            shader_dict = json.load(json_in)
+        mrl3_dicts = (texture_dict, property_dict, shader_dict)
+    return mrl3_dicts
 
 class Mrl3Parser():
-    def __init__(self, path=None, data=None):
+    def __init__(self, path=None, data=None, use_mmap=True):
         self.path = path
         if data is None:
-            with open(path, "rb") as file_in:
-                data = file_in.read()
+            data = read_file(path, use_mmap=use_mmap)
         self.bs = Reader(data)
         self.debug_data = {}
-        local_path = os.path.dirname(os.path.abspath(__file__))
-        with open(os.path.join(local_path, "texture_dict.json"), "r") as json_in:
-            self.texture_dict = json.load(json_in)
-        with open(os.path.join(local_path, "property_dict.json"), "r") as json_in:
-            self.property_dict = json.load(json_in)
-        with open(os.path.join(local_path, "shader_dict.json"), "r") as json_in:
-            self.shader_dict = json.load(json_in)
-        
 
-    def read(self):
+    def read_header(self):
+        # Only touches the header and the texture path table
+        self.bs.seek(0)
         self.magic = self.bs.readUInt()
         if self.magic != 5001805:
             raise RuntimeError(str(self.path) + " is not a mdf2 file (magic = " + str(self.magic) + ")")
         _ = self.bs.readUInt()
         _ = self.bs.readUInt()
         _ = self.bs.readUInt()
-        mat_count = self.bs.readUInt()
+        self.mat_count = self.bs.readUInt()
         tex_count = self.bs.readUInt()
         tex_offset = self.bs.readUInt64()
-        mat_offset = self.bs.readUInt64()
+        self.mat_offset = self.bs.readUInt64()
 
-        texture_paths = []
+        self.texture_paths = []
         for tex_i in range(tex_count):
-            self.bs.seek(tex_offset + (256+16)*tex_i)
-            _ = self.bs.readUInt()
-            _ = self.bs.readUInt()
-            _ = self.bs.readUInt()
-            _ = self.bs.readUInt()
-            texture_paths.append(self.bs.readString())
+            self.bs.seek(tex_offset + (256+16)*tex_i + 16)
+            self.texture_paths.append(self.bs.readString())
+        return {
+            "material_count":self.mat_count,
+            "texture_paths":self.texture_paths,
+        }
+
+    @closes_reader
+    def read(self):
+        self.texture_dict, self.property_dict, self.shader_dict = load_mrl3_dicts()
+        self.read_header()
+        mat_count = self.mat_count
+        mat_offset = self.mat_offset
+        texture_paths = self.texture_paths
 
         self.bs.seek(mat_offset)
         #mat_offset
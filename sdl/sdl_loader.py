@@ -6,25 +6,31 @@ import logging
 import math
 
 from .sdl_parser import SdlParser
-from ..common.object_loader import load_object_instances
+from ..common.instancing import load_instances
+from ..common.instance_batch import concatenate_batches
+from ..common.asset_index import get_asset_index
 
 logger = logging.getLogger("mhworld_import")
 
-def load_sdl(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, import_material=True, use_png_cache=True, overwrite_png_cache=False):
+def load_sdl(game_path, filepath, LOD=0, asset_cache=None, mesh_registry=None, import_material=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0, instancing_mode="OBJECTS"):
     parser = SdlParser(path=filepath)
 
-    obj_instances, dependencies = parser.read(recursive=True)
+    obj_batch, dependencies = parser.read_batch(recursive=True)
+    batches = [obj_batch]
+    asset_index = get_asset_index(game_path)
     while True:
         if len(dependencies) == 0:
             break
         next_dependancy = dependencies.pop(0)
         logger.info("Loading dependency: " + str(next_dependancy))
-        if os.path.exists(os.path.join(game_path, next_dependancy + ".sdl")):
-            next_parser = SdlParser(path=os.path.join(game_path, next_dependancy + ".sdl"))
-            instances, next_dependencies = next_parser.read(recursive=True)
+        next_filepath = asset_index.resolve(next_dependancy + ".sdl")
+        if next_filepath is not None:
+            next_parser = SdlParser(path=next_filepath)
+            next_batch, next_dependencies = next_parser.read_batch(recursive=True)
             #logger.info("Found dependency: " + str(next_dependencies))
-            obj_instances.extend(instances)
+            batches.append(next_batch)
             dependencies.extend(next_dependencies)
+    obj_batch = concatenate_batches(batches)
 
 
 
@@ -38,12 +44,12 @@ def load_sdl(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, import_m
 
     zone_names = []
     zone_collection_dict = {}
-    for obj_instance in obj_instances:
-        if obj_instance["zone"] not in zone_names:
-            zone_names.append(obj_instance["zone"])
+    for zone in obj_batch.zones:
+        if zone not in zone_names:
+            zone_names.append(zone)
     for zone_name in zone_names:
         zone_collection = bpy.data.collections.new(zone_name)
         scene_collection.children.link(zone_collection)
         zone_collection_dict[zone_name] = zone_collection
 
-    return load_object_instances(obj_instances, scene_collection, game_path, LOD, mesh_cache, mesh_hashes, zone_collection_dict=zone_collection_dict, load_materials=import_material, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache)
+    return load_instances(obj_batch, scene_collection, game_path, LOD, asset_cache, mesh_registry, zone_collection_dict=zone_collection_dict, load_materials=import_material, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, max_texture_size=max_texture_size, instancing_mode=instancing_mode)
@@ -1,120 +1,25 @@
-import struct
 import os
 import json
 import math
 import logging
 logger = logging.getLogger("mhworld_import")
 
-class Reader():
-    def __init__(self, data):
-        self.offset = 0
-        self.data = data
-    
-    def read(self, kind, size):
-        result = struct.unpack(kind, self.data[self.offset:self.offset+size])[0]
-        self.offset += size
-        return result
-
-    def seek(self, offset, start = None):
-        if start is None:
-            self.offset = offset
-        else:
-            self.offset += offset
-
-    def readUInt(self):
-        return self.read("I", 4)
-    
-    def readInt(self):
-        return self.read("i", 4)
-        
-    def readUInt64(self):
-        return self.read("Q", 8)
-    
-    def readHalf(self):
-        return self.read("e", 2)
-
-    def readFloat(self):
-        return self.read("f", 4)
-
-    def readShort(self):
-        return self.read("h", 2)
-    
-    def readUShort(self):
-        return self.read("H", 2)
-
-    def readByte(self):
-        return self.read("b", 1)
-    
-    def readBytes(self, size):
-        return self.data[self.offset:self.offset + size]
-    
-    def readUByte(self):
-        return self.read("B", 1)
-
-    def readString(self):
-        text = ""
-        while True:
-            char = self.readUByte()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-    
-    def readStringUTFAt(self, offset):
-        previous_offset = self.tell()
-        self.seek(offset)
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        self.seek(previous_offset)
-        return text
-
-    def readStringUTF(self):
-        text = ""
-        while True:
-            char = self.readUShort()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-
-    def allign(self, size):
-        self.offset = (int((self.offset)/size)*size)+size
-        
-    def tell(self):
-        return self.offset
-    
-    def getSize(self):
-        return len(self.data)
-
-def euler_to_quaternion(euler):
-    lacet = euler[2]
-    tangage = euler[1]
-    roulis = euler[0]
-    qx = math.sin(roulis/2) * math.cos(tangage/2) * math.cos(lacet/2) - math.cos(roulis/2) * math.sin(tangage/2) * math.sin(lacet/2)
-    qy = math.cos(roulis/2) * math.sin(tangage/2) * math.cos(lacet/2) + math.sin(roulis/2) * math.cos(tangage/2) * math.sin(lacet/2)
-    qz = math.cos(roulis/2) * math.cos(tangage/2) * math.sin(lacet/2) - math.sin(roulis/2) * math.sin(tangage/2) * math.cos(lacet/2)
-    qw = math.cos(roulis/2) * math.cos(tangage/2) * math.cos(lacet/2) + math.sin(roulis/2) * math.sin(tangage/2) * math.sin(lacet/2)
-    return [qx, qy, qz, qw]
+from ..common.reader import Reader, read_file, closes_reader
+from ..common.transforms import euler_to_quaternion
+from ..common.instance_batch import InstanceBatch
 
 class SdlParser():
-    def __init__(self, path=None, data=None):
+    def __init__(self, path=None, data=None, use_mmap=True):
         self.path = path
         #self.basename = None
         if data is None:
-            with open(path, "rb") as file_in:
-                data = file_in.read()
+            data = read_file(path, use_mmap=use_mmap)
             #self.basename = os.path.splitext(os.path.basename(self.path))[0]
         self.bs = Reader(data)
         
     
-    def read(self, recursive=False):
+    @closes_reader
+    def read_batch(self, recursive=False):
         self.magic = self.bs.readUInt()
 
         if self.magic != 4998227:
@@ -230,33 +135,46 @@ class SdlParser():
                     "dependency_path":self.bs.readString().replace("\\", "/")
                 }
 
-        object_instances = []
+        positions = []
+        rotations = []
+        scales = []
+        paths = []
+        names = []
         dependencies = []
+        # Rotated placements and their euler angles, converted all at once
+        euler_indices = []
+        eulers = []
         
         for thing_info in thing_infos:
             if thing_info["thing_name"] == "mpModel" or thing_info["thing_name"] == "mGeometry":
-                object_instance = {}
-                
-                object_instance["path"] = thing_info["data"]["model_path"]
                 parent_idx = thing_info["thing_parent"]
-                object_instance["name"] = thing_infos[parent_idx]["thing_name"]
-                
-                object_instance["position"] = [0.0, 0.0, 0.0]
-                object_instance["rotation"] = [0.0, 0.0, 0.0, 1.0]
-                object_instance["scale"] = [1.0, 1.0, 1.0]
+                position = [0.0, 0.0, 0.0]
+                scale = [1.0, 1.0, 1.0]
                 for child_idx in thing_infos[parent_idx]["children"]:
                     
                     if thing_infos[child_idx]["thing_name"] == "mPos":
-                        object_instance["position"] = thing_infos[child_idx]["data"]["pos"].copy()
+                        position = thing_infos[child_idx]["data"]["pos"]
                     elif thing_infos[child_idx]["thing_name"] == "mAngle":
-                        object_instance["rotation"] = euler_to_quaternion(thing_infos[child_idx]["data"]["euler"])
+                        euler_indices.append(len(paths))
+                        eulers.append(thing_infos[child_idx]["data"]["euler"])
                     elif thing_infos[child_idx]["thing_name"] == "mScale":
-                        object_instance["scale"] = thing_infos[child_idx]["data"]["scl"].copy()
-                object_instance["zone"] = "UNKNOWN"
-                object_instances.append(object_instance)
+                        scale = thing_infos[child_idx]["data"]["scl"]
+                positions.append(position)
+                rotations.append([0.0, 0.0, 0.0, 1.0])
+                scales.append(scale)
+                paths.append(thing_info["data"]["model_path"])
+                names.append(thing_infos[parent_idx]["thing_name"])
             if thing_info["thing_name"] == "mpScheduler" and recursive:
                 dependencies.append(thing_info["data"]["dependency_path"])
-        return object_instances, dependencies
+        obj_batch = InstanceBatch(positions, rotations, scales, paths, ["UNKNOWN"]*len(paths), [{"name":name} for name in names])
+        if len(eulers):
+            obj_batch.rotations[euler_indices] = euler_to_quaternion(eulers)
+        return obj_batch, dependencies
+
+    @closes_reader
+    def read(self, recursive=False):
+        obj_batch, dependencies = self.read_batch(recursive=recursive)
+        return obj_batch.to_instances(), dependencies
 
 #if __name__ == "__main__":
     #parser = SdlParser(path="st101.sdl")
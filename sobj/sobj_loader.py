@@ -4,18 +4,19 @@ from mathutils import Vector, Matrix, Euler, Quaternion
 import os
 import logging
 import math
-from glob import glob
 
 from .sobj_parser import SobjParser
-from ..common.object_loader import load_object_instances
+from ..common.instancing import load_instances
+from ..common.instance_batch import InstanceBatch
+from ..common.asset_index import get_asset_index
 
 logger = logging.getLogger("mhworld_import")
 
 
 
-def load_sobj(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, use_png_cache=True, import_material=True, overwrite_png_cache=False, override_collection=None):
+def load_sobj(game_path, filepath, LOD=0, asset_cache=None, mesh_registry=None, use_png_cache=True, import_material=True, overwrite_png_cache=False, max_texture_size=0, override_collection=None, instancing_mode="OBJECTS"):
     parser = SobjParser(path=filepath)
-    obj_instances_raw = parser.read()
+    obj_batch_raw = parser.read_batch()
 
     ressouce_swap = {
         "gm000_005_00":{
@@ -273,45 +274,54 @@ def load_sobj(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, use_png
         #"gm000_095_00": "cmn006_000_00", # spiderweb
         #"gm000_133_00": "cmn002_000_00" # chillshroom
     #}
-    obj_instance_i = 0
-    obj_instances = []
-    for obj_instance_raw in obj_instances_raw:
-        obj_instance = obj_instance_raw.copy()
-        if obj_instance_raw["name"] in ressouce_swap.keys():
-            obj_instance["no_cache"] = True
-            obj_instance["name"] = ressouce_swap[obj_instance_raw["name"]]["model_swap"]
-            obj_instance["original_name"] = obj_instance_raw["name"]
-            if "textures_swap" in ressouce_swap[obj_instance_raw["name"]].keys():
-                obj_instance["textures_swap"] = ressouce_swap[obj_instance_raw["name"]]["textures_swap"]
-            if "material_suffix" in ressouce_swap[obj_instance_raw["name"]].keys():
-                obj_instance["material_suffix"] = ressouce_swap[obj_instance_raw["name"]]["material_suffix"]
-        else:
-            obj_instance["name"] = obj_instance_raw["name"]
+    asset_index = get_asset_index(game_path)
+    # Placements only have a name, every placement of a name resolves to the
+    # same model: each name is resolved once, the transforms stay as arrays
+    resolved_names = {}
+    paths = []
+    overloads = []
+    for raw_name in obj_batch_raw.paths:
+        if raw_name not in resolved_names:
+            obj_instance = {}
+            if raw_name in ressouce_swap.keys():
+                obj_instance["no_cache"] = True
+                obj_instance["name"] = ressouce_swap[raw_name]["model_swap"]
+                obj_instance["original_name"] = raw_name
+                if "textures_swap" in ressouce_swap[raw_name].keys():
+                    obj_instance["textures_swap"] = ressouce_swap[raw_name]["textures_swap"]
+                if "material_suffix" in ressouce_swap[raw_name].keys():
+                    obj_instance["material_suffix"] = ressouce_swap[raw_name]["material_suffix"]
+            else:
+                obj_instance["name"] = raw_name
 
-        name_components = obj_instance["name"].split("_")
-        primary = name_components[0]
-        secondary = name_components[1].zfill(3)
-        if len(name_components) > 2:
-            tercary = name_components[2].zfill(2)
-        else:
-            tercary="00"
-        tentative_paths = [
-            os.path.join(game_path, "Assets/gm/"+primary+"/"+primary+"_"+secondary),
-            os.path.join(game_path, "Assets/gm/"+primary+"/"+primary+"_000")
-        ]
-        candidate_mod3 = []
-        for tentative_path in tentative_paths:
-            #print(glob(tentative_path+"/**/"+primary+"_"+secondary+".mod3", recursive=True))
-            candidate_mod3.extend(glob(tentative_path+"/**/"+primary+"_"+secondary+".mod3", recursive=True))
-            candidate_mod3.extend(glob(tentative_path+"/**/"+primary+"_"+secondary+"_"+tercary+".mod3", recursive=True))
-        if len(candidate_mod3) > 0:
-            obj_instance["path"] = candidate_mod3[0][:-5]
-        else:
-            obj_instance["as_empty"] = True
-            obj_instance["path"] = obj_instance["name"]
-            #print("COULD NOT RESOLVE INSTANCE TYPE: ", str(obj_instance_raw["name"]))
-            pass
-        obj_instances.append(obj_instance)
+            name_components = obj_instance["name"].split("_")
+            primary = name_components[0]
+            secondary = name_components[1].zfill(3)
+            if len(name_components) > 2:
+                tercary = name_components[2].zfill(2)
+            else:
+                tercary="00"
+            tentative_paths = [
+                os.path.join(game_path, "Assets/gm/"+primary+"/"+primary+"_"+secondary),
+                os.path.join(game_path, "Assets/gm/"+primary+"/"+primary+"_000")
+            ]
+            candidate_mod3 = []
+            for tentative_path in tentative_paths:
+                #print(glob(tentative_path+"/**/"+primary+"_"+secondary+".mod3", recursive=True))
+                candidate_mod3.extend(asset_index.find(tentative_path, primary+"_"+secondary+".mod3"))
+                candidate_mod3.extend(asset_index.find(tentative_path, primary+"_"+secondary+"_"+tercary+".mod3"))
+            if len(candidate_mod3) > 0:
+                obj_instance["path"] = candidate_mod3[0][:-5]
+            else:
+                obj_instance["as_empty"] = True
+                obj_instance["path"] = obj_instance["name"]
+                #print("COULD NOT RESOLVE INSTANCE TYPE: ", str(raw_name))
+                pass
+            resolved_names[raw_name] = (obj_instance.pop("path"), obj_instance)
+        path, overload = resolved_names[raw_name]
+        paths.append(path)
+        overloads.append(overload)
+    obj_batch = InstanceBatch(obj_batch_raw.positions, obj_batch_raw.rotations, obj_batch_raw.scales, paths, obj_batch_raw.zones, overloads)
 
     scn_name = os.path.basename(filepath)
     if override_collection is not None:
@@ -326,12 +336,12 @@ def load_sobj(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, use_png
 
     zone_names = []
     zone_collection_dict = {}
-    for obj_instance in obj_instances:
-        if obj_instance["zone"] not in zone_names:
-            zone_names.append(obj_instance["zone"])
+    for zone in obj_batch.zones:
+        if zone not in zone_names:
+            zone_names.append(zone)
     for zone_name in zone_names:
         zone_collection = bpy.data.collections.new(zone_name)
         scene_collection.children.link(zone_collection)
         zone_collection_dict[zone_name] = zone_collection
 
-    return load_object_instances(obj_instances, scene_collection, game_path, LOD, mesh_cache, mesh_hashes, zone_collection_dict=zone_collection_dict, load_materials=import_material, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache)
+    return load_instances(obj_batch, scene_collection, game_path, LOD, asset_cache, mesh_registry, zone_collection_dict=zone_collection_dict, load_materials=import_material, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, max_texture_size=max_texture_size, instancing_mode=instancing_mode)
@@ -7,11 +7,11 @@ import math
 
 from .sobj_loader import load_sobj
 from .sobjl_parser import SobjlParser
-from ..common.object_loader import load_object_instances
+from ..common.asset_index import get_asset_index
 
 logger = logging.getLogger("mhworld_import")
 
-def load_sobjl(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, import_material=True, use_png_cache=True, overwrite_png_cache=False):
+def load_sobjl(game_path, filepath, LOD=0, asset_cache=None, mesh_registry=None, import_material=True, use_png_cache=True, overwrite_png_cache=False, max_texture_size=0, instancing_mode="OBJECTS"):
 
     parser = SobjlParser(path=filepath)
     dependencies = parser.read()
@@ -22,19 +22,23 @@ def load_sobjl(game_path, filepath, LOD=0, mesh_cache={}, mesh_hashes={}, import
     sobjl_collection = bpy.data.collections.new(scn_name)
     master_collection.children.link(sobjl_collection)
 
+    asset_index = get_asset_index(game_path)
     for dependency in dependencies:
-        if os.path.exists(os.path.join(game_path, dependency + ".sobj")):
+        dependency_filepath = asset_index.resolve(dependency + ".sobj")
+        if dependency_filepath is not None:
             #try:
             object_instances.extend(load_sobj(
                 game_path=game_path,
-                filepath=os.path.join(game_path, dependency + ".sobj"),
+                filepath=dependency_filepath,
                 LOD=LOD,
-                mesh_cache=mesh_cache,
-                mesh_hashes=mesh_hashes,
+                asset_cache=asset_cache,
+                mesh_registry=mesh_registry,
                 import_material=import_material,
                 use_png_cache=use_png_cache,
                 overwrite_png_cache=overwrite_png_cache,
-                override_collection = sobjl_collection
+                max_texture_size=max_texture_size,
+                override_collection = sobjl_collection,
+                instancing_mode=instancing_mode
             ))
             #except:
                 #logger.warning("Error while importing sobj (path=" + os.path.join(game_path, dependency + ".sobj") + ")")
@@ -10,6 +10,12 @@ logger = logging.getLogger("mhworld_import")
 
 from .sobj_loader import load_sobj
 from .sobjl_loader import load_sobjl
+from ..common.mesh_registry import get_mesh_registry
+from ..common.asset_cache import AssetCache
+from ..common.asset_index import get_asset_index
+from ..tex.texture_cache import get_texture_cache
+from ..common.instancing import INSTANCING_MODE_ITEMS
+from ..tex.tex_loader import MAX_TEXTURE_SIZE_ITEMS
 
 class IMPORT_PT_SobjSettingPanel_1(Panel):
     bl_space_type = 'FILE_BROWSER'
@@ -29,6 +35,7 @@ class IMPORT_PT_SobjSettingPanel_1(Panel):
 
         layout.prop(operator, 'LOD')
         layout.prop(operator, 'import_material')
+        layout.prop(operator, 'instancing_mode')
 
 
 class IMPORT_PT_SobjSettingPanel_2(Panel):
@@ -54,6 +61,7 @@ class IMPORT_PT_SobjSettingPanel_2(Panel):
         row = layout.row()
         row.enabled = operator.use_png_cache
         row.prop(operator, 'overwrite_png_cache')
+        layout.prop(operator, 'max_texture_size')
 
 def SetLoggingLevel(level):
     if level == "DEBUG":
@@ -76,8 +84,20 @@ class ImportSobj(bpy.types.Operator, ImportHelper):
     filter_glob: bpy.props.StringProperty(default="*.sobj")
     LOD: bpy.props.IntProperty(name="LoD", description="Import a specific Level of Detail (lower is more detailed)", default=0, min=0, max=10, step=1)
     import_material: bpy.props.BoolProperty(name="Import material", description="Import the material .mrl3 files",  default=True)
-    use_png_cache: bpy.props.BoolProperty(name="Use PNG cache", description="Save a copy of imported .tex in a .png file next to it (subsequent imports will be much faster)", default=True)
-    overwrite_png_cache: bpy.props.BoolProperty(name="Overwrite PNG cache", description="Overwrite cached .png", default=False)
+    use_png_cache: bpy.props.BoolProperty(name="Use texture cache", description="Save a copy of imported .tex in the texture cache directory set in the addon preferences (subsequent imports will be much faster)", default=True)
+    overwrite_png_cache: bpy.props.BoolProperty(name="Overwrite texture cache", description="Overwrite the cached copies of imported .tex", default=False)
+    max_texture_size: bpy.props.EnumProperty(
+        name="Max texture size",
+        description="Import textures at a reduced resolution (their mip levels are used). They can be reloaded at full resolution later",
+        items = MAX_TEXTURE_SIZE_ITEMS,
+        default = '0'
+    )
+    instancing_mode: bpy.props.EnumProperty(
+        name="Instancing",
+        description="How placements of the same asset are created",
+        items = INSTANCING_MODE_ITEMS,
+        default = 'OBJECTS'
+    )
 
     def draw(self, context):
         pass
@@ -112,14 +132,15 @@ class ImportSobj(bpy.types.Operator, ImportHelper):
                         por.append(i)
                 data_to.node_groups = por
 
-        mesh_cache = {}
-        logger.info("Building mesh hashes...")
-        mesh_hashes = {}
-        for mesh_name in bpy.data.meshes.keys():
-            mesh_hashes[mesh_name] = hash(str([x.co for x in bpy.data.meshes[mesh_name].vertices]))
+        get_asset_index(addon_prefs.game_path, addon_prefs.cache_dir)
+        texture_cache = get_texture_cache(addon_prefs.cache_dir, addon_prefs.texture_cache_size*1024*1024, addon_prefs.texture_cache_codec)
+        asset_cache = AssetCache(max_bytes=addon_prefs.asset_cache_size*1024*1024)
+        mesh_registry = get_mesh_registry()
 
         for filepath in filepaths:
-            load_sobj(addon_prefs.game_path, filepath, LOD=self.LOD, mesh_cache=mesh_cache, mesh_hashes=mesh_hashes, import_material=self.import_material, use_png_cache=self.use_png_cache, overwrite_png_cache=self.overwrite_png_cache)
+            load_sobj(addon_prefs.game_path, filepath, LOD=self.LOD, asset_cache=asset_cache, mesh_registry=mesh_registry, import_material=self.import_material, use_png_cache=self.use_png_cache, overwrite_png_cache=self.overwrite_png_cache, max_texture_size=int(self.max_texture_size), instancing_mode=self.instancing_mode)
+        asset_cache.log_stats()
+        texture_cache.flush()
         return {"FINISHED"}
 
 
@@ -141,6 +162,7 @@ class IMPORT_PT_SobjlSettingPanel_1(Panel):
 
         layout.prop(operator, 'LOD')
         layout.prop(operator, 'import_material')
+        layout.prop(operator, 'instancing_mode')
 
 
 class IMPORT_PT_SobjlSettingPanel_2(Panel):
@@ -166,6 +188,7 @@ class IMPORT_PT_SobjlSettingPanel_2(Panel):
         row = layout.row()
         row.enabled = operator.use_png_cache
         row.prop(operator, 'overwrite_png_cache')
+        layout.prop(operator, 'max_texture_size')
 
 class ImportSobjl(bpy.types.Operator, ImportHelper):
     """Import from Sobj file format (.sobj)"""
@@ -178,8 +201,20 @@ class ImportSobjl(bpy.types.Operator, ImportHelper):
     filter_glob: bpy.props.StringProperty(default="*.sobjl")
     LOD: bpy.props.IntProperty(name="LoD", description="Import a specific Level of Detail (lower is more detailed)", default=0, min=0, max=10, step=1)
     import_material: bpy.props.BoolProperty(name="Import material", description="Import the material .mrl3 files",  default=True)
-    use_png_cache: bpy.props.BoolProperty(name="Use PNG cache", description="Save a copy of imported .tex in a .png file next to it (subsequent imports will be much faster)", default=True)
-    overwrite_png_cache: bpy.props.BoolProperty(name="Overwrite PNG cache", description="Overwrite cached .png", default=False)
+    use_png_cache: bpy.props.BoolProperty(name="Use texture cache", description="Save a copy of imported .tex in the texture cache directory set in the addon preferences (subsequent imports will be much faster)", default=True)
+    overwrite_png_cache: bpy.props.BoolProperty(name="Overwrite texture cache", description="Overwrite the cached copies of imported .tex", default=False)
+    max_texture_size: bpy.props.EnumProperty(
+        name="Max texture size",
+        description="Import textures at a reduced resolution (their mip levels are used). They can be reloaded at full resolution later",
+        items = MAX_TEXTURE_SIZE_ITEMS,
+        default = '0'
+    )
+    instancing_mode: bpy.props.EnumProperty(
+        name="Instancing",
+        description="How placements of the same asset are created",
+        items = INSTANCING_MODE_ITEMS,
+        default = 'OBJECTS'
+    )
 
     def draw(self, context):
         pass
@@ -214,12 +249,13 @@ class ImportSobjl(bpy.types.Operator, ImportHelper):
                         por.append(i)
                 data_to.node_groups = por
 
-        mesh_cache = {}
-        logger.info("Building mesh hashes...")
-        mesh_hashes = {}
-        for mesh_name in bpy.data.meshes.keys():
-            mesh_hashes[mesh_name] = hash(str([x.co for x in bpy.data.meshes[mesh_name].vertices]))
+        get_asset_index(addon_prefs.game_path, addon_prefs.cache_dir)
+        texture_cache = get_texture_cache(addon_prefs.cache_dir, addon_prefs.texture_cache_size*1024*1024, addon_prefs.texture_cache_codec)
+        asset_cache = AssetCache(max_bytes=addon_prefs.asset_cache_size*1024*1024)
+        mesh_registry = get_mesh_registry()
 
         for filepath in filepaths:
-            load_sobjl(addon_prefs.game_path, filepath, LOD=self.LOD, mesh_cache=mesh_cache, mesh_hashes=mesh_hashes, import_material=self.import_material, use_png_cache=self.use_png_cache, overwrite_png_cache=self.overwrite_png_cache)
+            load_sobjl(addon_prefs.game_path, filepath, LOD=self.LOD, asset_cache=asset_cache, mesh_registry=mesh_registry, import_material=self.import_material, use_png_cache=self.use_png_cache, overwrite_png_cache=self.overwrite_png_cache, max_texture_size=int(self.max_texture_size), instancing_mode=self.instancing_mode)
+        asset_cache.log_stats()
+        texture_cache.flush()
         return {"FINISHED"}
@@ -0,0 +1,86 @@
+# Write and read time of the texture cache formats on a synthetic texture.
+# In Blender every format is measured, reading included:
+#     blender -b --factory-startup --python benchmark_cache_codecs.py -- [size] [repeats]
+# With a plain python only the writers of image_writers.py are:
+#     python benchmark_cache_codecs.py [size] [repeats]
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+spec = importlib.util.spec_from_file_location("image_writers", os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_writers.py"))
+image_writers = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(image_writers)
+
+def make_pixels(size, float_buffer):
+    # Smooth gradients with some noise, compresses roughly like real textures
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    pixels = np.stack([x, y, (x+y)/2, np.ones_like(x)], axis=-1)
+    pixels[:,:,:3] += rng.normal(0, 0.02, (size, size, 3)).astype(np.float32)
+    if float_buffer:
+        pixels[:,:,:3] *= 8.0
+    else:
+        pixels = np.round(np.clip(pixels, 0, 1)*255)/255
+    return pixels.astype(np.float32).ravel()
+
+def blender_writer(file_format, float_buffer):
+    def write(filepath, pixels, width, height):
+        img = bpy.data.images.new("benchmark", width=width, height=height, alpha=True, float_buffer=float_buffer, is_data=True)
+        img.pixels.foreach_set(pixels)
+        img.filepath_raw = filepath
+        img.file_format = file_format
+        img.save()
+        bpy.data.images.remove(img)
+    return write
+
+def blender_read(filepath, size):
+    img = bpy.data.images.load(filepath)
+    pixels = np.empty(size*size*4, dtype=np.float32)
+    img.pixels.foreach_get(pixels)
+    bpy.data.images.remove(img)
+
+def benchmark(name, extension, writer, float_buffer, size, repeats, directory):
+    pixels = make_pixels(size, float_buffer)
+    filepath = os.path.join(directory, "benchmark_" + name + extension)
+    write_timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        writer(filepath, pixels, size, size)
+        write_timings.append(time.perf_counter() - start)
+    line = name.ljust(9) + " write " + str(round(min(write_timings)*1000, 1)).rjust(8) + " ms"
+    if bpy is not None:
+        read_timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            blender_read(filepath, size)
+            read_timings.append(time.perf_counter() - start)
+        line += ", read " + str(round(min(read_timings)*1000, 1)).rjust(8) + " ms"
+    line += ", " + str(round(os.path.getsize(filepath)/(1024*1024), 2)).rjust(7) + " MB"
+    print(line)
+    os.remove(filepath)
+
+if __name__ == "__main__":
+    arguments = sys.argv[sys.argv.index("--")+1:] if "--" in sys.argv else sys.argv[1:]
+    size = int(arguments[0]) if len(arguments) > 0 else 2048
+    repeats = int(arguments[1]) if len(arguments) > 1 else 3
+    # name: (extension, writer, float buffer)
+    codecs = {
+        "TGA":(".tga", image_writers.write_tga, False),
+        "EXR_HALF":(".exr", image_writers.write_exr_half, True),
+    }
+    if bpy is not None:
+        codecs["PNG"] = (".png", blender_writer("PNG", False), False)
+        codecs["EXR"] = (".exr", blender_writer("OPEN_EXR", True), True)
+    else:
+        print("Not running in Blender, only measuring the python writers")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (extension, writer, float_buffer) in codecs.items():
+            benchmark(name, extension, writer, float_buffer, size, repeats, directory)
@@ -0,0 +1,45 @@
+# Decoding throughput of the compiled block decoders, run outside of Blender:
+#     python benchmark_decoders.py [size] [repeats]
+# Blocks are random bytes, which goes through every mode of BC6H and BC7.
+import ctypes
+import os
+import sys
+import time
+import numpy as np
+
+shared_library_filename = "read_dxgi_format.dll" if sys.platform == "win32" else "read_dxgi_format.so"
+lib = ctypes.cdll.LoadLibrary(os.path.join(os.path.dirname(os.path.abspath(__file__)), shared_library_filename))
+
+# name: (function, output dtype, extra arguments)
+DECODERS = {
+    "BC1":("read_bc1", np.uint8, ()),
+    "BC7":("read_bc7", np.uint8, ()),
+    "BC6H_UF16":("read_bc6h", np.float32, (0,)),
+    "BC6H_SF16":("read_bc6h", np.float32, (1,)),
+}
+BLOCK_BYTES = {"BC1":8, "BC7":16, "BC6H_UF16":16, "BC6H_SF16":16}
+
+def benchmark(name, size, repeats):
+    function_name, dtype, extra_arguments = DECODERS[name]
+    if not hasattr(lib, function_name):
+        print(name + ": not exported by " + shared_library_filename + ", rebuild it")
+        return
+    function = getattr(lib, function_name)
+    function.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint] + [ctypes.c_uint]*len(extra_arguments)
+    function.restype = ctypes.c_int
+    src = np.random.default_rng(0).integers(0, 256, (size//4)*(size//4)*BLOCK_BYTES[name], dtype=np.uint8)
+    dst = np.empty([size, size, 4], dtype=dtype)
+    function(src.ctypes.data, dst.ctypes.data, size, size, *extra_arguments)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(src.ctypes.data, dst.ctypes.data, size, size, *extra_arguments)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(name.ljust(10) + " " + str(size) + "x" + str(size) + ": " + str(round(best*1000, 2)).rjust(8) + " ms, " + str(round(size*size/best/1e6, 1)).rjust(8) + " Mpixel/s")
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    for name in DECODERS.keys():
+        benchmark(name, size, repeats)
@@ -0,0 +1,81 @@
+import bpy
+
+import abc
+
+from .image_writers import write_tga, write_exr_half
+from .tex_parser import FLOAT_FORMATS
+
+class CacheCodec(abc.ABC):
+    # How a decoded texture is written to the texture cache. write gets the
+    # pixels in Blender's layout and returns the image it filled if it went
+    # through Blender's encoder, None when the loader has to load the file.
+    __slots__ = ["name", "extension", "description"]
+
+    def __init__(self, name, extension, description):
+        self.name = name
+        self.extension = extension
+        self.description = description
+
+    @abc.abstractmethod
+    def write(self, filepath, pixels, width, height, image_name):
+        pass
+
+class BlenderCodec(CacheCodec):
+    __slots__ = ["file_format", "float_buffer"]
+
+    def __init__(self, name, extension, description, file_format, float_buffer=False):
+        super().__init__(name, extension, description)
+        self.file_format = file_format
+        self.float_buffer = float_buffer
+
+    def write(self, filepath, pixels, width, height, image_name):
+        img = bpy.data.images.new(image_name, width=width, height=height, alpha=True, float_buffer=self.float_buffer, is_data=True)
+        img.pixels.foreach_set(pixels)
+        img.filepath_raw = filepath
+        img.file_format = self.file_format
+        img.save()
+        return img
+
+class WriterCodec(CacheCodec):
+    __slots__ = ["writer"]
+
+    def __init__(self, name, extension, description, writer):
+        super().__init__(name, extension, description)
+        self.writer = writer
+
+    def write(self, filepath, pixels, width, height, image_name):
+        self.writer(filepath, pixels, width, height)
+        return None
+
+CACHE_CODECS = {
+    "PNG":BlenderCodec("PNG", ".png", "Compressed by Blender, smallest files but slow to write", "PNG"),
+    "TGA":WriterCodec("TGA", ".tga", "Uncompressed, fast to write and read but about 4 times larger than PNG", write_tga),
+    "EXR":BlenderCodec("EXR", ".exr", "Float images, full float OpenEXR written by Blender", "OPEN_EXR", float_buffer=True),
+    "EXR_HALF":WriterCodec("EXR_HALF", ".exr", "Float images, uncompressed half float OpenEXR", write_exr_half),
+}
+
+# Choices of the "Texture cache format" preference, float textures always use OpenEXR
+CACHE_CODEC_ITEMS = [
+    ('TGA','TGA',CACHE_CODECS["TGA"].description,'',0),
+    ('PNG','PNG',CACHE_CODECS["PNG"].description,'',1),
+]
+
+def get_cache_codec(codec_name, DXGI_format):
+    if DXGI_format == "VECTOR_F32":
+        return CACHE_CODECS["EXR"]
+    if DXGI_format in FLOAT_FORMATS:
+        # Those are half floats to begin with
+        return CACHE_CODECS["EXR_HALF"]
+    return CACHE_CODECS.get(codec_name, CACHE_CODECS["PNG"])
+
+def get_cache_extensions(codec_name, DXGI_format):
+    # Extensions a cached copy may have, the one of the current codec first,
+    # entries written with another codec are still used
+    codec = get_cache_codec(codec_name, DXGI_format)
+    extensions = [codec.extension]
+    if codec.extension != ".exr":
+        for other_codec in CACHE_CODEC_ITEMS:
+            extension = CACHE_CODECS[other_codec[0]].extension
+            if extension not in extensions:
+                extensions.append(extension)
+    return extensions
@@ -0,0 +1,50 @@
+import struct
+import numpy as np
+
+# Writers for the texture cache formats Blender reads back, taking the pixels
+# as Blender lays them out: flat float32 RGBA, bottom row first. They don't
+# need bpy and skip the compression Blender's encoders spend most time in.
+
+def write_tga(filepath, pixels, width, height):
+    # Uncompressed 32 bits BGRA, origin at the bottom left like Blender
+    header = struct.pack("<BBBHHBHHHHBB", 0, 0, 2, 0, 0, 0, 0, 0, width, height, 32, 8)
+    rgba = np.asarray(pixels, dtype=np.float32).reshape(height, width, 4)
+    bgra = (np.clip(rgba[:,:,[2, 1, 0, 3]], 0.0, 1.0)*255.0 + 0.5).astype(np.uint8)
+    with open(filepath, "wb") as tga_file:
+        tga_file.write(header)
+        tga_file.write(bgra.tobytes())
+
+def exr_attribute(name, attribute_type, value):
+    return name.encode("ascii") + b"\0" + attribute_type.encode("ascii") + b"\0" + np.int32(len(value)).tobytes() + value
+
+def write_exr_half(filepath, pixels, width, height):
+    # Single part scanline OpenEXR, half float RGBA, no compression
+    channels = b""
+    for channel_name in (b"A", b"B", b"G", b"R"):
+        channels += channel_name + b"\0" + np.array([1, 0, 1, 1], dtype=np.int32).tobytes()
+    channels += b"\0"
+    window = np.array([0, 0, width-1, height-1], dtype=np.int32).tobytes()
+    header = np.array([20000630, 2], dtype=np.int32).tobytes()
+    header += exr_attribute("channels", "chlist", channels)
+    header += exr_attribute("compression", "compression", b"\0")
+    header += exr_attribute("dataWindow", "box2i", window)
+    header += exr_attribute("displayWindow", "box2i", window)
+    header += exr_attribute("lineOrder", "lineOrder", b"\0")
+    header += exr_attribute("pixelAspectRatio", "float", np.float32(1.0).tobytes())
+    header += exr_attribute("screenWindowCenter", "v2f", np.zeros(2, dtype=np.float32).tobytes())
+    header += exr_attribute("screenWindowWidth", "float", np.float32(1.0).tobytes())
+    header += b"\0"
+
+    # One block per scanline, top row first: y, data size, then the row of
+    # each channel in alphabetical order
+    line_dtype = np.dtype([("y", "<i4"), ("size", "<i4"), ("data", "<f2", (4, width))])
+    lines = np.empty(height, dtype=line_dtype)
+    lines["y"] = np.arange(height, dtype=np.int32)
+    lines["size"] = 4*width*2
+    rgba = np.asarray(pixels, dtype=np.float32).reshape(height, width, 4)[::-1]
+    lines["data"] = rgba[:,:,[3, 2, 1, 0]].transpose(0, 2, 1)
+    offsets = len(header) + 8*height + np.arange(height, dtype=np.uint64)*np.uint64(line_dtype.itemsize)
+    with open(filepath, "wb") as exr_file:
+        exr_file.write(header)
+        exr_file.write(offsets.astype("<u8").tobytes())
+        exr_file.write(lines.tobytes())
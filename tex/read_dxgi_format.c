@@ -288,6 +288,74 @@ EXPORT int read_bc5(void* v_src, void* v_dst, uint32_t width, uint32_t height) {
     return 0;
 }
 
+// Two regions partitions, also used by BC6H (its 32 partitions are the first ones)
+static uint8_t partition_2_list[64][16] = {
+    {0,0,1,1,0,0,1,1,0,0,1,1,0,0,1,1},
+    {0,0,0,1,0,0,0,1,0,0,0,1,0,0,0,1},
+    {0,1,1,1,0,1,1,1,0,1,1,1,0,1,1,1},
+    {0,0,0,1,0,0,1,1,0,0,1,1,0,1,1,1},
+    {0,0,0,0,0,0,0,1,0,0,0,1,0,0,1,1},
+    {0,0,1,1,0,1,1,1,0,1,1,1,1,1,1,1},
+    {0,0,0,1,0,0,1,1,0,1,1,1,1,1,1,1},
+    {0,0,0,0,0,0,0,1,0,0,1,1,0,1,1,1},
+    {0,0,0,0,0,0,0,0,0,0,0,1,0,0,1,1},
+    {0,0,1,1,0,1,1,1,1,1,1,1,1,1,1,1},
+    {0,0,0,0,0,0,0,1,0,1,1,1,1,1,1,1},
+    {0,0,0,0,0,0,0,0,0,0,0,1,0,1,1,1},
+    {0,0,0,1,0,1,1,1,1,1,1,1,1,1,1,1},
+    {0,0,0,0,0,0,0,0,1,1,1,1,1,1,1,1},
+    {0,0,0,0,1,1,1,1,1,1,1,1,1,1,1,1},
+    {0,0,0,0,0,0,0,0,0,0,0,0,1,1,1,1},
+    {0,0,0,0,1,0,0,0,1,1,1,0,1,1,1,1},
+    {0,1,1,1,0,0,0,1,0,0,0,0,0,0,0,0},
+    {0,0,0,0,0,0,0,0,1,0,0,0,1,1,1,0},
+    {0,1,1,1,0,0,1,1,0,0,0,1,0,0,0,0},
+    {0,0,1,1,0,0,0,1,0,0,0,0,0,0,0,0},
+    {0,0,0,0,1,0,0,0,1,1,0,0,1,1,1,0},
+    {0,0,0,0,0,0,0,0,1,0,0,0,1,1,0,0},
+    {0,1,1,1,0,0,1,1,0,0,1,1,0,0,0,1},
+    {0,0,1,1,0,0,0,1,0,0,0,1,0,0,0,0},
+    {0,0,0,0,1,0,0,0,1,0,0,0,1,1,0,0},
+    {0,1,1,0,0,1,1,0,0,1,1,0,0,1,1,0},
+    {0,0,1,1,0,1,1,0,0,1,1,0,1,1,0,0},
+    {0,0,0,1,0,1,1,1,1,1,1,0,1,0,0,0},
+    {0,0,0,0,1,1,1,1,1,1,1,1,0,0,0,0},
+    {0,1,1,1,0,0,0,1,1,0,0,0,1,1,1,0},
+    {0,0,1,1,1,0,0,1,1,0,0,1,1,1,0,0},
+    {0,1,0,1,0,1,0,1,0,1,0,1,0,1,0,1},
+    {0,0,0,0,1,1,1,1,0,0,0,0,1,1,1,1},
+    {0,1,0,1,1,0,1,0,0,1,0,1,1,0,1,0},
+    {0,0,1,1,0,0,1,1,1,1,0,0,1,1,0,0},
+    {0,0,1,1,1,1,0,0,0,0,1,1,1,1,0,0},
+    {0,1,0,1,0,1,0,1,1,0,1,0,1,0,1,0},
+    {0,1,1,0,1,0,0,1,0,1,1,0,1,0,0,1},
+    {0,1,0,1,1,0,1,0,1,0,1,0,0,1,0,1},
+    {0,1,1,1,0,0,1,1,1,1,0,0,1,1,1,0},
+    {0,0,0,1,0,0,1,1,1,1,0,0,1,0,0,0},
+    {0,0,1,1,0,0,1,0,0,1,0,0,1,1,0,0},
+    {0,0,1,1,1,0,1,1,1,1,0,1,1,1,0,0},
+    {0,1,1,0,1,0,0,1,1,0,0,1,0,1,1,0},
+    {0,0,1,1,1,1,0,0,1,1,0,0,0,0,1,1},
+    {0,1,1,0,0,1,1,0,1,0,0,1,1,0,0,1},
+    {0,0,0,0,0,1,1,0,0,1,1,0,0,0,0,0},
+    {0,1,0,0,1,1,1,0,0,1,0,0,0,0,0,0},
+    {0,0,1,0,0,1,1,1,0,0,1,0,0,0,0,0},
+    {0,0,0,0,0,0,1,0,0,1,1,1,0,0,1,0},
+    {0,0,0,0,0,1,0,0,1,1,1,0,0,1,0,0},
+    {0,1,1,0,1,1,0,0,1,0,0,1,0,0,1,1},
+    {0,0,1,1,0,1,1,0,1,1,0,0,1,0,0,1},
+    {0,1,1,0,0,0,1,1,1,0,0,1,1,1,0,0},
+    {0,0,1,1,1,0,0,1,1,1,0,0,0,1,1,0},
+    {0,1,1,0,1,1,0,0,1,1,0,0,1,0,0,1},
+    {0,1,1,0,0,0,1,1,0,0,1,1,1,0,0,1},
+    {0,1,1,1,1,1,1,0,1,0,0,0,0,0,0,1},
+    {0,0,0,1,1,0,0,0,1,1,1,0,0,1,1,1},
+    {0,0,0,0,1,1,1,1,0,0,1,1,0,0,1,1},
+    {0,0,1,1,0,0,1,1,1,1,1,1,0,0,0,0},
+    {0,0,1,0,0,0,1,0,1,1,1,0,1,1,1,0},
+    {0,1,0,0,0,1,0,0,0,1,1,1,0,1,1,1}
+};
+
 EXPORT int read_bc7(void* v_src, void* v_dst, uint32_t width, uint32_t height) {
     uint8_t* src = (uint8_t*) v_src;
     uint8_t* dst = (uint8_t*) v_dst;
@@ -297,73 +365,6 @@ EXPORT int read_bc7(void* v_src, void* v_dst, uint32_t width, uint32_t height) {
         0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0   
     };
     
-    uint8_t partition_2_list[64][16] = {
-        {0,0,1,1,0,0,1,1,0,0,1,1,0,0,1,1},
-        {0,0,0,1,0,0,0,1,0,0,0,1,0,0,0,1},
-        {0,1,1,1,0,1,1,1,0,1,1,1,0,1,1,1},
-        {0,0,0,1,0,0,1,1,0,0,1,1,0,1,1,1},
-        {0,0,0,0,0,0,0,1,0,0,0,1,0,0,1,1},
-        {0,0,1,1,0,1,1,1,0,1,1,1,1,1,1,1},
-        {0,0,0,1,0,0,1,1,0,1,1,1,1,1,1,1},
-        {0,0,0,0,0,0,0,1,0,0,1,1,0,1,1,1},
-        {0,0,0,0,0,0,0,0,0,0,0,1,0,0,1,1},
-        {0,0,1,1,0,1,1,1,1,1,1,1,1,1,1,1},
-        {0,0,0,0,0,0,0,1,0,1,1,1,1,1,1,1},
-        {0,0,0,0,0,0,0,0,0,0,0,1,0,1,1,1},
-        {0,0,0,1,0,1,1,1,1,1,1,1,1,1,1,1},
-        {0,0,0,0,0,0,0,0,1,1,1,1,1,1,1,1},
-        {0,0,0,0,1,1,1,1,1,1,1,1,1,1,1,1},
-        {0,0,0,0,0,0,0,0,0,0,0,0,1,1,1,1},
-        {0,0,0,0,1,0,0,0,1,1,1,0,1,1,1,1},
-        {0,1,1,1,0,0,0,1,0,0,0,0,0,0,0,0},
-        {0,0,0,0,0,0,0,0,1,0,0,0,1,1,1,0},
-        {0,1,1,1,0,0,1,1,0,0,0,1,0,0,0,0},
-        {0,0,1,1,0,0,0,1,0,0,0,0,0,0,0,0},
-        {0,0,0,0,1,0,0,0,1,1,0,0,1,1,1,0},
-        {0,0,0,0,0,0,0,0,1,0,0,0,1,1,0,0},
-        {0,1,1,1,0,0,1,1,0,0,1,1,0,0,0,1},
-        {0,0,1,1,0,0,0,1,0,0,0,1,0,0,0,0},
-        {0,0,0,0,1,0,0,0,1,0,0,0,1,1,0,0},
-        {0,1,1,0,0,1,1,0,0,1,1,0,0,1,1,0},
-        {0,0,1,1,0,1,1,0,0,1,1,0,1,1,0,0},
-        {0,0,0,1,0,1,1,1,1,1,1,0,1,0,0,0},
-        {0,0,0,0,1,1,1,1,1,1,1,1,0,0,0,0},
-        {0,1,1,1,0,0,0,1,1,0,0,0,1,1,1,0},
-        {0,0,1,1,1,0,0,1,1,0,0,1,1,1,0,0},
-        {0,1,0,1,0,1,0,1,0,1,0,1,0,1,0,1},
-        {0,0,0,0,1,1,1,1,0,0,0,0,1,1,1,1},
-        {0,1,0,1,1,0,1,0,0,1,0,1,1,0,1,0},
-        {0,0,1,1,0,0,1,1,1,1,0,0,1,1,0,0},
-        {0,0,1,1,1,1,0,0,0,0,1,1,1,1,0,0},
-        {0,1,0,1,0,1,0,1,1,0,1,0,1,0,1,0},
-        {0,1,1,0,1,0,0,1,0,1,1,0,1,0,0,1},
-        {0,1,0,1,1,0,1,0,1,0,1,0,0,1,0,1},
-        {0,1,1,1,0,0,1,1,1,1,0,0,1,1,1,0},
-        {0,0,0,1,0,0,1,1,1,1,0,0,1,0,0,0},
-        {0,0,1,1,0,0,1,0,0,1,0,0,1,1,0,0},
-        {0,0,1,1,1,0,1,1,1,1,0,1,1,1,0,0},
-        {0,1,1,0,1,0,0,1,1,0,0,1,0,1,1,0},
-        {0,0,1,1,1,1,0,0,1,1,0,0,0,0,1,1},
-        {0,1,1,0,0,1,1,0,1,0,0,1,1,0,0,1},
-        {0,0,0,0,0,1,1,0,0,1,1,0,0,0,0,0},
-        {0,1,0,0,1,1,1,0,0,1,0,0,0,0,0,0},
-        {0,0,1,0,0,1,1,1,0,0,1,0,0,0,0,0},
-        {0,0,0,0,0,0,1,0,0,1,1,1,0,0,1,0},
-        {0,0,0,0,0,1,0,0,1,1,1,0,0,1,0,0},
-        {0,1,1,0,1,1,0,0,1,0,0,1,0,0,1,1},
-        {0,0,1,1,0,1,1,0,1,1,0,0,1,0,0,1},
-        {0,1,1,0,0,0,1,1,1,0,0,1,1,1,0,0},
-        {0,0,1,1,1,0,0,1,1,1,0,0,0,1,1,0},
-        {0,1,1,0,1,1,0,0,1,1,0,0,1,0,0,1},
-        {0,1,1,0,0,0,1,1,0,0,1,1,1,0,0,1},
-        {0,1,1,1,1,1,1,0,1,0,0,0,0,0,0,1},
-        {0,0,0,1,1,0,0,0,1,1,1,0,0,1,1,1},
-        {0,0,0,0,1,1,1,1,0,0,1,1,0,0,1,1},
-        {0,0,1,1,0,0,1,1,1,1,1,1,0,0,0,0},
-        {0,0,1,0,0,0,1,0,1,1,1,0,1,1,1,0},
-        {0,1,0,0,0,1,0,0,0,1,1,1,0,1,1,1}
-    };
-    
     uint8_t partition_3_list[64][16] = {
         {0,0,1,1,0,0,1,1,0,2,2,1,2,2,2,2},
         {0,0,0,1,0,0,1,1,2,2,1,1,2,2,2,1},
@@ -941,6 +942,239 @@ EXPORT int read_bc7(void* v_src, void* v_dst, uint32_t width, uint32_t height) {
     return 0;
 }
 
+// BC6H endpoint fields, the mode descriptors below say which bits of the
+// block go to which field. W/X are the endpoints of the first region, Y/Z
+// the ones of the second. In transformed modes X, Y and Z are deltas from W.
+enum {BC6H_RW, BC6H_GW, BC6H_BW, BC6H_RX, BC6H_GX, BC6H_BX, BC6H_RY, BC6H_GY, BC6H_BY, BC6H_RZ, BC6H_GZ, BC6H_BZ, BC6H_D};
+
+typedef struct {
+    uint8_t field;
+    uint8_t shift;
+    uint8_t count;
+} bc6h_bits;
+
+typedef struct {
+    uint8_t region_count;
+    uint8_t transformed;
+    uint8_t endpoint_precision;
+    uint8_t delta_precision[3];
+    uint8_t bits_count;
+    bc6h_bits bits[32];
+} bc6h_mode;
+
+// Indexed by the 2 or 5 mode bits, reserved values have no region
+static const bc6h_mode bc6h_modes[32] = {
+    [0x00] = {2, 1, 10, {5, 5, 5}, 20, {
+        {BC6H_GY,4,1}, {BC6H_BY,4,1}, {BC6H_BZ,4,1}, {BC6H_RW,0,10}, {BC6H_GW,0,10}, {BC6H_BW,0,10}, {BC6H_RX,0,5}, {BC6H_GZ,4,1},
+        {BC6H_GY,0,4}, {BC6H_GX,0,5}, {BC6H_BZ,0,1}, {BC6H_GZ,0,4}, {BC6H_BX,0,5}, {BC6H_BZ,1,1}, {BC6H_BY,0,4}, {BC6H_RY,0,5},
+        {BC6H_BZ,2,1}, {BC6H_RZ,0,5}, {BC6H_BZ,3,1}, {BC6H_D,0,5}}},
+    [0x01] = {2, 1, 7, {6, 6, 6}, 24, {
+        {BC6H_GY,5,1}, {BC6H_GZ,4,1}, {BC6H_GZ,5,1}, {BC6H_RW,0,7}, {BC6H_BZ,0,1}, {BC6H_BZ,1,1}, {BC6H_BY,4,1}, {BC6H_GW,0,7},
+        {BC6H_BY,5,1}, {BC6H_BZ,2,1}, {BC6H_GY,4,1}, {BC6H_BW,0,7}, {BC6H_BZ,3,1}, {BC6H_BZ,5,1}, {BC6H_BZ,4,1}, {BC6H_RX,0,6},
+        {BC6H_GY,0,4}, {BC6H_GX,0,6}, {BC6H_GZ,0,4}, {BC6H_BX,0,6}, {BC6H_BY,0,4}, {BC6H_RY,0,6}, {BC6H_RZ,0,6}, {BC6H_D,0,5}}},
+    [0x02] = {2, 1, 11, {5, 4, 4}, 19, {
+        {BC6H_RW,0,10}, {BC6H_GW,0,10}, {BC6H_BW,0,10}, {BC6H_RX,0,5}, {BC6H_RW,10,1}, {BC6H_GY,0,4}, {BC6H_GX,0,4}, {BC6H_GW,10,1},
+        {BC6H_BZ,0,1}, {BC6H_GZ,0,4}, {BC6H_BX,0,4}, {BC6H_BW,10,1}, {BC6H_BZ,1,1}, {BC6H_BY,0,4}, {BC6H_RY,0,5}, {BC6H_BZ,2,1},
+        {BC6H_RZ,0,5}, {BC6H_BZ,3,1}, {BC6H_D,0,5}}},
+    [0x06] = {2, 1, 11, {4, 5, 4}, 21, {
+        {BC6H_RW,0,10}, {BC6H_GW,0,10}, {BC6H_BW,0,10}, {BC6H_RX,0,4}, {BC6H_RW,10,1}, {BC6H_GZ,4,1}, {BC6H_GY,0,4}, {BC6H_GX,0,5},
+        {BC6H_GW,10,1}, {BC6H_GZ,0,4}, {BC6H_BX,0,4}, {BC6H_BW,10,1}, {BC6H_BZ,1,1}, {BC6H_BY,0,4}, {BC6H_RY,0,4}, {BC6H_BZ,0,1},
+        {BC6H_BZ,2,1}, {BC6H_RZ,0,4}, {BC6H_GY,4,1}, {BC6H_BZ,3,1}, {BC6H_D,0,5}}},
+    [0x0a] = {2, 1, 11, {4, 4, 5}, 21, {
+        {BC6H_RW,0,10}, {BC6H_GW,0,10}, {BC6H_BW,0,10}, {BC6H_RX,0,4}, {BC6H_RW,10,1}, {BC6H_BY,4,1}, {BC6H_GY,0,4}, {BC6H_GX,0,4},
+        {BC6H_GW,10,1}, {BC6H_BZ,0,1}, {BC6H_GZ,0,4}, {BC6H_BX,0,5}, {BC6H_BW,10,1}, {BC6H_BY,0,4}, {BC6H_RY,0,4}, {BC6H_BZ,1,1},
+        {BC6H_BZ,2,1}, {BC6H_RZ,0,4}, {BC6H_BZ,4,1}, {BC6H_BZ,3,1}, {BC6H_D,0,5}}},
+    [0x0e] = {2, 1, 9, {5, 5, 5}, 20, {
+        {BC6H_RW,0,9}, {BC6H_BY,4,1}, {BC6H_GW,0,9}, {BC6H_GY,4,1}, {BC6H_BW,0,9}, {BC6H_BZ,4,1}, {BC6H_RX,0,5}, {BC6H_GZ,4,1},
+        {BC6H_GY,0,4}, {BC6H_GX,0,5}, {BC6H_BZ,0,1}, {BC6H_GZ,0,4}, {BC6H_BX,0,5}, {BC6H_BZ,1,1}, {BC6H_BY,0,4}, {BC6H_RY,0,5},
+        {BC6H_BZ,2,1}, {BC6H_RZ,0,5}, {BC6H_BZ,3,1}, {BC6H_D,0,5}}},
+    [0x12] = {2, 1, 8, {6, 5, 5}, 20, {
+        {BC6H_RW,0,8}, {BC6H_GZ,4,1}, {BC6H_BY,4,1}, {BC6H_GW,0,8}, {BC6H_BZ,2,1}, {BC6H_GY,4,1}, {BC6H_BW,0,8}, {BC6H_BZ,3,1},
+        {BC6H_BZ,4,1}, {BC6H_RX,0,6}, {BC6H_GY,0,4}, {BC6H_GX,0,5}, {BC6H_BZ,0,1}, {BC6H_GZ,0,4}, {BC6H_BX,0,5}, {BC6H_BZ,1,1},
+        {BC6H_BY,0,4}, {BC6H_RY,0,6}, {BC6H_RZ,0,6}, {BC6H_D,0,5}}},
+    [0x16] = {2, 1, 8, {5, 6, 5}, 22, {
+        {BC6H_RW,0,8}, {BC6H_BZ,0,1}, {BC6H_BY,4,1}, {BC6H_GW,0,8}, {BC6H_GY,5,1}, {BC6H_GY,4,1}, {BC6H_BW,0,8}, {BC6H_GZ,5,1},
+        {BC6H_BZ,4,1}, {BC6H_RX,0,5}, {BC6H_GZ,4,1}, {BC6H_GY,0,4}, {BC6H_GX,0,6}, {BC6H_GZ,0,4}, {BC6H_BX,0,5}, {BC6H_BZ,1,1},
+        {BC6H_BY,0,4}, {BC6H_RY,0,5}, {BC6H_BZ,2,1}, {BC6H_RZ,0,5}, {BC6H_BZ,3,1}, {BC6H_D,0,5}}},
+    [0x1a] = {2, 1, 8, {5, 5, 6}, 22, {
+        {BC6H_RW,0,8}, {BC6H_BZ,1,1}, {BC6H_BY,4,1}, {BC6H_GW,0,8}, {BC6H_BY,5,1}, {BC6H_GY,4,1}, {BC6H_BW,0,8}, {BC6H_BZ,5,1},
+        {BC6H_BZ,4,1}, {BC6H_RX,0,5}, {BC6H_GZ,4,1}, {BC6H_GY,0,4}, {BC6H_GX,0,5}, {BC6H_BZ,0,1}, {BC6H_GZ,0,4}, {BC6H_BX,0,6},
+        {BC6H_BY,0,4}, {BC6H_RY,0,5}, {BC6H_BZ,2,1}, {BC6H_RZ,0,5}, {BC6H_BZ,3,1}, {BC6H_D,0,5}}},
+    [0x1e] = {2, 0, 6, {6, 6, 6}, 24, {
+        {BC6H_RW,0,6}, {BC6H_GZ,4,1}, {BC6H_BZ,0,1}, {BC6H_BZ,1,1}, {BC6H_BY,4,1}, {BC6H_GW,0,6}, {BC6H_GY,5,1}, {BC6H_BY,5,1},
+        {BC6H_BZ,2,1}, {BC6H_GY,4,1}, {BC6H_BW,0,6}, {BC6H_GZ,5,1}, {BC6H_BZ,3,1}, {BC6H_BZ,5,1}, {BC6H_BZ,4,1}, {BC6H_RX,0,6},
+        {BC6H_GY,0,4}, {BC6H_GX,0,6}, {BC6H_GZ,0,4}, {BC6H_BX,0,6}, {BC6H_BY,0,4}, {BC6H_RY,0,6}, {BC6H_RZ,0,6}, {BC6H_D,0,5}}},
+    [0x03] = {1, 0, 10, {10, 10, 10}, 6, {
+        {BC6H_RW,0,10}, {BC6H_GW,0,10}, {BC6H_BW,0,10}, {BC6H_RX,0,10}, {BC6H_GX,0,10}, {BC6H_BX,0,10}}},
+    [0x07] = {1, 1, 11, {9, 9, 9}, 9, {
+        {BC6H_RW,0,10}, {BC6H_GW,0,10}, {BC6H_BW,0,10}, {BC6H_RX,0,9}, {BC6H_RW,10,1}, {BC6H_GX,0,9}, {BC6H_GW,10,1}, {BC6H_BX,0,9},
+        {BC6H_BW,10,1}}},
+    [0x0b] = {1, 1, 12, {8, 8, 8}, 12, {
+        {BC6H_RW,0,10}, {BC6H_GW,0,10}, {BC6H_BW,0,10}, {BC6H_RX,0,8}, {BC6H_RW,11,1}, {BC6H_RW,10,1}, {BC6H_GX,0,8}, {BC6H_GW,11,1},
+        {BC6H_GW,10,1}, {BC6H_BX,0,8}, {BC6H_BW,11,1}, {BC6H_BW,10,1}}},
+    [0x0f] = {1, 1, 16, {4, 4, 4}, 24, {
+        {BC6H_RW,0,10}, {BC6H_GW,0,10}, {BC6H_BW,0,10}, {BC6H_RX,0,4}, {BC6H_RW,15,1}, {BC6H_RW,14,1}, {BC6H_RW,13,1}, {BC6H_RW,12,1},
+        {BC6H_RW,11,1}, {BC6H_RW,10,1}, {BC6H_GX,0,4}, {BC6H_GW,15,1}, {BC6H_GW,14,1}, {BC6H_GW,13,1}, {BC6H_GW,12,1}, {BC6H_GW,11,1},
+        {BC6H_GW,10,1}, {BC6H_BX,0,4}, {BC6H_BW,15,1}, {BC6H_BW,14,1}, {BC6H_BW,13,1}, {BC6H_BW,12,1}, {BC6H_BW,11,1}, {BC6H_BW,10,1}}},
+};
+
+static const uint8_t bc6h_anchors[32] = {15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,2,8,2,2,8,8,15,2,8,2,2,8,8,2,2};
+
+static uint32_t bc6h_read_bits(const uint8_t* block, uint32_t* position, uint32_t count) {
+    uint32_t value = 0;
+    for (uint32_t i=0 ; i<count ; ++i){
+        value |= (uint32_t)(block[(*position) >> 3] >> ((*position) & 7) & 1) << i;
+        ++(*position);
+    }
+    return value;
+}
+
+static int32_t bc6h_sign_extend(int32_t value, uint8_t bits) {
+    int32_t sign = 1 << (bits-1);
+    value &= (1 << bits) - 1;
+    return (value ^ sign) - sign;
+}
+
+static int32_t bc6h_unquantize(int32_t value, uint8_t bits, uint32_t is_signed) {
+    if (!is_signed) {
+        if (bits >= 15 || value == 0) {
+            return value;
+        }
+        if (value == (1 << bits) - 1) {
+            return 0xFFFF;
+        }
+        return ((value << 16) + 0x8000) >> bits;
+    }
+    if (bits >= 16) {
+        return value;
+    }
+    int32_t negative = value < 0;
+    if (negative) {
+        value = -value;
+    }
+    int32_t unquantized;
+    if (value == 0) {
+        unquantized = 0;
+    } else if (value >= (1 << (bits-1)) - 1) {
+        unquantized = 0x7FFF;
+    } else {
+        unquantized = ((value << 15) + 0x4000) >> (bits-1);
+    }
+    return negative ? -unquantized : unquantized;
+}
+
+static float bc6h_half_to_float(uint16_t half) {
+    uint32_t sign = (half >> 15) & 1;
+    int32_t exponent = (half >> 10) & 31;
+    uint32_t mantissa = half & 1023;
+    float value;
+    if (exponent == 0) {
+        value = ldexpf((float)mantissa, -24);
+    } else if (exponent == 31) {
+        value = mantissa ? NAN : INFINITY;
+    } else {
+        value = ldexpf((float)(mantissa | 1024), exponent-25);
+    }
+    return sign ? -value : value;
+}
+
+static float bc6h_finish_unquantize(int32_t value, uint32_t is_signed) {
+    // Interpolated values are scaled back to the half float range, they are
+    // the bits of a half float
+    if (!is_signed) {
+        return bc6h_half_to_float((uint16_t)((value * 31) >> 6));
+    }
+    if (value < 0) {
+        return bc6h_half_to_float((uint16_t)(0x8000 | (((-value) * 31) >> 5)));
+    }
+    return bc6h_half_to_float((uint16_t)((value * 31) >> 5));
+}
+
+// Writes float32 RGBA, alpha is always 1. Blocks past the edge of images
+// smaller than 4 pixels are clipped.
+EXPORT int read_bc6h(void* v_src, void* v_dst, uint32_t width, uint32_t height, uint32_t is_signed) {
+    uint8_t* src = (uint8_t*) v_src;
+    float* dst = (float*) v_dst;
+    uint32_t texel_size = 16;
+    uint32_t texel_width = (width+3)/4;
+    uint32_t texel_height = (height+3)/4;
+    uint8_t weights_3[8] = {0, 9, 18, 27, 37, 46, 55, 64};
+    uint8_t weights_4[16] = {0, 4, 9, 13, 17, 21, 26, 30, 34, 38, 43, 47, 51, 55, 60, 64};
+#ifndef _WIN32
+    #pragma omp parallel for schedule(static)
+#endif
+    for (int texel_y=0 ; texel_y<texel_height ; ++texel_y){
+        for (int texel_x=0 ; texel_x<texel_width ; ++texel_x){
+            const uint8_t* block = &src[texel_size * ((texel_y*texel_width) + texel_x)];
+            uint32_t position = 0;
+            uint32_t mode_bits = bc6h_read_bits(block, &position, 2);
+            if (mode_bits > 1) {
+                mode_bits |= bc6h_read_bits(block, &position, 3) << 2;
+            }
+            const bc6h_mode* mode = &bc6h_modes[mode_bits];
+
+            float colors[16][3] = {{0}};
+            if (mode->region_count != 0) {
+                // fields[BC6H_D] is the partition
+                int32_t fields[13] = {0};
+                for (int i=0 ; i<mode->bits_count ; ++i){
+                    fields[mode->bits[i].field] |= bc6h_read_bits(block, &position, mode->bits[i].count) << mode->bits[i].shift;
+                }
+                int endpoint_count = mode->region_count * 2;
+                int32_t endpoints[4][3];
+                for (int c=0 ; c<3 ; ++c){
+                    endpoints[0][c] = fields[c];
+                    if (is_signed) {
+                        endpoints[0][c] = bc6h_sign_extend(endpoints[0][c], mode->endpoint_precision);
+                    }
+                    for (int e=1 ; e<endpoint_count ; ++e){
+                        int32_t value = fields[e*3 + c];
+                        if (mode->transformed) {
+                            value = bc6h_sign_extend(value, mode->delta_precision[c]);
+                            value = (fields[c] + value) & ((1 << mode->endpoint_precision) - 1);
+                        }
+                        if (is_signed) {
+                            value = bc6h_sign_extend(value, mode->endpoint_precision);
+                        }
+                        endpoints[e][c] = value;
+                    }
+                    for (int e=0 ; e<endpoint_count ; ++e){
+                        endpoints[e][c] = bc6h_unquantize(endpoints[e][c], mode->endpoint_precision, is_signed);
+                    }
+                }
+
+                uint8_t partition = fields[BC6H_D] & 31;
+                int index_bits = mode->region_count == 2 ? 3 : 4;
+                uint8_t* weights = mode->region_count == 2 ? weights_3 : weights_4;
+                for (int pixel=0 ; pixel<16 ; ++pixel){
+                    uint8_t region = mode->region_count == 2 ? partition_2_list[partition][pixel] : 0;
+                    int anchor = pixel == 0 || (mode->region_count == 2 && pixel == bc6h_anchors[partition]);
+                    uint8_t weight = weights[bc6h_read_bits(block, &position, index_bits - anchor)];
+                    for (int c=0 ; c<3 ; ++c){
+                        int32_t value = ((64-weight) * endpoints[region*2][c] + weight * endpoints[region*2+1][c] + 32) >> 6;
+                        colors[pixel][c] = bc6h_finish_unquantize(value, is_signed);
+                    }
+                }
+            }
+
+            for (int pixel_y=0 ; pixel_y<4 ; ++pixel_y){
+                for (int pixel_x=0 ; pixel_x<4 ; ++pixel_x){
+                    uint32_t x = texel_x*4+pixel_x;
+                    uint32_t y = texel_y*4+pixel_y;
+                    if (x >= width || y >= height) {
+                        continue;
+                    }
+                    dst[y*width*4 + x*4 + 0] = colors[pixel_y*4+pixel_x][0];
+                    dst[y*width*4 + x*4 + 1] = colors[pixel_y*4+pixel_x][1];
+                    dst[y*width*4 + x*4 + 2] = colors[pixel_y*4+pixel_x][2];
+                    dst[y*width*4 + x*4 + 3] = 1.0;
+                }
+            }
+        }
+    }
+    return 0;
+}
+
 EXPORT int read_r8(void* v_src, void* v_dst, uint32_t width, uint32_t height) {
     uint8_t* src = (uint8_t*) v_src;
     uint8_t* dst = (uint8_t*) v_dst;
@@ -989,3 +1223,37 @@ EXPORT int read_r8g8b8a8(void* v_src, void* v_dst, uint32_t width, uint32_t heig
     return 0;
 }
 
+
+// Blender image pixels are float32 RGBA starting from the bottom row, these
+// convert decoded images to that layout in a buffer given by the caller
+EXPORT int to_blender_pixels_rgba8(void* v_src, void* v_dst, uint32_t width, uint32_t height) {
+    uint8_t* src = (uint8_t*) v_src;
+    float* dst = (float*) v_dst;
+#ifndef _WIN32
+    #pragma omp parallel for schedule(static)
+#endif
+    for (int pixel_y=0 ; pixel_y<height ; ++pixel_y){
+        uint8_t* src_row = &src[(size_t)(height-1-pixel_y)*width*4];
+        float* dst_row = &dst[(size_t)pixel_y*width*4];
+        for (int i=0 ; i<width*4 ; ++i){
+            dst_row[i] = src_row[i] * (1.0f/255.0f);
+        }
+    }
+    return 0;
+}
+
+EXPORT int to_blender_pixels_rgba32f(void* v_src, void* v_dst, uint32_t width, uint32_t height) {
+    float* src = (float*) v_src;
+    float* dst = (float*) v_dst;
+#ifndef _WIN32
+    #pragma omp parallel for schedule(static)
+#endif
+    for (int pixel_y=0 ; pixel_y<height ; ++pixel_y){
+        float* src_row = &src[(size_t)(height-1-pixel_y)*width*4];
+        float* dst_row = &dst[(size_t)pixel_y*width*4];
+        for (int i=0 ; i<width*4 ; ++i){
+            dst_row[i] = src_row[i];
+        }
+    }
+    return 0;
+}
@@ -5,55 +5,123 @@ import os
 import logging
 logger = logging.getLogger("mhworld_import")
 
-from .tex_parser import TexParser
+from .tex_parser import TexParser, FLOAT_FORMATS, to_blender_pixels
+from .texture_cache import get_texture_cache
+from .cache_codecs import get_cache_codec, get_cache_extensions
 
-def load_tex(filepath, use_loaded=False, use_png_cache=False, overwrite_png_cache=False):
+# Choices of the "Max texture size" import setting, "0" keeps the full resolution
+MAX_TEXTURE_SIZE_ITEMS = [
+    ('0','Full','Full resolution','',0),
+    ('4096','4096','Use the first mip level at most 4096 pixels wide and high','',1),
+    ('2048','2048','Use the first mip level at most 2048 pixels wide and high','',2),
+    ('1024','1024','Use the first mip level at most 1024 pixels wide and high','',3),
+    ('512','512','Use the first mip level at most 512 pixels wide and high','',4),
+    ('256','256','Use the first mip level at most 256 pixels wide and high','',5),
+]
+
+def replace_image(old_img, img, image_name):
+    # Whatever used the old image (material nodes) now uses the new one
+    old_img.user_remap(img)
+    bpy.data.images.remove(old_img)
+    img.name = image_name
+
+def load_tex(filepath, use_loaded=False, use_png_cache=False, overwrite_png_cache=False, max_texture_size=0):
     image_name = os.path.basename(filepath)
     
+    loaded_img = None
     if use_loaded:
         if image_name in bpy.data.images:
-            return bpy.data.images[image_name]
-    
-    if use_png_cache and not overwrite_png_cache:
-        dir_name = os.path.dirname(filepath)
-        png_name = image_name + ".png"
-        if os.path.exists(os.path.join(dir_name, png_name)):
-            parser = TexParser(path=filepath)
-            if not parser.DXGI_format.startswith("VECTOR"):
-                img = bpy.data.images.load(os.path.join(dir_name, png_name))
-                if parser.DXGI_format.endswith("_SRGB"):
-                    img.colorspace_settings.name = "sRGB"
-                else:
-                    img.colorspace_settings.name = "Non-Color"
-                img.name = image_name
-                img.alpha_mode="CHANNEL_PACKED"
-                return img
+            loaded_img = bpy.data.images[image_name]
+            if loaded_img.get("mip_level", 0) == 0:
+                return loaded_img
     
+    # Only the header is read until we actually need to decode
     parser = TexParser(path=filepath)
-    img_array, could_read = parser.read()
-    #print(filepath, parser.DXGI_format)
-    if could_read:
-        if parser.DXGI_format.startswith("VECTOR"):
-            float_buffer = True
-        else:
-            float_buffer = False
-        img = bpy.data.images.new(image_name, width=img_array.shape[1], height=img_array.shape[0], alpha=True, float_buffer=float_buffer, is_data=True)
-        if use_png_cache and not parser.DXGI_format.startswith("VECTOR"):
-            dir_name = os.path.dirname(filepath)
-            png_name = image_name + ".png"
-            img.filepath = os.path.join(dir_name, png_name)
-        img.file_format = 'PNG'
-        if parser.DXGI_format.startswith("VECTOR"):
-            img.pixels = (np.flip(img_array, 0)).ravel()
-        else:
-            img.pixels = (np.flip(img_array, 0).astype(np.float16)/255).ravel()
-        if use_png_cache and not parser.DXGI_format.startswith("VECTOR"):
-            img.save()
+    header = parser.read_header()
+    mip_level = parser.select_mip_level(max_texture_size)
+    # A loaded image is kept unless it is smaller than what is asked for
+    if loaded_img is not None and loaded_img.get("mip_level", 0) <= mip_level:
+        return loaded_img
+
+    img = None
+    texture_cache = None
+    if use_png_cache:
+        texture_cache = get_texture_cache()
+    if texture_cache is not None and not overwrite_png_cache:
+        for cache_extension in get_cache_extensions(texture_cache.codec_name, header["DXGI_format"]):
+            cache_filepath = texture_cache.get(texture_cache.get_entry_filepath(filepath, header["DXGI_format"], mip_level, cache_extension))
+            if cache_filepath is None:
+                continue
+            try:
+                img = bpy.data.images.load(cache_filepath)
+                # Packed right away, the entry may be evicted later on
+                img.pack()
+                break
+            except RuntimeError as e:
+                # Evicted by another Blender in the meantime
+                logger.debug("Could not load cached texture (path=" + cache_filepath + ", exception=" + str(e) + ")")
+                if img is not None:
+                    bpy.data.images.remove(img)
+                    img = None
+
+    if img is None:
+        img_array, could_read = parser.read(mip_level)
+        #print(filepath, parser.DXGI_format)
+        if not could_read:
+            raise RuntimeError("Texture data format not supported (format=" + parser.DXGI_format + ")")
+        width, height = img_array.shape[1], img_array.shape[0]
+        pixels = to_blender_pixels(img_array)
+        # Only the Blender layout copy is kept from now on
+        del img_array
+        if texture_cache is not None:
+            codec = get_cache_codec(texture_cache.codec_name, parser.DXGI_format)
+            cache_filepath = texture_cache.get_entry_filepath(filepath, parser.DXGI_format, mip_level, codec.extension)
+            temp_filepath = texture_cache.get_temp_filepath(cache_filepath)
+            img = codec.write(temp_filepath, pixels, width, height, image_name)
+            del pixels
+            texture_cache.put(temp_filepath, cache_filepath)
+            if img is None:
+                img = bpy.data.images.load(cache_filepath)
+            else:
+                img.filepath_raw = cache_filepath
+            # The cache is not durable, a saved .blend must not depend on it
+            img.pack()
         else:
+            float_buffer = parser.DXGI_format in FLOAT_FORMATS
+            img = bpy.data.images.new(image_name, width=width, height=height, alpha=True, float_buffer=float_buffer, is_data=True)
+            img.pixels.foreach_set(pixels)
+            del pixels
             img.pack()
-        if parser.DXGI_format.endswith("_SRGB"):
-            img.colorspace_settings.name = "sRGB"
-        img.alpha_mode="CHANNEL_PACKED"
-        return img
+
+    if header["DXGI_format"].endswith("_SRGB"):
+        img.colorspace_settings.name = "sRGB"
     else:
-        raise RuntimeError("Texture data format not supported (format=" + parser.DXGI_format + ")")
+        img.colorspace_settings.name = "Non-Color"
+    img.name = image_name
+    img.alpha_mode="CHANNEL_PACKED"
+
+    # Kept to upgrade reduced textures later on
+    img["tex_filepath"] = filepath
+    img["mip_level"] = mip_level
+    if loaded_img is not None:
+        replace_image(loaded_img, img, image_name)
+    return img
+
+def upgrade_textures(use_png_cache=False, overwrite_png_cache=False):
+    # Reloads at full resolution every texture imported with a size limit
+    reduced_images = [img for img in bpy.data.images if img.get("mip_level", 0) > 0 and "tex_filepath" in img.keys()]
+    upgraded_count = 0
+    for img in reduced_images:
+        filepath = img["tex_filepath"]
+        if img.name != os.path.basename(filepath):
+            # Only images keeping their original name are found by load_tex
+            continue
+        if not os.path.isfile(filepath):
+            logger.warning("Could not upgrade texture, file does not exists (path=" + filepath + ")")
+            continue
+        try:
+            load_tex(filepath, use_loaded=True, use_png_cache=use_png_cache, overwrite_png_cache=overwrite_png_cache, max_texture_size=0)
+            upgraded_count += 1
+        except Exception as e:
+            logger.warning("Could not upgrade texture, exception during parsing (path=" + filepath + ", exception=" + str(e) + ")")
+    return upgraded_count
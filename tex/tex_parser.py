@@ -1,4 +1,3 @@
-import struct
 import codecs
 import numpy as np
 import ctypes
@@ -8,6 +7,8 @@ import sys
 import logging
 logger = logging.getLogger("mhworld_import")
 
+from ..common.reader import Reader, read_file, closes_reader
+
 shared_library_path = None
 shared_library_filename = "read_dxgi_format.so"
 if sys.platform == "linux" or sys.platform == "linux2":
@@ -46,6 +47,20 @@ lib.read_r8g8.restype = ctypes.c_int
 lib.read_r8g8b8a8.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint]
 lib.read_r8g8b8a8.restype = ctypes.c_int
 
+# Libraries built before BC6H support don't export it, BC6H textures are then
+# reported as unsupported instead of failing to load the addon
+if hasattr(lib, "read_bc6h"):
+    lib.read_bc6h.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint, ctypes.c_uint]
+    lib.read_bc6h.restype = ctypes.c_int
+
+if hasattr(lib, "to_blender_pixels_rgba8"):
+    lib.to_blender_pixels_rgba8.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint]
+    lib.to_blender_pixels_rgba8.restype = ctypes.c_int
+    lib.to_blender_pixels_rgba32f.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint]
+    lib.to_blender_pixels_rgba32f.restype = ctypes.c_int
+
+# Formats decoded to float32 instead of uint8
+FLOAT_FORMATS = ["VECTOR_F32", "VECTOR_F16", "BC6H_UF16", "BC6H_SF16"]
 
 DXGI_FORMAT = {
     1:"VECTOR_F32",
@@ -63,6 +78,23 @@ DXGI_FORMAT = {
     30:"BC7_UNORM", 
     31:"BC7_UNORM_SRGB"
 }
+# (block width/height in pixels, bytes per block)
+DXGI_BLOCK_INFO = {
+    "VECTOR_F32":(1, 16),
+    "VECTOR_F16":(1, 8),
+    "R8G8B8A8_UNORM":(1, 4),
+    "R8G8B8A8_UNORM_SRGB":(1, 4),
+    "BC1_UNORM":(4, 8),
+    "BC1_UNORM_SRGB":(4, 8),
+    "BC4_UNORM":(4, 8),
+    "BC4_UNORM_SRGB":(4, 8),
+    "BC5_UNORM":(4, 16),
+    "BC5_UNORM_SRGB":(4, 16),
+    "BC6H_UF16":(4, 16),
+    "BC6H_SF16":(4, 16),
+    "BC7_UNORM":(4, 16),
+    "BC7_UNORM_SRGB":(4, 16)
+}
 #DXT1 23
 #DXT3 24
 #DXT5 25
@@ -202,77 +234,36 @@ DXGI_FORMAT = {
     #0xffffffff:  "FORCE_UINT"
 #}
 
-class Reader():
-    def __init__(self, data):
-        self.offset = 0
-        self.data = data
-    
-    def read(self, kind, size):
-        result = struct.unpack(kind, self.data[self.offset:self.offset+size])[0]
-        self.offset += size
-        return result
-
-    def seek(self, offset, start = None):
-        if start is None:
-            self.offset = offset
-        else:
-            self.offset += offset
-
-    def readUInt(self):
-        return self.read("I", 4)
-    
-    def readInt(self):
-        return self.read("i", 4)
-        
-    def readUInt64(self):
-        return self.read("Q", 8)
-    
-    def readHalf(self):
-        return self.read("e", 2)
-
-    def readFloat(self):
-        return self.read("f", 4)
-
-    def readShort(self):
-        return self.read("h", 2)
-    
-    def readUShort(self):
-        return self.read("H", 2)
-
-    def readByte(self):
-        return self.read("b", 1)
-    
-    def readBytes(self, size):
-        return self.data[self.offset:self.offset + size]
-    
-    def readUByte(self):
-        return self.read("B", 1)
-
-    def readString(self):
-        text = ""
-        while True:
-            char = self.readUByte()
-            if char == 0:
-                break
-            else:
-                text += chr(char)
-        return text
-
-    def allign(self, size):
-        self.offset = (int((self.offset)/size)*size)+size
-        
-    def tell(self):
-        return self.offset
-    
-    def getSize(self):
-        return len(self.data)
+def to_blender_pixels(img_array):
+    # Decoded (height, width, 4) image to the flat float32 buffer Blender
+    # images use (bottom row first, values in 0-1), written in a single pass
+    mipHeight, mipWidth = img_array.shape[0], img_array.shape[1]
+    pixels = np.empty(mipHeight*mipWidth*4, dtype=np.float32)
+    if img_array.dtype == np.uint8 and hasattr(lib, "to_blender_pixels_rgba8"):
+        lib.to_blender_pixels_rgba8(
+            np.ascontiguousarray(img_array).ctypes.data_as(ctypes.c_void_p),
+            pixels.ctypes.data_as(ctypes.c_void_p),
+            mipWidth,
+            mipHeight
+        )
+    elif img_array.dtype == np.float32 and hasattr(lib, "to_blender_pixels_rgba32f"):
+        lib.to_blender_pixels_rgba32f(
+            np.ascontiguousarray(img_array).ctypes.data_as(ctypes.c_void_p),
+            pixels.ctypes.data_as(ctypes.c_void_p),
+            mipWidth,
+            mipHeight
+        )
+    elif img_array.dtype == np.uint8:
+        np.multiply(np.flip(img_array, 0), np.float32(1.0/255.0), out=pixels.reshape(img_array.shape))
+    else:
+        np.copyto(pixels.reshape(img_array.shape), np.flip(img_array, 0), casting="unsafe")
+    return pixels
 
 class TexParser():
-    def __init__(self, path=None, data=None):
+    def __init__(self, path=None, data=None, use_mmap=True):
         self.path = path
         if data is None:
-            with open(path, "rb") as file_in:
-                data = file_in.read()
+            data = read_file(path, use_mmap=use_mmap)
         self.bs = Reader(data)
         magic = self.bs.readUInt()
         if magic != 5784916:
@@ -393,6 +384,17 @@ class TexParser():
         )
         return img_array
 
+    def read_BC6H(self, texData, mipWidth, mipHeight, format):
+        img_array = np.empty([mipHeight, mipWidth, 4], dtype=np.float32)
+        ret = lib.read_bc6h(
+            np.frombuffer(texData, np.uint8).ctypes.data_as(ctypes.c_void_p),
+            img_array.ctypes.data_as(ctypes.c_void_p),
+            mipWidth,
+            mipHeight,
+            1 if DXGI_FORMAT[format] == "BC6H_SF16" else 0
+        )
+        return img_array
+
     def read_R8(self, texData, mipWidth, mipHeight, format):
         img_array = np.empty([mipHeight, mipWidth, 4], dtype=np.uint8)
         ret = lib.read_r8(
@@ -424,21 +426,52 @@ class TexParser():
         return img_array
 
     def read_F32F32F32F32(self, texData, mipWidth, mipHeight, format):
-        img_array = np.frombuffer(texData, dtype=np.float32)
+        img_array = np.frombuffer(texData, dtype=np.float32).copy()
         return img_array.reshape([mipHeight, mipWidth, 4])
 
     def read_F16F16F16F16(self, texData, mipWidth, mipHeight, format):
-        img_array = np.frombuffer(texData, dtype=np.float16)
+        img_array = np.frombuffer(texData, dtype=np.float16).copy()
         return img_array.reshape([mipHeight, mipWidth, 4])
     
+    def read_header(self):
+        # The header is already decoded at init, nothing past it is touched
+        return {
+            "width":self.width,
+            "height":self.height,
+            "format":self.format,
+            "DXGI_format":self.DXGI_format,
+            "mip_count":self.mipCount,
+        }
+
+    def select_mip_level(self, max_size=0):
+        # First mip whose largest side is at most max_size (0 means no limit),
+        # the smallest one if none is small enough
+        if max_size <= 0:
+            return 0
+        for mipLevel in range(self.mipCount):
+            if max(self.width//(2**mipLevel), self.height//(2**mipLevel)) <= max_size:
+                return mipLevel
+        return max(0, self.mipCount-1)
+
+    def get_mip_size(self, mipLevel=0):
+        mipWidth = max(1, self.width//(2**mipLevel))
+        mipHeight = max(1, self.height//(2**mipLevel))
+        block_dim, block_bytes = DXGI_BLOCK_INFO[self.DXGI_format]
+        block_count = ((mipWidth+block_dim-1)//block_dim) * ((mipHeight+block_dim-1)//block_dim)
+        return block_count * block_bytes
+
+    @closes_reader
     def read(self, mipLevel=0):
         img_array = np.ones([4, 4, 4], dtype=np.uint8)*255
         could_read = False
-        mipWidth = self.width//(2**mipLevel)
-        mipHeight = self.height//(2**mipLevel)
+        mipWidth = max(1, self.width//(2**mipLevel))
+        mipHeight = max(1, self.height//(2**mipLevel))
         self.bs.seek(self.mipOffsets[mipLevel])
 
-        texData = self.bs.data[self.bs.offset:]
+        # Only the mip we decode is touched, which with a mapped file means
+        # only its pages are read from disk
+        mip_size = min(self.get_mip_size(mipLevel), self.bs.getSize() - self.bs.tell())
+        texData = self.bs.readBytes(mip_size)
         could_read = True
 
         if DXGI_FORMAT[self.format] in ["BC1_TYPELESS", "BC1_UNORM", "BC1_UNORM_SRGB"]:
@@ -449,8 +482,8 @@ class TexParser():
             img_array = self.read_BC4(texData, mipWidth, mipHeight, self.format)
         elif DXGI_FORMAT[self.format] in ["BC5_TYPELESS", "BC5_UNORM", "BC5_SNORM"]:
             img_array = self.read_BC5(texData, mipWidth, mipHeight, self.format)
-        #elif DXGI_FORMAT[format] in ["BC6H_TYPELESS", "BC6H_UF16", "BC6H_SF16"]:
-            # fuck that, bc7 was hard enough
+        elif DXGI_FORMAT[self.format] in ["BC6H_TYPELESS", "BC6H_UF16", "BC6H_SF16"] and hasattr(lib, "read_bc6h"):
+            img_array = self.read_BC6H(texData, mipWidth, mipHeight, self.format)
         elif DXGI_FORMAT[self.format] in ["BC7_TYPELESS", "BC7_UNORM", "BC7_UNORM_SRGB"]:
             img_array = self.read_BC7(texData, mipWidth, mipHeight, self.format)
         elif DXGI_FORMAT[self.format] in ["R8_SINT", "R8_UNORM", "R8_SNORM", "R8_TYPELESS"]:
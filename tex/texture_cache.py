@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import hashlib
+import logging
+logger = logging.getLogger("mhworld_import")
+
+from ..common.asset_index import get_default_cache_dir
+
+TEXTURE_CACHE_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+LOCK_FILENAME = "manifest.lock"
+# A lock older than that was left by a crashed Blender
+LOCK_STALE_SECONDS = 60
+LOCK_TIMEOUT_SECONDS = 10
+
+class TextureCache():
+    # Decoded textures, shared by every import and every Blender install
+    # pointing to the same cache directory. Entries are named after the
+    # content hash of the .tex file, its format and the mip level, so the same
+    # texture extracted in two places is decoded once. The manifest records
+    # the size and last access time of each entry, and which content hash a
+    # .tex file (path, size, mtime) had. It is only rewritten under the lock
+    # file, merged with what other installs wrote in the meantime, and least
+    # recently used entries are deleted once max_bytes is exceeded. Nothing
+    # in it is durable: the loaders pack the images they load from it.
+    def __init__(self, cache_dir=None, max_bytes=4096*1024*1024, codec_name="TGA"):
+        if not cache_dir:
+            cache_dir = get_default_cache_dir()
+        self.directory = os.path.join(cache_dir, "textures")
+        self.max_bytes = max_bytes
+        # Key of CACHE_CODECS new entries are written with
+        self.codec_name = codec_name
+        self.sources = {}
+        # Not yet in the manifest, written by flush
+        self.accessed = {}
+        self.new_sources = {}
+
+    def get_source_key(self, filepath):
+        stat = os.stat(filepath)
+        return os.path.normcase(os.path.abspath(filepath)) + "|" + str(stat.st_size) + "|" + str(stat.st_mtime_ns)
+
+    def get_content_hash(self, filepath):
+        source_key = self.get_source_key(filepath)
+        content_hash = self.sources.get(source_key)
+        if content_hash is None:
+            file_hash = hashlib.blake2b(digest_size=16)
+            with open(filepath, "rb") as tex_file:
+                for chunk in iter(lambda: tex_file.read(1024*1024), b""):
+                    file_hash.update(chunk)
+            content_hash = file_hash.hexdigest()
+            self.sources[source_key] = content_hash
+            self.new_sources[source_key] = content_hash
+        return content_hash
+
+    def get_entry_filepath(self, filepath, DXGI_format, mip_level, extension):
+        entry_name = self.get_content_hash(filepath) + "_" + DXGI_format + "_mip" + str(mip_level) + extension
+        return os.path.join(self.directory, entry_name)
+
+    def get(self, entry_filepath):
+        # Path of the cached file, None if it is not cached
+        if not os.path.isfile(entry_filepath):
+            return None
+        self.accessed[os.path.basename(entry_filepath)] = time.time()
+        return entry_filepath
+
+    def get_temp_filepath(self, entry_filepath):
+        # Files are written under a name of their own then moved in place, so
+        # that nobody reads a half written entry
+        os.makedirs(self.directory, exist_ok=True)
+        root, extension = os.path.splitext(entry_filepath)
+        return root + "." + str(os.getpid()) + ".tmp" + extension
+
+    def put(self, temp_filepath, entry_filepath):
+        os.replace(temp_filepath, entry_filepath)
+        self.accessed[os.path.basename(entry_filepath)] = time.time()
+
+    def acquire_lock(self):
+        lock_filepath = os.path.join(self.directory, LOCK_FILENAME)
+        start = time.time()
+        while True:
+            try:
+                os.close(os.open(lock_filepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(lock_filepath).st_mtime > LOCK_STALE_SECONDS:
+                        os.remove(lock_filepath)
+                        continue
+                except OSError:
+                    continue
+            if time.time() - start > LOCK_TIMEOUT_SECONDS:
+                return False
+            time.sleep(0.05)
+
+    def release_lock(self):
+        try:
+            os.remove(os.path.join(self.directory, LOCK_FILENAME))
+        except OSError:
+            pass
+
+    def read_manifest(self):
+        manifest_filepath = os.path.join(self.directory, MANIFEST_FILENAME)
+        if os.path.isfile(manifest_filepath):
+            try:
+                with open(manifest_filepath, "r") as manifest_file:
+                    manifest = json.load(manifest_file)
+                if manifest.get("version") == TEXTURE_CACHE_VERSION:
+                    return manifest
+            except Exception as e:
+                logger.warning("Could not read the texture cache manifest, rebuilding it (path=" + manifest_filepath + ", exception=" + str(e) + ")")
+        return {"version":TEXTURE_CACHE_VERSION, "entries":{}, "sources":{}}
+
+    def write_manifest(self, manifest):
+        manifest_filepath = os.path.join(self.directory, MANIFEST_FILENAME)
+        temp_filepath = manifest_filepath + "." + str(os.getpid()) + ".tmp"
+        with open(temp_filepath, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(temp_filepath, manifest_filepath)
+
+    def flush(self):
+        # Merges the accesses of this session into the manifest and evicts
+        # down to max_bytes. Called by the operators once an import is done.
+        if not os.path.isdir(self.directory):
+            return
+        if not self.acquire_lock():
+            logger.warning("Could not lock the texture cache, its manifest is left as is (path=" + self.directory + ")")
+            return
+        try:
+            manifest = self.read_manifest()
+            old_entries = manifest["entries"]
+            # The directory is the truth, files written by a Blender that
+            # crashed before flushing are picked up here
+            entries = {}
+            for entry in os.scandir(self.directory):
+                if entry.name in (MANIFEST_FILENAME, LOCK_FILENAME) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if ".tmp" in entry.name:
+                    # Left by a crash while writing
+                    if time.time() - stat.st_mtime > LOCK_STALE_SECONDS:
+                        os.remove(entry.path)
+                    continue
+                last_access = old_entries.get(entry.name, {}).get("last_access", stat.st_mtime)
+                last_access = max(last_access, self.accessed.get(entry.name, 0))
+                entries[entry.name] = {"size":stat.st_size, "last_access":last_access}
+
+            total_bytes = sum(entry["size"] for entry in entries.values())
+            evicted_count = 0
+            for entry_name in sorted(entries.keys(), key=lambda name: entries[name]["last_access"]):
+                if total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, entry_name))
+                except OSError as e:
+                    logger.warning("Could not evict texture cache entry (path=" + entry_name + ", exception=" + str(e) + ")")
+                    continue
+                total_bytes -= entries.pop(entry_name)["size"]
+                evicted_count += 1
+
+            # Sources whose entries are all gone are forgotten
+            sources = manifest["sources"]
+            sources.update(self.new_sources)
+            content_hashes = set(entry_name.split("_", 1)[0] for entry_name in entries.keys())
+            manifest["sources"] = {key:content_hash for key, content_hash in sources.items() if content_hash in content_hashes}
+            manifest["entries"] = entries
+            self.write_manifest(manifest)
+            self.sources.update(manifest["sources"])
+            self.accessed = {}
+            self.new_sources = {}
+            logger.info("Texture cache: " + str(len(entries)) + " entries, " + str(total_bytes//(1024*1024)) + "/" + str(self.max_bytes//(1024*1024)) + " MB, " + str(evicted_count) + " evicted")
+        except OSError as e:
+            logger.warning("Could not update the texture cache manifest (path=" + self.directory + ", exception=" + str(e) + ")")
+        finally:
+            self.release_lock()
+
+    def load_sources(self):
+        # Content hashes known by the manifest, so that cached textures are
+        # found without hashing their .tex again
+        self.sources.update(self.read_manifest()["sources"])
+
+# One cache shared by every import of the session
+texture_cache = None
+
+def get_texture_cache(cache_dir=None, max_bytes=None, codec_name=None):
+    # Operators call it with the preferences before loading, loaders get
+    # whatever was set last
+    global texture_cache
+    if texture_cache is None:
+        texture_cache = TextureCache(cache_dir)
+        texture_cache.load_sources()
+    elif cache_dir is not None:
+        directory = os.path.join(cache_dir if cache_dir else get_default_cache_dir(), "textures")
+        if directory != texture_cache.directory:
+            texture_cache.flush()
+            texture_cache = TextureCache(cache_dir)
+            texture_cache.load_sources()
+    if max_bytes is not None:
+        texture_cache.max_bytes = max_bytes
+    if codec_name is not None:
+        texture_cache.codec_name = codec_name
+    return texture_cache
@@ -8,7 +8,8 @@ import os
 import logging
 logger = logging.getLogger("mhworld_import")
 
-from .tex_loader import load_tex
+from .tex_loader import load_tex, upgrade_textures, MAX_TEXTURE_SIZE_ITEMS
+from .texture_cache import get_texture_cache
 
 def SetLoggingLevel(level):
     if level == "DEBUG":
@@ -60,6 +61,7 @@ class IMPORT_PT_TexSettingPanel_2(Panel):
         row = layout.row()
         row.enabled = operator.use_png_cache
         row.prop(operator, 'overwrite_png_cache')
+        layout.prop(operator, 'max_texture_size')
 
 
 class ImportTex(bpy.types.Operator, ImportHelper):
@@ -71,8 +73,14 @@ class ImportTex(bpy.types.Operator, ImportHelper):
     
     files: bpy.props.CollectionProperty(type=bpy.types.PropertyGroup)
     filter_glob: bpy.props.StringProperty(default="*.tex")
-    use_png_cache: bpy.props.BoolProperty(name="Use PNG cache", description="Save a copy of imported .tex in a .png file next to it (subsequent imports will be much faster)", default=False)
-    overwrite_png_cache: bpy.props.BoolProperty(name="Overwrite PNG cache", description="Overwrite cached .png", default=False)
+    use_png_cache: bpy.props.BoolProperty(name="Use texture cache", description="Save a copy of imported .tex in the texture cache directory set in the addon preferences (subsequent imports will be much faster)", default=False)
+    overwrite_png_cache: bpy.props.BoolProperty(name="Overwrite texture cache", description="Overwrite the cached copies of imported .tex", default=False)
+    max_texture_size: bpy.props.EnumProperty(
+        name="Max texture size",
+        description="Import textures at a reduced resolution (their mip levels are used). They can be reloaded at full resolution later",
+        items = MAX_TEXTURE_SIZE_ITEMS,
+        default = '0'
+    )
     
     def draw(self, context):
         pass
@@ -84,14 +92,33 @@ class ImportTex(bpy.types.Operator, ImportHelper):
         mod = candidate_modules[0]
         addon_prefs = context.preferences.addons[mod.__name__].preferences
         SetLoggingLevel(addon_prefs.logging_level)
+        texture_cache = get_texture_cache(addon_prefs.cache_dir, addon_prefs.texture_cache_size*1024*1024, addon_prefs.texture_cache_codec)
         
         folder = (os.path.dirname(self.filepath))
         filepaths = [os.path.join(folder, x.name) for x in self.files]
         for filepath in filepaths:
             self.import_tex(filepath)
+        texture_cache.flush()
         return {"FINISHED"}
     
     def import_tex(self, filepath):
-        load_tex(filepath, use_loaded=False, use_png_cache=self.use_png_cache, overwrite_png_cache=self.overwrite_png_cache)
+        load_tex(filepath, use_loaded=False, use_png_cache=self.use_png_cache, overwrite_png_cache=self.overwrite_png_cache, max_texture_size=int(self.max_texture_size))
 
         
+
+class UpgradeTextures(bpy.types.Operator):
+    """Reload at full resolution the textures imported with a max texture size"""
+    bl_idname = "mhworld_import.mhworld_upgrade_textures"
+    bl_label = 'Upgrade MHWorld textures to full resolution'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    use_png_cache: bpy.props.BoolProperty(name="Use texture cache", description="Save a copy of imported .tex in the texture cache directory set in the addon preferences (subsequent imports will be much faster)", default=True)
+
+    def execute(self, context):
+        candidate_modules = [mod for mod in addon_utils.modules() if mod.bl_info["name"] == "MHWorld tool suite"]
+        addon_prefs = context.preferences.addons[candidate_modules[0].__name__].preferences
+        texture_cache = get_texture_cache(addon_prefs.cache_dir, addon_prefs.texture_cache_size*1024*1024, addon_prefs.texture_cache_codec)
+        upgraded_count = upgrade_textures(use_png_cache=self.use_png_cache)
+        texture_cache.flush()
+        self.report({"INFO"}, str(upgraded_count) + " textures reloaded at full resolution")
+        return {"FINISHED"}